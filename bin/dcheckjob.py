@@ -36,14 +36,17 @@ from vsc.administration.user import cluster_user_pickle_location_map, cluster_us
 from vsc.accountpage.client import AccountpageClient
 from vsc.config.base import VscStorage
 from vsc.filesystem.gpfs import GpfsOperations
+from vsc.jobs.moab.accountpage import AccountpageResolver, CACHE_TTL
 from vsc.jobs.moab.checkjob import SshCheckjob, CheckjobInfo
+from vsc.jobs.moab.fileset import FilesetWriter, encode_payload, per_thread, write_on_gpfs
+from vsc.jobs.moab.session import get_session_pool
 from vsc.utils import fancylogger
-from vsc.utils.fs_store import store_on_gpfs
 from vsc.utils.nagios import NAGIOS_EXIT_CRITICAL
 from vsc.utils.script_tools import ExtendedSimpleOption
 
 # Constants
 NAGIOS_CHECK_INTERVAL_THRESHOLD = 30 * 60  # 30 minutes
+ACCOUNTPAGE_CACHE_FILE = '/var/cache/dcheckjob_accountpage.json.gz'
 
 logger = fancylogger.getLogger(__name__)
 fancylogger.logToScreen(True)
@@ -83,14 +86,24 @@ def main():
         'account_page_url': ('', None, 'store', None),
         'target_master': ('the master used to execute showq commands', None, 'store', None),
         'target_user': ('the user for ssh to the target master', None, 'store', None),
+        'workers': ('the number of hosts/clusters contacted at the same time', int, 'store', 1),
+        'deadline': ('the number of seconds after which a host/cluster is considered failed', int, 'store', None),
+        'multiplex': ('reuse a single ssh connection to the target master for all hosts/clusters', None, 'store_true', False),
+        'writers': ('the number of user files written at the same time', int, 'store', 1),
+        'accountpage_cache': ('the file caching the account page information', None, 'store', ACCOUNTPAGE_CACHE_FILE),
+        'accountpage_ttl': ('the number of seconds the cached account page information is used', int, 'store',
+                            CACHE_TTL),
     }
 
     opts = ExtendedSimpleOption(options)
 
     try:
         rest_client = AccountpageClient(token=opts.options.access_token)
+        resolver = AccountpageResolver(rest_client, cache_file=opts.options.accountpage_cache,
+                                       ttl=opts.options.accountpage_ttl)
 
-        gpfs = GpfsOperations()
+        # one instance per writer thread, the gpfs operations are not thread-safe
+        gpfs = per_thread(GpfsOperations)
         storage = VscStorage()
         storage_name = cluster_user_pickle_store_map[opts.options.location]
         login_mount_point = storage[storage_name].login_mount_point
@@ -105,37 +118,51 @@ def main():
                 'path': checkjob_path
             }
 
-        checkjob = SshCheckjob(
-            opts.options.target_master,
-            opts.options.target_user,
-            clusters,
-            cache_pickle=True,
-            dry_run=opts.options.dry_run)
-
-        (job_information, _, _) = checkjob.get_moab_command_information()
+        pool = None
+        if opts.options.multiplex:
+            pool = get_session_pool()
+
+        try:
+            checkjob = SshCheckjob(
+                opts.options.target_master,
+                opts.options.target_user,
+                clusters,
+                cache_pickle=True,
+                dry_run=opts.options.dry_run,
+                pool=pool)
+
+            (job_information, _, _) = checkjob.get_moab_command_information(workers=opts.options.workers,
+                                                                            deadline=opts.options.deadline)
+        finally:
+            if pool is not None:
+                pool.close()
 
         active_users = job_information.keys()
 
         logger.debug("Active users: %s" % (active_users))
         logger.debug("Checkjob information: %s" % (job_information))
 
-        nagios_user_count = 0
-        nagios_no_store = 0
-
         stats = {}
 
-        for user in active_users:
-            path = get_pickle_path(opts.options.location, user, rest_client)
-            try:
-                user_queue_information = CheckjobInfo({user: job_information[user]})
-                store_on_gpfs(user, path, "checkjob", user_queue_information, gpfs, login_mount_point,
-                              gpfs_mount_point, ".checkjob.json.gz", opts.options.dry_run)
-                nagios_user_count += 1
-            except Exception:
-                logger.exception("Could not store cache file for user %s" % (user))
-                nagios_no_store += 1
-        stats["store_users"] = nagios_user_count
-        stats["store_fail"] = nagios_no_store
+        resolver.prefetch_pickle_paths(opts.options.location, active_users, get_pickle_path)
+
+        def store(user):
+            path = resolver.pickle_path(opts.options.location, user, get_pickle_path)
+            user_queue_information = CheckjobInfo({user: job_information[user]})
+            # same file as store_on_gpfs, but safe to use from several writers
+            write_on_gpfs(user, path, encode_payload("checkjob", user_queue_information), gpfs(), login_mount_point,
+                          gpfs_mount_point, ".checkjob.json.gz", opts.options.dry_run)
+
+        writer = FilesetWriter(workers=opts.options.writers)
+        (results, failed) = writer.run(active_users, store)
+
+        if not opts.options.dry_run:
+            resolver.close()
+
+        stats["store_users"] = len(results)
+        stats["store_fail"] = len(failed)
+        stats["accountpage_requests"] = resolver.requests
+        stats.update(writer.latency_stats())
         stats["store_fail_critical"] = STORE_LIMIT_CRITICAL
     except Exception, err:
         logger.exception("critical exception caught: %s" % (err))
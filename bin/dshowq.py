@@ -43,9 +43,12 @@ from vsc.administration.user import cluster_user_pickle_store_map, cluster_user_
 from vsc.accountpage.client import AccountpageClient
 from vsc.config.base import VscStorage
 from vsc.filesystem.gpfs import GpfsOperations
+from vsc.jobs.moab.accountpage import AccountpageResolver, CACHE_TTL
+from vsc.jobs.moab.fileset import DigestStore, FilesetWriter, PayloadEncoder, per_thread, touch_on_gpfs
+from vsc.jobs.moab.fileset import write_on_gpfs
 from vsc.jobs.moab.showq import SshShowq
+from vsc.jobs.moab.session import get_session_pool
 from vsc.utils import fancylogger
-from vsc.utils.fs_store import store_on_gpfs
 from vsc.utils.nagios import NAGIOS_EXIT_CRITICAL
 from vsc.utils.script_tools import ExtendedSimpleOption
 
@@ -55,25 +58,27 @@ NAGIOS_CHECK_INTERVAL_THRESHOLD = 15 * 60  # 15 minutes
 DEFAULT_VO = 'gvo00012'
 
 STORE_LIMIT_CRITICAL = 5
-INACTIVE = 'inactive'
+DIGEST_CACHE_FILE = '/var/cache/dshowq_digests.json.gz'
+ACCOUNTPAGE_CACHE_FILE = '/var/cache/dshowq_accountpage.json.gz'
 
 logger = fancylogger.getLogger(__name__)
 fancylogger.logToScreen(True)
 fancylogger.setLogLevelInfo()
 
 
-def collect_vo_account_page(active_users, rest_client):
+def collect_vo_account_page(active_users, resolver):
     """
     Determines a mapping between each active user and the fellow members of his VO.
 
     If the user belongs to a non-default VO, then the map will have a value that is a dict
     of all other active users from the VO. Otherwise, it will have a singleton value. For
     compatibility purposes, the values map user names to an empty string (previously to gecos).
+
+    @param resolver: AccountpageResolver instance
     """
 
-    all_vos = rest_client.vo.get()
-    vo_information = [rest_client.vo[vo[0]].get() for vo in all_vos if vo[1] not in (INACTIVE,)]
-    user_to_vo_map = dict((u, vo) for vo in vo_information for u in vo['members'])
+    user_to_vo_map = resolver.user_vo_map()
+    active_users = set(active_users)
 
     user_maps_per_vo = {}
     found = set()
@@ -82,24 +87,27 @@ def collect_vo_account_page(active_users, rest_client):
         if user in found:
             continue
 
-        vo = user_to_vo_map.get(user, None)
-        if vo:
-            if vo['vsc_id'] in (DEFAULT_VO,):
-                logger.debug('user %s belongs to the default VO %s', user, vo['vsc_id'])
+        vo_id = user_to_vo_map.get(user, None)
+        if vo_id:
+            if vo_id in (DEFAULT_VO,):
+                logger.debug('user %s belongs to the default VO %s', user, vo_id)
                 found.add(user)
                 user_maps_per_vo[user] = {user: ""}
             else:
-                user_map = dict((u, "") for u in vo['members'] if u in active_users)
+                user_map = dict((u, "") for u in resolver.vo_members(vo_id) if u in active_users)
                 for u in user_map:
                     found.add(u)
 
-                user_maps_per_vo[vo['vsc_id']] = user_map
+                user_maps_per_vo[vo_id] = user_map
 
     return (found, user_maps_per_vo)
 
 
-def determine_target_information(information, active_users, queue_information, rest_client):
-    """Determine for the given information type, what should be stored for which users."""
+def determine_target_information(information, active_users, queue_information, resolver):
+    """Determine for the given information type, what should be stored for which users.
+
+    @param resolver: AccountpageResolver instance
+    """
 
     logger.debug("Determining target information for %s" % (information,))
 
@@ -107,14 +115,17 @@ def determine_target_information(information, active_users, queue_information, r
         user_info = dict([(u, {u: ""}) for u in active_users])  # FIXME: faking it
         return (active_users, dict([(user, {user: queue_information[user]}) for user in active_users]), user_info)
     elif information == 'vo':
-        (all_target_users, user_maps_per_vo) = collect_vo_account_page(active_users, rest_client)
+        (all_target_users, user_maps_per_vo) = collect_vo_account_page(active_users, resolver)
 
+        # all users of a VO share the same information (and user map) instances
         target_queue_information = {}
+        target_user_maps = {}
         for vo in user_maps_per_vo.values():
             filtered_queue_information = dict([(user_id, queue_information[user_id]) for user_id in vo if user_id in queue_information])
             target_queue_information.update(dict([(user_id, filtered_queue_information) for user_id in vo]))
+            target_user_maps.update(dict([(user_id, vo) for user_id in vo]))
 
-        return (all_target_users, target_queue_information, user_maps_per_vo)
+        return (all_target_users, target_queue_information, target_user_maps)
     elif information == 'project':
         return (None, None, None)
 
@@ -149,14 +160,26 @@ def main():
         'access_token': ('the token that will allow authentication against the account page', None, 'store', None),
         'target_master': ('the master used to execute showq commands', None, 'store', None),
         'target_user': ('the user for ssh to the target master', None, 'store', None),
+        'workers': ('the number of hosts/clusters contacted at the same time', int, 'store', 1),
+        'deadline': ('the number of seconds after which a host/cluster is considered failed', int, 'store', None),
+        'multiplex': ('reuse a single ssh connection to the target master for all hosts/clusters', None, 'store_true', False),
+        'digest_cache': ('the file with the digests of the stored information, to skip rewriting unchanged information',
+                         None, 'store', DIGEST_CACHE_FILE),
+        'writers': ('the number of user files written at the same time', int, 'store', 1),
+        'accountpage_cache': ('the file caching the account page information', None, 'store', ACCOUNTPAGE_CACHE_FILE),
+        'accountpage_ttl': ('the number of seconds the cached account page information is used', int, 'store',
+                            CACHE_TTL),
     }
 
     opts = ExtendedSimpleOption(options)
 
     try:
         rest_client = AccountpageClient(token=opts.options.access_token)
+        resolver = AccountpageResolver(rest_client, cache_file=opts.options.accountpage_cache,
+                                       ttl=opts.options.accountpage_ttl)
 
-        gpfs = GpfsOperations()
+        # one instance per writer thread, the gpfs operations are not thread-safe
+        gpfs = per_thread(GpfsOperations)
         storage = VscStorage()
         storage_name = cluster_user_pickle_store_map[opts.options.location]
         login_mount_point = storage[storage_name].login_mount_point
@@ -172,15 +195,25 @@ def main():
             }
 
         logger.debug("clusters = %s" % (clusters,))
-        showq = SshShowq(opts.options.target_master,
-                               opts.options.target_user,
-                               clusters,
-                               cache_pickle=True,
-                               dry_run=opts.options.dry_run)
-
-        logger.debug("Getting showq information ...")
-
-        (queue_information, _, _) = showq.get_moab_command_information()
+        pool = None
+        if opts.options.multiplex:
+            pool = get_session_pool()
+
+        try:
+            showq = SshShowq(opts.options.target_master,
+                             opts.options.target_user,
+                             clusters,
+                             cache_pickle=True,
+                             dry_run=opts.options.dry_run,
+                             pool=pool)
+
+            logger.debug("Getting showq information ...")
+
+            (queue_information, _, _) = showq.get_moab_command_information(workers=opts.options.workers,
+                                                                           deadline=opts.options.deadline)
+        finally:
+            if pool is not None:
+                pool.close()
         timeinfo = time.time()
 
         active_users = queue_information.keys()
@@ -192,28 +225,50 @@ def main():
         # - the active user set
         # - the information we want to provide on the cluster(set) where this script runs
         # At the same time, we need to determine the job information each user gets to see
-        tup = (opts.options.information, active_users, queue_information, rest_client)
+        tup = (opts.options.information, active_users, queue_information, resolver)
         (target_users, target_queue_information, user_map) = determine_target_information(*tup)
 
-        nagios_user_count = 0
-        nagios_no_store = 0
-
         stats = {}
 
-        for user in target_users:
-            try:
-                path = get_pickle_path(opts.options.location, user, rest_client)
-                user_queue_information = target_queue_information[user]
-                user_queue_information['timeinfo'] = timeinfo
-                store_on_gpfs(user, path, "showq", (user_queue_information, user_map[user]), gpfs, login_mount_point,
-                              gpfs_mount_point, ".showq.json.gz", opts.options.dry_run)
-                nagios_user_count += 1
-            except Exception:
-                logger.error("Could not store pickle file for user %s" % (user))
-                nagios_no_store += 1
-
-        stats["store_users"] = nagios_user_count
-        stats["store_fail"] = nagios_no_store
+        digests = DigestStore(opts.options.digest_cache)
+        # the information is shared between the users of a VO, so it is digested and encoded once per VO
+        # timeinfo is not part of the digest, it changes every run
+        encoder = PayloadEncoder("showq", ignore=['timeinfo'])
+        # set before the writers start, the shared information is not modified while it is encoded
+        for user_queue_information in target_queue_information.values():
+            user_queue_information['timeinfo'] = timeinfo
+
+        resolver.prefetch_pickle_paths(opts.options.location, target_users, get_pickle_path)
+
+        def store(user):
+            path = resolver.pickle_path(opts.options.location, user, get_pickle_path)
+            payload = (target_queue_information[user], user_map[user])
+
+            digest = encoder.digest(payload)
+            if digests.unchanged(user, digest) and touch_on_gpfs(user, path, gpfs(), login_mount_point,
+                                                                 gpfs_mount_point, ".showq.json.gz",
+                                                                 opts.options.dry_run):
+                result = 'touch'
+            else:
+                write_on_gpfs(user, path, encoder.encode(payload), gpfs(), login_mount_point, gpfs_mount_point,
+                              ".showq.json.gz", opts.options.dry_run)
+                result = 'store'
+            digests.update(user, digest)
+            return result
+
+        writer = FilesetWriter(workers=opts.options.writers)
+        (results, failed) = writer.run(target_users, store)
+
+        if not opts.options.dry_run:
+            digests.close()
+            resolver.close()
+
+        stats["store_users"] = results.values().count('store')
+        stats["touch_users"] = results.values().count('touch')
+        stats["encoded_payloads"] = encoder.encoded
+        stats["accountpage_requests"] = resolver.requests
+        stats["store_fail"] = len(failed)
+        stats.update(writer.latency_stats())
         stats["store_fail_critical"] = STORE_LIMIT_CRITICAL
     except Exception, err:
         logger.exception("critical exception caught: %s" % (err))
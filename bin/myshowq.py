@@ -69,8 +69,8 @@ def read_cache(owner, showvo, running, idle, blocked, path):
     cache = FileCache(path)
     res = cache.load('showq')[1][0]
     user_map = cache.load('showq')[1][1]
-    # check for timeinfo
-    if res['timeinfo'] < (time.time() - MAXIMAL_AGE):
+    # check for timeinfo; unchanged information is not rewritten, only the file is touched
+    if max(res['timeinfo'], os.stat(path).st_mtime) < (time.time() - MAXIMAL_AGE):
         print "The data in the showq cache may be outdated. Please contact your admin to look into this."
     #    return (None, None)
 
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+#
+# Copyright 2013-2017 Ghent University
+#
+# This file is part of vsc-jobs,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://www.vscentrum.be),
+# the Flemish Research Foundation (FWO) (http://www.fwo.be/en)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# https://github.com/hpcugent/vsc-jobs
+#
+# vsc-jobs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Library General Public License as
+# published by the Free Software Foundation, either version 2 of
+# the License, or (at your option) any later version.
+#
+# vsc-jobs is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public License
+# along with vsc-jobs. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+node_snapshot writes the node states to a binary snapshot file (to run from cron),
+which pbsmon and show_nodes can use with --snapshot instead of querying the pbs server.
+"""
+from vsc.utils import fancylogger
+from vsc.jobs.pbs.nodes import DEFAULT_ATTRS, get_nodes_dict, node_constants
+from vsc.jobs.pbs.nodesnapshot import NODE_SNAPSHOT_FILE, write_node_snapshot
+from vsc.utils.generaloption import simple_option
+
+_log = fancylogger.getLogger('node_snapshot')
+
+
+def main():
+    """Main"""
+    options = {
+        'snapshot': ('The snapshot file to write', None, 'store', NODE_SNAPSHOT_FILE),
+    }
+    go = simple_option(options)
+
+    nodes_dict = get_nodes_dict(attrs=DEFAULT_ATTRS)
+    write_node_snapshot(go.options.snapshot, nodes_dict, node_constants())
+
+
+if __name__ == '__main__':
+    main()
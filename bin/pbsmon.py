@@ -35,7 +35,8 @@ The ideas are based on the awk-script of Willem Vermin
 import math
 import os
 from vsc.utils import fancylogger
-from vsc.jobs.pbs.nodes import ND_STATE_OK, ND_STATE_NOTOK, ND_STATE_OTHER, TRANSLATE_STATE, collect_nodeinfo
+from vsc.utils.generaloption import simple_option
+# no pbs modules, the snapshot mode does not need pbs_python
 
 _log = fancylogger.getLogger('pbsmon')
 
@@ -107,8 +108,15 @@ def get_size(width, items, mode=None):
     return max_per_row, fmt_w
 
 
-def display_cluster_status(nl, sl):
-    """Create the ascii representation of the cluster"""
+def display_cluster_status(nl, sl, nd=None):
+    """
+    Create the ascii representation of the cluster
+
+    nd is the module (or NodeSnapshot constants) with the node state constants (default: vsc.jobs.pbs.nodes)
+    """
+    if nd is None:
+        import vsc.jobs.pbs.nodes as nd
+
     width = len(nl[-1])
     items = len(nl)
 
@@ -123,7 +131,7 @@ def display_cluster_status(nl, sl):
             end = items
 
         txt.append(' ' + ' '.join([fmt_w % (nl[j]) for j in range(start, end)]))
-        txt.append(' ' + ' '.join([fmt_w % (TRANSLATE_STATE[sl[j]]) for j in range(start, end)]))
+        txt.append(' ' + ' '.join([fmt_w % (nd.TRANSLATE_STATE[sl[j]]) for j in range(start, end)]))
         txt.append('')  # empty line under each row
         start = end
         end += step
@@ -132,9 +140,9 @@ def display_cluster_status(nl, sl):
 
     # good = left = even , bad = right = odd
     # - others should be odd
-    maxlen = len(ND_STATE_NOTOK) + 1  # +1 for other
-    if len(ND_STATE_OK) > maxlen:
-        maxlen = len(ND_STATE_OK)
+    maxlen = len(nd.ND_STATE_NOTOK) + 1  # +1 for other
+    if len(nd.ND_STATE_OK) > maxlen:
+        maxlen = len(nd.ND_STATE_OK)
 
     fmt_filler = "%s %%-20s   %%-3s |" % fmt_w
     fmt = "%s %%-20s : %%-3s |" % fmt_w
@@ -142,14 +150,14 @@ def display_cluster_status(nl, sl):
     filler = fmt_filler % (' ', ' ', ' ')
 
     stats = [[filler, filler][:] for x in range(maxlen)]  # make explicit copies
-    other = sum([sl.count(key) for key in ND_STATE_OTHER])
+    other = sum([sl.count(key) for key in nd.ND_STATE_OTHER])
 
-    for idx, key in enumerate(ND_STATE_OK):
-        value = TRANSLATE_STATE[key]
+    for idx, key in enumerate(nd.ND_STATE_OK):
+        value = nd.TRANSLATE_STATE[key]
         stats[idx][0] = fmt % (value, [key, "full"][key == "job-exclusive"], sl.count(key))
 
-    for idx, key in enumerate(ND_STATE_NOTOK):
-        value = TRANSLATE_STATE[key]
+    for idx, key in enumerate(nd.ND_STATE_NOTOK):
+        value = nd.TRANSLATE_STATE[key]
         stats[idx][1] = fmt % (value, key, sl.count(key))
 
     stats[-1][1] = fmt % ('o', "other", other)
@@ -158,7 +166,11 @@ def display_cluster_status(nl, sl):
 
 
 def display_node_types(types):
-    """Give an overview of all types of nodes"""
+    """
+    Give an overview of all types of nodes
+
+    types is a dict type -> (number of nodes, nodenames range)
+    """
     template = "%sppn=%s, physmem=%sGB, swap=%sGB, vmem=%sGB, local disk=%sGB"
     txt = ['', 'Node type:']
     offset = ' '
@@ -166,7 +178,7 @@ def display_node_types(types):
         txt[-1].replace(':', 's:')
         offset = " " * 2
 
-    for typ, _ in sorted(types.items(), key=lambda x: len(x[1]), reverse=True):
+    for typ, _ in sorted(types.items(), key=lambda x: x[1][0], reverse=True):
         # most frequent first
         cores, phys, swap, disk = typ
         txt.append(template % (offset, cores, phys, swap, phys + swap, disk))
@@ -174,7 +186,37 @@ def display_node_types(types):
     print "\n".join(txt)
 
 
+def main(snapshot=None):
+    """
+    Main
+
+    snapshot is an optional ClusterSnapshot instance (default: take a new one)
+    """
+    options = {
+        'snapshot': ('Use the node snapshot file (see node_snapshot) instead of the pbs server',
+                     None, 'store', None),
+    }
+    go = simple_option(options)
+
+    from vsc.jobs.pbs.nodetypes import node_type_histogram
+
+    if go.options.snapshot:
+        from vsc.jobs.pbs.nodesnapshot import NodeSnapshot
+        node_snapshot = NodeSnapshot(go.options.snapshot)
+        node_list, state_list, types = node_snapshot.collect_nodeinfo()
+        nd = node_snapshot.constants
+    else:
+        from vsc.jobs.pbs.nodes import collect_nodeinfo
+        from vsc.jobs.pbs.snapshot import ClusterSnapshot
+        if snapshot is None:
+            snapshot = ClusterSnapshot()
+
+        node_list, state_list, types = collect_nodeinfo(snapshot.nodes)
+        nd = None
+
+    display_cluster_status(node_list, state_list, nd=nd)
+    display_node_types(node_type_histogram(types))
+
+
 if __name__ == '__main__':
-    node_list, state_list, types = collect_nodeinfo()
-    display_cluster_status(node_list, state_list)
-    display_node_types(types)
+    main()
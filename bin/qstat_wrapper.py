@@ -35,7 +35,7 @@ lines if needed.
 import sys
 
 from PBSQuery import PBSQuery
-from vsc.jobs.pbs.qstat import transform_info
+from vsc.jobs.pbs.qstat import transform_info, transform_info_attrs
 from vsc.utils import fancylogger
 from vsc.utils.generaloption import simple_option
 
@@ -59,7 +59,9 @@ def main():
         sys.exit(1)
 
     pquery = PBSQuery()
-    current_job = pquery.getjob(opts.options.jobid)
+    # only query the attributes that will be reported
+    attrib_list = transform_info_attrs(opts.options.information)
+    current_job = pquery.getjob(opts.options.jobid, attrib_list=attrib_list)
 
     s = transform_info(current_job, opts.options.information)
 
@@ -32,8 +32,8 @@ import sys
 
 
 from vsc.jobs.moab.internal import MoabCommand
+from vsc.jobs.moab.release import ReleaseCounters, release_jobs, RELEASE_BATCH_SIZE, RELEASE_EXPIRY
 from vsc.jobs.moab.showq import Showq
-from vsc.utils.cache import FileCache
 from vsc.utils import fancylogger
 from vsc.utils.nagios import NAGIOS_EXIT_CRITICAL
 from vsc.utils.script_tools import ExtendedSimpleOption
@@ -63,14 +63,18 @@ fancylogger.logToScreen(True)
 fancylogger.setLogLevelInfo()
 
 
-def process_hold(clusters, dry_run=False):
+def process_hold(clusters, dry_run=False, cache_file=RELEASEJOB_CACHE_FILE, expiry=RELEASE_EXPIRY,
+                 batch_size=RELEASE_BATCH_SIZE, workers=1, blocked_only=False):
     """Process a filtered queueinfo dict"""
-    releasejob_cache = FileCache(RELEASEJOB_CACHE_FILE)
+    # the release counters of the previous runs
+    counters = ReleaseCounters(cache_file, expiry=expiry)
 
     # get the showq data
     for data in clusters.values():
         data['path'] = data['spath']  # showq path
-    showq = Showq(clusters, cache_pickle=True)
+    # only the held jobs, and the jobs with a release counter (to keep their counter)
+    showq = Showq(clusters, cache_pickle=True, states=RELEASEJOB_SUPPORTED_HOLDTYPES,
+                  jobids=set(counters.counters.keys()), blocked_only=blocked_only)
     (queue_information, _, _) = showq.get_moab_command_information()
 
     # release the jobs, prepare the command
@@ -79,13 +83,6 @@ def process_hold(clusters, dry_run=False):
         data['path'] = data['mpath']  # mjobctl path
     m.clusters = clusters
 
-    # read the previous data
-    ts_data = releasejob_cache.load('queue_information')
-    if ts_data is None:
-        old_queue_information = {}
-    else:
-        (_, old_queue_information) = ts_data
-
     stats = {
         'peruser': 0,
         'total': 0,
@@ -93,66 +90,47 @@ def process_hold(clusters, dry_run=False):
     }
 
     release_jobids = []
+    # the jobs to release per cluster
+    cluster_jobids = {}
 
     for user, clusterdata in queue_information.items():
-        oldclusterdata = old_queue_information.setdefault(user, {})
         totaluser = 0
         for cluster, data in clusterdata.items():
-            olddata = oldclusterdata.setdefault(cluster, {})
-            # DRMJID is supposed to be unique
-            # get all oldjobids in one dict
-            oldjobs = dict([(j['DRMJID'], j['_release']) for jt in olddata.values() for j in jt])
             for jobtype, jobs in data.items():
-                removeids = []
-                for idx, job in enumerate(jobs):
+                for job in jobs:
+                    # DRMJID is supposed to be unique
                     jid = job['DRMJID']
 
                     if jobtype in RELEASEJOB_SUPPORTED_HOLDTYPES:
                         totaluser += 1
-                        release = max(oldjobs.get(jid, 0), 0) + 1
-                        job['_release'] = release
+                        release = counters.release(jid)
                         stats['release'] = max(stats['release'], release)
                         release_jobids.append(jid)
-                        # release the job
-                        cmd = [m.clusters[cluster]['path'], '-u', jid]
+                        cluster_jobids.setdefault(cluster, []).append(jid)
                         logger.info("Releasing job %s cluster %s for the %s-th time." % (jid, cluster, release))
-                        if dry_run:
-                            logger.info("Dry run %s" % cmd)
-                        else:
-                            m._run_moab_command(cmd, cluster, [])
                     else:
                         # keep historical data, eg a previously released job could be idle now
                         # but keep the counter in case it gets held again
-                        try:
-                            release = oldjobs[jid]
-                            job['_release'] = release
-                        except KeyError:
-                            # not previously in hold, remove it
-                            removeids.append(idx)
-
-                # remove the jobs (in reverse order)
-                for remove_idx in removeids[::-1]:
-                    jobs.pop(remove_idx)
-
-                # cleanup
-                if len(jobs) == 0:
-                    data.pop(jobtype)
-            # cleanup
-            if len(data) == 0:
-                clusterdata.pop(cluster)
-        # cleanup
-        if len(clusterdata) == 0:
-            queue_information.pop(user)
+                        counters.seen(jid)
 
         # update stats
         stats['peruser'] = max(stats['peruser'], totaluser)
         stats['total'] += totaluser
 
+    # release the jobs, several per mjobctl invocation
+    stats['release_failed'] = 0
+    for cluster, jobids in sorted(cluster_jobids.items()):
+        command = m._command(m.clusters[cluster]['path'])
+        released = release_jobs(command, jobids, batch_size=batch_size, workers=workers, dry_run=dry_run)
+        failed = [jid for jid in jobids if not released[jid]]
+        if failed:
+            logger.error("Failed to release jobs %s on cluster %s" % (", ".join(failed), cluster))
+        stats['release_failed'] += len(failed)
+
     logger.info("Release statistics: total jobs in hold %(total)s; max in hold per user %(peruser)s; max releases per job %(release)s" % stats)
 
-    # update and close
-    releasejob_cache.update('queue_information', queue_information, 0)
-    releasejob_cache.close()
+    # expire the counters of the jobs that are gone, and store the others
+    counters.close()
 
     return release_jobids, stats
 
@@ -163,7 +141,14 @@ def main():
         'nagios-check-interval-threshold': NAGIOS_CHECK_INTERVAL_THRESHOLD,
         'hosts': ('the hosts/clusters that should be contacted for job information', None, 'extend', []),
         'cache': ('the location to store the cache with previous release hold data', None, 'store',
-                  RELEASEJOB_CACHE_FILE)
+                  RELEASEJOB_CACHE_FILE),
+        'expiry': ('the number of seconds the release count of a job is kept after it was last seen', int, 'store',
+                   RELEASE_EXPIRY),
+        'batch_size': ('the number of jobs released per mjobctl command (more than 1 needs a mjobctl that accepts '
+                       'a comma separated list of job ids)', int, 'store', RELEASE_BATCH_SIZE),
+        'workers': ('the number of mjobctl commands run at the same time', int, 'store', 1),
+        'blocked_only': ('only ask showq for the blocked jobs; released jobs that are no longer blocked are not seen, '
+                         'use with --expiry to keep their counter', None, 'store_true', False),
     }
 
     opts = ExtendedSimpleOption(options)
@@ -182,7 +167,10 @@ def main():
             }
 
         # process the new and previous data
-        released_jobids, stats = process_hold(clusters, dry_run=opts.options.dry_run)
+        released_jobids, stats = process_hold(clusters, dry_run=opts.options.dry_run,
+                                             cache_file=opts.options.cache, expiry=opts.options.expiry,
+                                             batch_size=opts.options.batch_size, workers=opts.options.workers,
+                                             blocked_only=opts.options.blocked_only)
     except Exception, err:
         logger.exception("critical exception caught: %s" % (err))
         opts.critical("Script failed in a horrible way")
@@ -33,7 +33,7 @@ import re
 import sys
 
 from vsc.utils.script_tools import ExtendedSimpleOption
-from vsc.jobs.pbs.jobs import get_userjob_stats, get_jobs_dict
+from vsc.jobs.pbs.snapshot import ClusterSnapshot
 from vsc.utils.nagios import NAGIOS_EXIT_CRITICAL
 from vsc.utils.nagios import NagiosResult
 
@@ -42,9 +42,9 @@ SHOW_LIST = ['nodes']
 go = None
 
 
-def show_individual():
+def show_individual(snapshot):
     """Show individual job details"""
-    all_jobs = get_jobs_dict()
+    all_jobs = dict(snapshot.jobs)  # jobs are filtered below, leave snapshot untouched
     jobid_ok = []
     # make valid job id list
     if go.options.jobs is not None:
@@ -71,7 +71,7 @@ def show_individual():
             print "Nodes: %s" % ' '.join(nodes)
 
 
-def show_summary():
+def show_summary(snapshot):
     """Show summary data"""
     for group in go.options.groups:
         # get the members
@@ -80,7 +80,7 @@ def show_summary():
         if found_group:
             go.options.users += found_group[group_members_idx]
 
-    ustats, faults, categories = get_userjob_stats()
+    ustats, faults, categories = snapshot.job_table.userjob_stats()
     if faults:
         go.log.warning("Faults %s" % ([x[0] for x in faults]))
         go.log.debug("Faults %s" % (faults))
@@ -153,8 +153,12 @@ def show_summary():
     return
 
 
-def main():
-    """Like, the main."""
+def main(snapshot=None):
+    """
+    Like, the main.
+
+    snapshot is an optional ClusterSnapshot instance (default: take a new one)
+    """
 
     options = {
         'check': ('Gather information for a nagios check', None, 'store_true', False),
@@ -168,13 +172,16 @@ def main():
     global go
     go = ExtendedSimpleOption(options)
 
+    if snapshot is None:
+        snapshot = ClusterSnapshot()
+
     try:
 
         if go.options.show:
-            show_individual()  # does not need to affect the cached nagios result?
+            show_individual(snapshot)  # does not need to affect the cached nagios result?
             sys.exit(0)
         else:
-            msg = show_summary()
+            msg = show_summary(snapshot)
 
     except Exception, err:
         go.log.exception("critical exception caught: %s" % err)
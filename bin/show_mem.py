@@ -31,16 +31,21 @@ This script reports jobs that are using more memory per core then the node avera
 """
 
 from vsc.utils import fancylogger
-from vsc.jobs.pbs.jobs import get_jobs_dict
-from vsc.jobs.pbs.nodes import get_nodes_dict
+from vsc.jobs.pbs.snapshot import ClusterSnapshot
 
 _log = fancylogger.getLogger('show_mem')
 
-def main():
-    """Main method"""
+def main(snapshot=None):
+    """
+    Main method
+
+    snapshot is an optional ClusterSnapshot instance (default: take a new one)
+    """
+    if snapshot is None:
+        snapshot = ClusterSnapshot()
 
     ns = {}
-    for node, details in get_nodes_dict().items():
+    for node, details in snapshot.nodes.items():
         derived = details['derived']
 
         if not 'np' in derived:
@@ -63,7 +68,7 @@ def main():
 
     MB = 1024 ** 2
 
-    for name, details in get_jobs_dict().items():
+    for name, details in snapshot.jobs.items():
         derived = details['derived']
         if not derived['state'] in ('R',):
             continue
@@ -32,19 +32,19 @@ show_nodes prints nodes and node state information
 
 import sys
 from vsc.utils import fancylogger
-from vsc.jobs.pbs.nodes import get_nodes, collect_nodeinfo, NDNAG_CRITICAL, NDNAG_WARNING, NDNAG_OK
-from vsc.jobs.pbs.nodes import ND_NAGIOS_CRITICAL, ND_NAGIOS_WARNING, ND_NAGIOS_OK, ND_down, ND_offline
-from vsc.jobs.pbs.nodes import ND_free, ND_free_and_job, ND_job_exclusive
-from vsc.jobs.pbs.nodes import ND_state_unknown, ND_bad, ND_error, ND_idle, ND_down_on_error, ND_offline_idle
-from vsc.jobs.pbs.moab import get_nodes_dict as moab_get_nodes_dict
 from vsc.utils.generaloption import simple_option
 from vsc.utils.nagios import NagiosResult, warning_exit, ok_exit, critical_exit
+# the pbs modules are imported in main, the snapshot mode does not need pbs_python
 
 _log = fancylogger.getLogger('show_nodes')
 
 
-def main():
-    """Main"""
+def main(snapshot=None):
+    """
+    Main
+
+    snapshot is an optional ClusterSnapshot instance (default: take a new one)
+    """
 
     options = {
         'nagios': ('Report in nagios format', None, 'store_true', False, 'n'),
@@ -71,50 +71,72 @@ def main():
         'moabxml': ('Use xml moab data from file (for testing)', None, 'store', None),
         'shorthost': ('Return (short) hostname', None, 'store_true', False, 's'),
         'invert': ('Return inverted selection', None, 'store_true', False, 'v'),
+        'snapshot': ('Use the node snapshot file (see node_snapshot) instead of the pbs server',
+                     None, 'store', None),
         }
 
     go = simple_option(options)
 
+    if go.options.snapshot:
+        from vsc.jobs.pbs.nodesnapshot import NodeSnapshot
+        node_snapshot = NodeSnapshot(go.options.snapshot)
+        nd = node_snapshot.constants
+    else:
+        import vsc.jobs.pbs.nodes as nd
+        from vsc.jobs.pbs.snapshot import ClusterSnapshot
+        node_snapshot = None
+
     if go.options.nagios and not go.options.debug:
         fancylogger.logToDevLog(enable=True)
         fancylogger.logToScreen(enable=False)
         fancylogger.setLogLevelInfo()
 
-    all_states = ND_NAGIOS_CRITICAL + ND_NAGIOS_WARNING + ND_NAGIOS_OK
+    all_states = nd.ND_NAGIOS_CRITICAL + nd.ND_NAGIOS_WARNING + nd.ND_NAGIOS_OK
     report_states = []
     if go.options.down:
-        report_states.append(ND_down)
+        report_states.append(nd.ND_down)
     if go.options.downonerror:
-        report_states.append(ND_down_on_error)
+        report_states.append(nd.ND_down_on_error)
     if go.options.offline:
-        report_states.append(ND_offline)
+        report_states.append(nd.ND_offline)
     if go.options.free:
-        report_states.append(ND_free)
+        report_states.append(nd.ND_free)
     if go.options.partial:
-        report_states.append(ND_free_and_job)
+        report_states.append(nd.ND_free_and_job)
     if go.options.job_exclusive:
-        report_states.append(ND_job_exclusive)
+        report_states.append(nd.ND_job_exclusive)
     if go.options.unknown:
-        report_states.append(ND_state_unknown)
+        report_states.append(nd.ND_state_unknown)
     if go.options.bad:
-        report_states.append(ND_bad)
+        report_states.append(nd.ND_bad)
     if go.options.error:
-        report_states.append(ND_error)
+        report_states.append(nd.ND_error)
     if go.options.idle:
-        report_states.append(ND_idle)
+        report_states.append(nd.ND_idle)
     if go.options.offline_idle:
-        report_states.append(ND_offline_idle)
+        report_states.append(nd.ND_offline_idle)
 
     if len(report_states) == 0:
         report_states = all_states
 
+    if snapshot is None and node_snapshot is None:
+        # only the node info needs more than the state attributes
+        if go.options.singlenodeinfo or go.options.reportnodeinfo:
+            node_attrs = nd.DEFAULT_ATTRS
+        else:
+            node_attrs = nd.STATE_ATTRS
+        snapshot = ClusterSnapshot(node_attrs=node_attrs)
+
     if go.options.singlenodeinfo or go.options.reportnodeinfo:
-        nodeinfo = collect_nodeinfo()[2]
+        if node_snapshot is None:
+            nodeinfo = nd.collect_node_types(snapshot.nodes)
+        else:
+            nodeinfo = node_snapshot.node_types()
         if len(nodeinfo) == 0:
             _log.error('No nodeinfo found')
             sys.exit(1)
 
-        ordered = sorted(nodeinfo.items(), key=lambda x: len(x[1]), reverse=True)
+        ordered = sorted(nodeinfo.items(), key=lambda x: x[1][0], reverse=True)
 
         if go.options.singlenodeinfo:
             if len(nodeinfo) > 1:
@@ -131,9 +153,9 @@ def main():
             msg.append("SHOWNODES_PHYSMEMMB=%d" % (most_freq[1] * 1024))
         else:
             msg = []
-            for info, nodes in ordered:
+            for info, (count, nodes) in ordered:
                 txt = "%d nodes with %d cores, %s MB physmem, %s GB swap and %s GB local disk" % (
-                    len(nodes), info[0], info[1] * 1024, info[2], info[3])
+                    count, info[0], info[1] * 1024, info[2], info[3])
                 msg.append(txt)
                 # print and _log are dumped to stdout at different moment, repeat the txt in the debug log
                 _log.debug("Found %s with matching nodes: %s" % (txt, nodes))
@@ -142,6 +164,8 @@ def main():
         sys.exit(0)
 
     if go.options.moab:
+        from vsc.jobs.pbs.moab import get_nodes_dict as moab_get_nodes_dict
+        from vsc.jobs.pbs.nodes import get_nodes
 
         if go.options.moabxml:
             try:
@@ -153,13 +177,15 @@ def main():
         nodes_dict = moab_get_nodes_dict(xml=moabxml)
 
         nodes = get_nodes(nodes_dict)
+    elif node_snapshot is not None:
+        nodes = node_snapshot.get_nodes()
     else:
-        nodes = get_nodes()
+        nodes = nd.get_nodes(snapshot.nodes)
 
     nagiosexit = {
-        NDNAG_WARNING: warning_exit,
-        NDNAG_CRITICAL: critical_exit,
-        NDNAG_OK: ok_exit,
+        nd.NDNAG_WARNING: warning_exit,
+        nd.NDNAG_CRITICAL: critical_exit,
+        nd.NDNAG_OK: ok_exit,
     }
 
     nagios_res = {}
@@ -181,10 +207,10 @@ def main():
         state = full_state['derived']['state']
         states = full_state['derived']['states']
 
-        if state == ND_free and ND_idle in states:
-            state = ND_idle  # special case for idle
-        if state == ND_offline and ND_idle in states:
-            state = ND_offline_idle
+        if state == nd.ND_free and nd.ND_idle in states:
+            state = nd.ND_idle  # special case for idle
+        if state == nd.ND_offline and nd.ND_idle in states:
+            state = nd.ND_offline_idle
         if state not in detailed_res:
             detailed_res[state] = []
 
@@ -229,10 +255,10 @@ def main():
                 setattr(msg, state, nr)
             msg.total = total
 
-            reported_state = [str(NDNAG_OK), '']
-            if ND_bad in detailed_res:
-                reported_state[0] = NDNAG_CRITICAL
-                msg.message += ' - %s bad nodes' % (len(detailed_res[ND_bad]))
+            reported_state = [str(nd.NDNAG_OK), '']
+            if nd.ND_bad in detailed_res:
+                reported_state[0] = nd.NDNAG_CRITICAL
+                msg.message += ' - %s bad nodes' % (len(detailed_res[nd.ND_bad]))
             nagiosexit[reported_state[0]](msg)
         else:
             # just print the nodes
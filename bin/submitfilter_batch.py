@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+#
+# Copyright 2017 Ghent University
+#
+# This file is part of vsc-jobs,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://www.vscentrum.be),
+# the Flemish Research Foundation (FWO) (http://www.fwo.be/en)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# https://github.com/hpcugent/vsc-jobs
+#
+# vsc-jobs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Library General Public License as
+# published by the Free Software Foundation, either version 2 of
+# the License, or (at your option) any later version.
+#
+# vsc-jobs is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public License
+# along with vsc-jobs. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+submitfilter_batch filters many job scripts in one process (see filter_batch),
+e.g. the scripts generated by workflow tools before submitting them
+
+usage: submitfilter_batch --outdir <dir> [--arguments='<qsub options>'] <script or directory of scripts> ...
+"""
+import os
+import shlex
+import sys
+import time
+
+from vsc.jobs.pbs.submitfilter import filter_batch, scripts_in_dir
+from vsc.utils import fancylogger
+from vsc.utils.generaloption import simple_option
+
+_log = fancylogger.getLogger('submitfilter_batch')
+
+
+def main():
+    """Main"""
+    options = {
+        'outdir': ('Directory for the filtered scripts (and the warnings in <script>.err)', None, 'store', None),
+        'arguments': ('qsub options for all scripts', None, 'store', ''),
+    }
+    go = simple_option(options)
+
+    if not go.options.outdir or not go.args:
+        _log.error("outdir and at least one script or directory are required. Bailing.")
+        sys.exit(1)
+
+    arguments = ['submitfilter'] + shlex.split(go.options.arguments)
+    jobs = []
+    for path in go.args:
+        if os.path.isdir(path):
+            jobs.extend(scripts_in_dir(path, arguments))
+        else:
+            jobs.append((os.path.basename(path), arguments, path))
+
+    if not os.path.isdir(go.options.outdir):
+        os.makedirs(go.options.outdir)
+
+    start = time.time()
+    count, failed = filter_batch(jobs, go.options.outdir)
+    duration = max(time.time() - start, 1e-6)
+    _log.info("Filtered %s scripts in %.3f s (%.1f scripts/s)" % (count, duration, count / duration))
+
+    if failed:
+        _log.error("Failed to filter %s scripts (see <script>.err in %s): %s" %
+                   (len(failed), go.options.outdir, ', '.join(failed)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
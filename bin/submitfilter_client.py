@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+#
+# Copyright 2017 Ghent University
+#
+# This file is part of vsc-jobs,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://www.vscentrum.be),
+# the Flemish Research Foundation (FWO) (http://www.fwo.be/en)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# https://github.com/hpcugent/vsc-jobs
+#
+# vsc-jobs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Library General Public License as
+# published by the Free Software Foundation, either version 2 of
+# the License, or (at your option) any later version.
+#
+# vsc-jobs is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public License
+# along with vsc-jobs. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Client for submitfilter_daemon: sends the arguments, the environment and the job script to the daemon
+and prints the filtered job script, like submitfilter (see vsc.jobs.pbs.submitfilter_client).
+
+When the daemon is not available, the job script is filtered in-process.
+"""
+
+import os
+import sys
+
+from vsc.jobs.pbs.submitfilter_client import filter_remote
+
+
+def main(arguments=None):
+    """Main function"""
+
+    if arguments is None:
+        arguments = sys.argv
+
+    # This error could otherwise result in empty PBS_O_WORKDIR
+    try:
+        os.getcwd()
+    except OSError as e:
+        sys.stderr.write("ERROR: Unable to determine current workdir: %s (PWD deleted?)." % e)
+        sys.stderr.flush()
+        sys.exit(1)
+
+    script = sys.stdin.read()
+
+    res = filter_remote(arguments, script)
+    if res is None:
+        # no daemon, do it ourself
+        from cStringIO import StringIO
+        from vsc.jobs.pbs.submitfilter import filter_script
+        sys.exit(filter_script(arguments, StringIO(script), sys.stdout, sys.stderr))
+
+    exitcode, stdout, stderr = res
+    sys.stdout.write(stdout)
+    sys.stdout.flush()
+    sys.stderr.write(stderr)
+    sys.stderr.flush()
+    sys.exit(exitcode)
+
+if __name__ == '__main__':
+    main()
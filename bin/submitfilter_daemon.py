@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+#
+# Copyright 2017 Ghent University
+#
+# This file is part of vsc-jobs,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://www.vscentrum.be),
+# the Flemish Research Foundation (FWO) (http://www.fwo.be/en)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# https://github.com/hpcugent/vsc-jobs
+#
+# vsc-jobs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Library General Public License as
+# published by the Free Software Foundation, either version 2 of
+# the License, or (at your option) any later version.
+#
+# vsc-jobs is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public License
+# along with vsc-jobs. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+submitfilter_daemon keeps the submitfilter, its regexps and the cluster data loaded,
+and filters the job scripts sent by submitfilter_client over a Unix socket.
+This saves the python startup and the imports of submitfilter for every qsub.
+"""
+
+import json
+import os
+import pwd
+import signal
+import socket
+import stat
+import struct
+import SocketServer
+from contextlib import contextmanager
+from cStringIO import StringIO
+
+from vsc.jobs.pbs.submitfilter import filter_script, warm_up
+from vsc.jobs.pbs.submitfilter_client import ENVIRONMENT, TIMEOUT, socket_path
+from vsc.utils import fancylogger
+from vsc.utils.generaloption import simple_option
+
+_log = fancylogger.getLogger('submitfilter_daemon')
+
+# from linux/socket.h, not in the socket module of python 2
+SO_PEERCRED = getattr(socket, 'SO_PEERCRED', 17)
+
+UNKNOWN_USER = 'unknown'
+
+# max seconds to read and filter one request, a slow client does not keep its process around
+REQUEST_DEADLINE = 3 * TIMEOUT
+
+
+class RequestTimeout(Exception):
+    """The client did not send the complete request in time"""
+
+
+def request_timeout(signum, frame):
+    """Signal handler for the request deadline"""
+    raise RequestTimeout("No complete request after %s seconds" % REQUEST_DEADLINE)
+
+
+def peer_user(sock):
+    """Return the name of the user that connected to the Unix socket"""
+    try:
+        creds = sock.getsockopt(socket.SOL_SOCKET, SO_PEERCRED, struct.calcsize('3i'))
+        return pwd.getpwuid(struct.unpack('3i', creds)[1]).pw_name
+    except (socket.error, KeyError):
+        return UNKNOWN_USER
+
+
+@contextmanager
+def environment(environ):
+    """Set the submitfilter environment variables to the ones of the client"""
+    orig = dict([(x, os.environ.get(x)) for x in ENVIRONMENT])
+    for name in ENVIRONMENT:
+        if name in environ:
+            os.environ[name] = environ[name]
+        elif name in os.environ:
+            del os.environ[name]
+    try:
+        yield
+    finally:
+        for name, value in orig.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+class SubmitFilterHandler(SocketServer.StreamRequestHandler):
+    """Filter one job script"""
+
+    timeout = TIMEOUT
+
+    def handle(self):
+        # each request has its own process (and main thread), so the alarm only interrupts this request
+        signal.signal(signal.SIGALRM, request_timeout)
+        signal.alarm(REQUEST_DEADLINE)
+        try:
+            request = json.loads(self.rfile.readline())
+            stdout = StringIO()
+            stderr = StringIO()
+            with environment(request['environment']):
+                exitcode = filter_script(request['arguments'], self.rfile, stdout, stderr,
+                                        current_user=peer_user(self.request))
+            reply = {'exitcode': exitcode, 'stderr': stderr.getvalue()}
+            data = stdout.getvalue()
+            signal.alarm(0)
+        except Exception as err:
+            signal.alarm(0)
+            # the client filters the script itself
+            _log.exception("Failed to filter job script: %s" % err)
+            reply = {'error': str(err)}
+            data = ''
+
+        self.wfile.write("%s\n%s" % (json.dumps(reply), data))
+
+
+class SubmitFilterServer(SocketServer.ForkingMixIn, SocketServer.UnixStreamServer):
+    """
+    Unix socket server for the submitfilter clients.
+
+    Each request is handled in a forked process: a slow client does not stall the others,
+    and the warnings global of the submitfilter and the client environment in os.environ
+    stay private to the request. The children share the loaded modules and caches of the daemon.
+    """
+
+    def __init__(self, path):
+        # loaded once in the parent, so the forked children share the registry and the caches
+        self.registry = warm_up()
+        SocketServer.UnixStreamServer.__init__(self, path, SubmitFilterHandler)
+
+    def server_bind(self):
+        """Remove a stale socket, and let all users connect"""
+        path = self.server_address
+        if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):
+            os.unlink(path)
+        SocketServer.UnixStreamServer.server_bind(self)
+        os.chmod(path, 0666)
+
+    def server_close(self):
+        SocketServer.UnixStreamServer.server_close(self)
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+def main():
+    """Main function"""
+    options = {
+        'socket': ('Path of the Unix socket', None, 'store', socket_path()),
+    }
+    go = simple_option(options)
+
+    server = SubmitFilterServer(go.options.socket)
+    _log.info("Listening on %s" % go.options.socket)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        _log.info("Stopping")
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
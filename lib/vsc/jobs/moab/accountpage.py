@@ -0,0 +1,194 @@
+#
+# Copyright 2017 Ghent University
+#
+# This file is part of vsc-jobs,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://www.vscentrum.be),
+# the Flemish Research Foundation (FWO) (http://www.fwo.be/en)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# https://github.com/hpcugent/vsc-jobs
+#
+# vsc-jobs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Library General Public License as
+# published by the Free Software Foundation, either version 2 of
+# the License, or (at your option) any later version.
+#
+# vsc-jobs is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public License
+# along with vsc-jobs. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Cached lookups of the account page information the moab scripts need.
+
+The VO members, the VO of each user and the pickle path of each user are kept in a
+FileCache between runs, each entry for at most ttl seconds. Missing entries are
+fetched with a bounded number of requests at the same time.
+"""
+import threading
+import time
+
+from vsc.jobs.pool import BoundedPool
+from vsc.utils.cache import FileCache
+from vsc.utils.fancylogger import getLogger
+
+# seconds an account page answer is reused
+CACHE_TTL = 3600
+# number of account page requests at the same time
+WORKERS = 8
+
+INACTIVE = 'inactive'
+
+logger = getLogger(__name__)
+
+
+class AccountpageResolver(object):
+    """
+    Resolve the VO and pickle path information of the users, with a cache in front of the account page.
+
+    The rest_client is an AccountpageClient (or any vsc.utils.rest.RestClient for the account page API):
+    its get() calls return (status, body).
+    """
+
+    def __init__(self, rest_client, cache_file=None, ttl=CACHE_TTL, workers=WORKERS, key='accountpage'):
+        """
+        @param cache_file: the FileCache file to keep the answers between runs (None: only during this run)
+        @param ttl: seconds a cached answer is valid
+        @param workers: number of account page requests at the same time
+        """
+        self.rest_client = rest_client
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self.workers = workers
+        self.key = key
+
+        # entry -> (timestamp, value)
+        self._entries = {}
+        if cache_file is not None:
+            data = FileCache(cache_file).load(key)
+            if data is not None:
+                self._entries = data[1]
+        self._lock = threading.Lock()
+
+        # number of account page requests done
+        self.requests = 0
+
+    def _cached(self, entry):
+        """Return (True, value) for a valid cached entry, (False, None) otherwise"""
+        with self._lock:
+            if entry in self._entries:
+                (ts, value) = self._entries[entry]
+                if time.time() - ts <= self.ttl:
+                    return (True, value)
+        return (False, None)
+
+    def _store(self, entry, value):
+        """Cache the value for the entry"""
+        with self._lock:
+            self._entries[entry] = (time.time(), value)
+
+    def _get(self, builder):
+        """Do the get request, return the body"""
+        with self._lock:
+            self.requests += 1
+        (status, body) = builder.get()
+        if status != 200:
+            logger.raiseException("Account page request %s failed with status %s: %s" % (builder, status, body))
+        return body
+
+    def vos(self):
+        """Return the ids of the active VOs"""
+        (found, vo_ids) = self._cached('vos')
+        if found:
+            return vo_ids
+
+        vo_ids = []
+        for vo in self._get(self.rest_client.vo):
+            if vo['status'] in (INACTIVE,):
+                continue
+            vo_ids.append(vo['vsc_id'])
+            # the VO list has the members as well, no need to ask for each VO separately
+            if 'members' in vo:
+                self._store('vo:%s' % vo['vsc_id'], vo['members'])
+
+        self._store('vos', vo_ids)
+        return vo_ids
+
+    def vo_members(self, vo_id):
+        """Return the members of the VO"""
+        entry = 'vo:%s' % vo_id
+        (found, members) = self._cached(entry)
+        if not found:
+            members = self._get(self.rest_client.vo[vo_id])['members']
+            self._store(entry, members)
+        return members
+
+    def _prefetch(self, todo, func):
+        """
+        Call func for the todo items with the workers, failures are logged and skipped
+
+        @return: dict with the result for each item
+        """
+        if not todo:
+            return {}
+
+        (results, failed) = BoundedPool(workers=self.workers).run(todo, func)
+        if failed:
+            logger.warning("Account page lookup failed for %s" % (sorted(failed.keys()),))
+        return results
+
+    def user_vo_map(self):
+        """Return a dict mapping each member of an active VO to its VO id"""
+        (found, user_to_vo) = self._cached('user_vo')
+        if found:
+            return user_to_vo
+
+        vo_ids = self.vos()
+        members = self._prefetch([vo_id for vo_id in vo_ids if not self._cached('vo:%s' % vo_id)[0]],
+                                 self.vo_members)
+
+        user_to_vo = {}
+        for vo_id in vo_ids:
+            if vo_id not in members:
+                members[vo_id] = self.vo_members(vo_id)
+            for user in members[vo_id]:
+                user_to_vo[user] = vo_id
+
+        self._store('user_vo', user_to_vo)
+        return user_to_vo
+
+    def pickle_path(self, location, user_id, path_function):
+        """
+        Return the directory for the pickle file of the user.
+
+        @param path_function: called as path_function(location, user_id, rest_client) when not cached
+        """
+        entry = 'path:%s:%s' % (location, user_id)
+        (found, path) = self._cached(entry)
+        if not found:
+            with self._lock:
+                self.requests += 1
+            path = path_function(location, user_id, self.rest_client)
+            self._store(entry, path)
+        return path
+
+    def prefetch_pickle_paths(self, location, user_ids, path_function):
+        """Resolve the not cached pickle paths of the users, with the workers"""
+        todo = [u for u in user_ids if not self._cached('path:%s:%s' % (location, u))[0]]
+        self._prefetch(todo, lambda user_id: self.pickle_path(location, user_id, path_function))
+
+    def close(self):
+        """Store the valid entries in the cache file"""
+        if self.cache_file is None:
+            return
+
+        now = time.time()
+        entries = dict([(k, v) for (k, v) in self._entries.items() if now - v[0] <= self.ttl])
+        cache = FileCache(self.cache_file, False)
+        cache.update(self.key, entries, 0)
+        cache.close()
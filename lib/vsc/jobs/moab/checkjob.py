@@ -32,9 +32,9 @@ All things checkjob.
 import json
 import pprint
 
-from lxml import etree
+from cStringIO import StringIO
 
-from vsc.jobs.moab.internal import MoabCommand, SshMoabCommand
+from vsc.jobs.moab.internal import JobRecord, MoabCommand, SshMoabCommand, iterparse_elements
 from vsc.utils.fancylogger import getLogger
 from vsc.utils.missing import RUDict
 
@@ -86,6 +86,8 @@ class CheckjobInfo(RUDict):
 
 class Checkjob(MoabCommand):
 
+    STREAM = True
+
     def __init__(self, clusters, cache_pickle=False, dry_run=False):
 
         MoabCommand.__init__(self, cache_pickle=cache_pickle, dry_run=dry_run)
@@ -97,24 +99,26 @@ class Checkjob(MoabCommand):
         """File name for the pickle file to cache results."""
         return ".checkjob.pickle.cluster_%s" % (host)
 
-    def _run_moab_command(self, commandlist, cluster, options):
+    def _run_moab_command(self, commandlist, cluster, options, deadline=None):
         """Override the default, need to add an option"""
         options += ['-vvv', 'all']
-        return super(Checkjob, self)._run_moab_command(commandlist, cluster, options)
+        return super(Checkjob, self)._run_moab_command(commandlist, cluster, options, deadline=deadline)
 
     def parser(self, host, txt):
         """Parse the checkjob XML and produce a corresponding CheckjobInfo instance."""
-        xml = etree.fromstring(txt, parser=etree.XMLParser(huge_tree=True))
+        return self.iterparser(host, StringIO(txt))
 
+    def iterparser(self, host, stream):
+        """Parse the checkjob XML from the file-like stream, job per job, into a CheckjobInfo instance."""
         checkjob_info = CheckjobInfo()
 
-        for job in xml.findall('.//job'):
+        for job in iterparse_elements(stream):
 
             user = job.attrib['User']
             checkjob_info.add(user, host)
-            checkjob_info[user][host] += [
-                    (dict(job.attrib.items()), map(lambda r: dict(r.attrib.items()), job.getchildren()))
-            ]
+            checkjob_info[user][host].append(
+                    (JobRecord.from_items(job.attrib.items()), [JobRecord.from_items(r.attrib.items()) for r in job])
+            )
 
         return checkjob_info
 
@@ -134,7 +138,7 @@ class SshCheckjob(Checkjob, SshMoabCommand):
     """
     Allows for retrieving checkjob information through an ssh command over a remote master
     """
-    def __init__(self, master, user, clusters, cache_pickle=False, dry_run=False):
+    def __init__(self, master, user, clusters, cache_pickle=False, dry_run=False, pool=None):
         SshMoabCommand.__init__(self, target_master=master, target_user=user, cache_pickle=cache_pickle, 
-                dry_run=dry_run)
+                dry_run=dry_run, pool=pool)
         Checkjob.__init__(self, clusters=clusters, cache_pickle=cache_pickle, dry_run=dry_run)
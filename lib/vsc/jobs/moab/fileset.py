@@ -0,0 +1,274 @@
+#
+# Copyright 2017 Ghent University
+#
+# This file is part of vsc-jobs,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://www.vscentrum.be),
+# the Flemish Research Foundation (FWO) (http://www.fwo.be/en)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# https://github.com/hpcugent/vsc-jobs
+#
+# vsc-jobs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Library General Public License as
+# published by the Free Software Foundation, either version 2 of
+# the License, or (at your option) any later version.
+#
+# vsc-jobs is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public License
+# along with vsc-jobs. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Avoid rewriting unchanged information in the user filesets.
+
+The information stored per user is identified by a digest; when the digest did not
+change since the previous run, the file is only touched. The modification time of
+the file is the freshness stamp the readers check.
+
+Information shared by several users (e.g. all members of a VO) is encoded only once,
+and the resulting bytes are written to the location of each user.
+
+The writes for all users can be done by a pool of threads (FilesetWriter), as they
+are bound by the filesystem latency.
+"""
+import gzip
+import hashlib
+import json
+import jsonpickle
+import os
+import threading
+import time
+from cStringIO import StringIO
+
+from vsc.jobs.moab.internal import JobRecord
+from vsc.jobs.pool import BoundedPool
+from vsc.utils.cache import FileCache
+from vsc.utils.fancylogger import getLogger
+
+logger = getLogger(__name__)
+
+
+
+def _json_default(obj):
+    """Serialise the objects json does not know"""
+    if isinstance(obj, JobRecord):
+        return obj.to_dict()
+    raise TypeError("%r is not JSON serializable" % (obj,))
+
+
+def payload_digest(information, ignore=None):
+    """
+    Return a hex digest of the information (independent of the dict ordering)
+
+    @param ignore: keys to leave out of the information dict, or the dicts in the information tuple
+    """
+    if ignore:
+        def strip(part):
+            if isinstance(part, dict):
+                return dict([(k, v) for (k, v) in part.items() if k not in ignore])
+            return part
+
+        if isinstance(information, tuple):
+            information = tuple([strip(x) for x in information])
+        else:
+            information = strip(information)
+
+    txt = json.dumps(information, sort_keys=True, separators=(',', ':'), default=_json_default)
+    return hashlib.sha1(txt).hexdigest()
+
+
+def encode_payload(key, information):
+    """Return the information as the gzipped json bytes FileCache would write for it under key"""
+    data = StringIO()
+    g = gzip.GzipFile(mode='wb', fileobj=data)
+    g.write(jsonpickle.encode({key: (time.time(), information)}))
+    g.close()
+    return data.getvalue()
+
+
+class PayloadEncoder(object):
+    """
+    Digest and encode each distinct payload only once.
+
+    A payload is a tuple of objects; payloads made from the same objects (e.g. the
+    information shared by the users of a VO) are the same payload.
+    """
+
+    def __init__(self, key, ignore=None):
+        """
+        @param key: the FileCache key to encode the payloads under
+        @param ignore: keys left out of the digest (see payload_digest)
+        """
+        self.key = key
+        self.ignore = ignore
+
+        # identity of the payload parts -> (payload, result); payload is kept so the ids remain unique
+        self._digests = {}
+        self._encoded = {}
+        # can be used from several FilesetWriter threads
+        self._lock = threading.Lock()
+
+    @property
+    def encoded(self):
+        """The number of distinct payloads encoded"""
+        return len(self._encoded)
+
+    def digest(self, payload):
+        """Return the digest of the payload"""
+        ident = tuple([id(x) for x in payload])
+        with self._lock:
+            if ident not in self._digests:
+                self._digests[ident] = (payload, payload_digest(payload, ignore=self.ignore))
+            return self._digests[ident][1]
+
+    def encode(self, payload):
+        """Return the encoded payload"""
+        ident = tuple([id(x) for x in payload])
+        with self._lock:
+            if ident not in self._encoded:
+                self._encoded[ident] = (payload, encode_payload(self.key, payload))
+            return self._encoded[ident][1]
+
+
+class DigestStore(object):
+    """
+    Keep the digest of the stored information per user between runs, in a FileCache.
+
+    Only the digests of the users updated in this run are kept when closing.
+    """
+
+    def __init__(self, filename, key='digests'):
+        self.filename = filename
+        self.key = key
+
+        data = FileCache(filename).load(key)
+        if data is None:
+            self.previous = {}
+        else:
+            self.previous = data[1]
+        self.current = {}
+
+    def unchanged(self, user, digest):
+        """Return True if the digest of the user is the same as in the previous run"""
+        return self.previous.get(user, None) == digest
+
+    def update(self, user, digest):
+        """Set the digest of the user for this run"""
+        self.current[user] = digest
+
+    def close(self):
+        """Store the digests of this run"""
+        cache = FileCache(self.filename, False)
+        cache.update(self.key, self.current, 0)
+        cache.close()
+
+
+def per_thread(factory):
+    """
+    Return a function that returns the instance made by factory for the calling thread.
+
+    For objects with state that can't be shared by the FilesetWriter threads (e.g. GpfsOperations).
+    """
+    local = threading.local()
+
+    def get():
+        try:
+            return local.instance
+        except AttributeError:
+            local.instance = factory()
+            return local.instance
+
+    return get
+
+
+def _gpfs_path(user_name, path, gpfs, login_mount_point, gpfs_mount_point):
+    """Return the path on the gpfs mount point (same symlink handling as store_on_gpfs), None if unknown"""
+    if gpfs.is_symlink(path):
+        target = os.path.realpath(path)
+        if target.startswith(login_mount_point):
+            return target.replace(login_mount_point, gpfs_mount_point, 1)
+        else:
+            logger.warning("Unable to resolve the path %s for %s; symlink cannot be resolved properly" %
+                           (path, user_name))
+            return None
+    else:
+        return path
+
+
+def write_on_gpfs(user_name, path, data, gpfs, login_mount_point, gpfs_mount_point, filename, dry_run=False):
+    """
+    Like store_on_gpfs, but write the already encoded data (see encode_payload).
+
+    Arguments are the same as for store_on_gpfs (without the key, data instead of the information).
+    The gpfs operations toggle ignorerealpathmismatch, so each thread needs its own gpfs instance (see per_thread).
+    """
+    if not (user_name and user_name.startswith('vsc4')):
+        # same restriction as store_on_gpfs
+        return
+
+    path = _gpfs_path(user_name, path, gpfs, login_mount_point, gpfs_mount_point)
+    if path is None:
+        logger.raiseException("Unable to store information for %s; no path" % (user_name))
+
+    path_stat = os.stat(path)
+    filename = os.path.join(path, filename)
+
+    if dry_run:
+        logger.info("Dry run: would write %s bytes to %s" % (len(data), filename))
+        logger.info("Dry run: would chmod 640 %s" % (filename,))
+        logger.info("Dry run: would chown %s to %s %s" % (filename, path_stat.st_uid, path_stat.st_gid))
+    else:
+        f = open(filename, 'wb')
+        f.write(data)
+        f.close()
+
+        gpfs.ignorerealpathmismatch = True
+        gpfs.chmod(0640, filename)
+        gpfs.chown(path_stat.st_uid, path_stat.st_uid, filename)
+        gpfs.ignorerealpathmismatch = False
+
+    logger.info("Stored user %s information at %s" % (user_name, filename))
+
+
+def touch_on_gpfs(user_name, path, gpfs, login_mount_point, gpfs_mount_point, filename, dry_run=False):
+    """
+    Update the modification time of a file stored with store_on_gpfs, without rewriting it.
+
+    Arguments are the same as for store_on_gpfs (without the key and information).
+
+    @return: True if the file was touched, False if it does not exist (and needs to be stored)
+    """
+    path = _gpfs_path(user_name, path, gpfs, login_mount_point, gpfs_mount_point)
+    if path is None:
+        return False
+
+    filename = os.path.join(path, filename)
+    if not os.path.exists(filename):
+        return False
+
+    if dry_run:
+        logger.info("Dry run: would touch %s" % (filename,))
+    else:
+        os.utime(filename, None)
+
+    logger.debug("Touched unchanged information of user %s at %s" % (user_name, filename))
+    return True
+
+
+class FilesetWriter(BoundedPool):
+    """
+    Store the information of the users with a bounded pool of threads.
+
+    Errors are captured per user, and the duration of each store is kept for the latency stats.
+    """
+
+    FAILURE = "Could not store information for user %s"
+
+    def latency_stats(self, prefix='store_latency'):
+        """Return dict with the store latency percentiles and maximum (in ms) of the last run"""
+        return super(FilesetWriter, self).latency_stats(prefix=prefix)
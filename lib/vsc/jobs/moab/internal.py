@@ -32,10 +32,182 @@ All things moab that are similar to all moab commands from which we want output.
 import cPickle
 import os
 import pwd
+import subprocess
+import tempfile
+import threading
+import time
 
+import jsonpickle.handlers
+from lxml import etree
+
+from vsc.jobs.pool import BoundedPool
 from vsc.utils.cache import FileCache
 from vsc.utils.fancylogger import getLogger
-from vsc.utils.run import RunAsyncLoop
+from vsc.utils.run import RunAsyncLoop, RunTimeout
+
+
+# size of the chunks read from the moab command output when streaming
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def iterparse_elements(source, tag='job'):
+    """Yield the tag elements from the XML in source (a filename or file-like object).
+
+    Each element is cleared (and removed from the tree, with its preceding siblings)
+    once the next one is requested, so the memory use does not grow with the number of elements.
+    """
+    for _, element in etree.iterparse(source, events=('end',), tag=tag, huge_tree=True):
+        yield element
+
+        element.clear()
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+
+
+# shared (name tuple, name index) per set of attribute names, see JobRecord
+_RECORD_SCHEMAS = {}
+
+
+def _intern(value):
+    """Intern the (byte) string value"""
+    if isinstance(value, str):
+        return intern(value)
+    else:
+        return value
+
+
+def _record_schema(names):
+    """Return the shared (names, index) tuple for the tuple of names"""
+    try:
+        return _RECORD_SCHEMAS[names]
+    except KeyError:
+        names = tuple([_intern(x) for x in names])
+        return _RECORD_SCHEMAS.setdefault(names, (names, dict([(x, idx) for idx, x in enumerate(names)])))
+
+
+class JobRecord(object):
+    """Compact record of the attributes of a job.
+
+    Records with the same attribute names share a single tuple of names (and index), and the
+    string values are interned. Offers dict-style access, so it can be used instead of the
+    attribute dict; use to_dict for a real dict.
+    """
+
+    __slots__ = ('_names', '_index', '_values')
+
+    def __init__(self, names, values):
+        """
+        @param names: sequence of attribute names
+        @param values: sequence of the corresponding values
+        """
+        self._names, self._index = _record_schema(tuple(names))
+        self._values = tuple([_intern(x) for x in values])
+
+    @classmethod
+    def from_items(cls, items):
+        """Make a record from a sequence of (name, value) tuples"""
+        items = list(items)
+        return cls([x[0] for x in items], [x[1] for x in items])
+
+    def __getitem__(self, name):
+        return self._values[self._index[name]]
+
+    def __setitem__(self, name, value):
+        idx = self._index.get(name, None)
+        if idx is None:
+            self._names, self._index = _record_schema(self._names + (name,))
+            self._values += (_intern(value),)
+        else:
+            self._values = self._values[:idx] + (_intern(value),) + self._values[idx + 1:]
+
+    def get(self, name, default=None):
+        idx = self._index.get(name, None)
+        if idx is None:
+            return default
+        else:
+            return self._values[idx]
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __len__(self):
+        return len(self._names)
+
+    def keys(self):
+        return list(self._names)
+
+    def values(self):
+        return list(self._values)
+
+    def items(self):
+        return zip(self._names, self._values)
+
+    def to_dict(self):
+        """Return the attributes as dict"""
+        return dict(zip(self._names, self._values))
+
+    def __eq__(self, other):
+        if isinstance(other, JobRecord):
+            return self.to_dict() == other.to_dict()
+        elif isinstance(other, dict):
+            return self.to_dict() == other
+        else:
+            return NotImplemented
+
+    def __ne__(self, other):
+        res = self.__eq__(other)
+        if res is NotImplemented:
+            return res
+        return not res
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+    def __getstate__(self):
+        return (self._names, self._values)
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def __reduce__(self):
+        return (self.__class__, (self._names, self._values))
+
+
+class _JobRecordJSONHandler(jsonpickle.handlers.BaseHandler):
+    """Store a JobRecord as plain dict in json (e.g. with FileCache), so the readers do not need JobRecord"""
+
+    def flatten(self, obj, data):
+        data.clear()
+        data.update(obj.items())
+        return data
+
+
+jsonpickle.handlers.register(JobRecord, _JobRecordJSONHandler)
+
+
+class _TeeReader(object):
+    """File-like object that reads from fh, and writes all read data to copy_fh (if not None)."""
+
+    def __init__(self, fh, copy_fh=None):
+        self.fh = fh
+        self.copy_fh = copy_fh
+
+    def read(self, size=STREAM_CHUNK_SIZE):
+        data = self.fh.read(size)
+        if self.copy_fh is not None:
+            self.copy_fh.write(data)
+        return data
+
+
+class HostPool(BoundedPool):
+    """Run the moab command for several hosts at the same time"""
+
+    FAILURE = "Running moab command for host %s failed"
 
 
 class MoabCommand(object):
@@ -48,6 +220,11 @@ class MoabCommand(object):
     """
 
     TIMEOUT = 120
+    # default number of hosts contacted concurrently by get_moab_command_information
+    WORKERS = 1
+    # feed the command output to iterparser while it is running (instead of parser afterwards),
+    # only for the subclasses that implement iterparser
+    STREAM = False
 
     def __init__(self, cache_pickle=False, dry_run=False):
         """Initialise"""
@@ -55,6 +232,9 @@ class MoabCommand(object):
         # key to index the cache store
         self.cache_key = 'default'
 
+        # wall time in seconds per host of the last get_moab_command_information
+        self.host_timings = {}
+
         self.dry_run = dry_run
         self.cache_pickle = cache_pickle
         self.logger = getLogger(self.__class__.__name__)
@@ -114,6 +294,10 @@ class MoabCommand(object):
         else:
             self.logger.info("Dry run: skipping actually storing pickle files for cluster data")
 
+    def _cache_stream_name(self, host):
+        """Return the name of the file to cache the raw XML output of the streamed moab command."""
+        return "%s.xml" % self._cache_pickle_name(host)
+
     def _process_attributes(self, xml, attributes):
         """Fill in the attributes from the XML data.
 
@@ -135,24 +319,52 @@ class MoabCommand(object):
 
         return d
 
+    def _process_record(self, xml, attributes):
+        """Like _process_attributes, but return a JobRecord"""
+        names = []
+        values = []
+        for attribute in attributes:
+            try:
+                values.append(xml.attrib[attribute])
+                names.append(attribute)
+            except KeyError:
+                self.logger.error("Failed to find attribute name %s in %s" % (attribute, xml.attrib))
+
+        return JobRecord(names, values)
+
     def _command(self, path):
         """If needed, transform the command prior to execution"""
         return [path]
 
-    def _run_moab_command(self, commandlist, cluster, options):
+    def _command_options(self, host):
+        """Extra options for the moab command for the host"""
+        return []
+
+    def _run_moab_command(self, commandlist, cluster, options, deadline=None):
         """Run the moab command and return the (processed) oututput.
 
         @type commandlist: list of strings
         @type cluster: string
         @type options: list of strings
+        @type deadline: int
 
         @param commandlist: path to the checkjob executable
         @param cluster: name of the cluster we are asking for information
         @param options: The options to pass to the checkjob command.
+        @param deadline: number of seconds after which the command is killed (None: no deadline)
 
         @return: string if no processing is done, dict with the job information otherwise
         """
-        (exit_code, output) = RunAsyncLoop.run(commandlist + options)
+        if self.STREAM:
+            if self._has_iterparser():
+                return self._run_moab_command_stream(commandlist, cluster, options, deadline=deadline)
+            self.logger.debug("No iterparser for %s, parsing the output of cluster %s afterwards" %
+                              (self.__class__.__name__, cluster))
+
+        if deadline is None:
+            (exit_code, output) = RunAsyncLoop.run(commandlist + options)
+        else:
+            (exit_code, output) = RunTimeout.run(commandlist + options, timeout=deadline)
 
         if exit_code != 0:
             if self.cache_pickle:
@@ -187,26 +399,153 @@ class MoabCommand(object):
         self.logger.debug("Empty parser used with arguments %s %s.", host, txt)
         return None
 
-    def get_moab_command_information(self):
+    def _run_moab_command_stream(self, commandlist, cluster, options, deadline=None):
+        """Run the moab command and parse the output with iterparser while it is produced.
+
+        The output is never kept in memory as a whole; when caching, the raw output is
+        written to the _cache_stream_name file (and used when the command fails).
+
+        Arguments and return value are the same as _run_moab_command
+        """
+        cache_path = None
+        cache_fh = None
+        if self.cache_pickle and not self.dry_run:
+            cache_path = os.path.join(self._cache_pickle_directory(), self._cache_stream_name(cluster))
+            cache_fh = open("%s.new" % cache_path, 'w')
+
+        errors = tempfile.TemporaryFile()
+        devnull = open(os.devnull)
+        try:
+            process = subprocess.Popen(commandlist + options, stdin=devnull, stdout=subprocess.PIPE, stderr=errors,
+                                       close_fds=True)
+        except OSError:
+            errors.close()
+            if cache_fh is not None:
+                cache_fh.close()
+            raise
+        finally:
+            devnull.close()
+
+        timer = None
+        if deadline is not None:
+            timer = threading.Timer(deadline, process.kill)
+            timer.start()
+
+        finished = False
+        try:
+            parsed = self.iterparser(cluster, _TeeReader(process.stdout, cache_fh))
+            # read any trailing output, so the command can finish
+            while process.stdout.read(STREAM_CHUNK_SIZE):
+                pass
+            finished = True
+        except etree.XMLSyntaxError, err:
+            self.logger.error("Failed to parse output for cluster %s: %s" % (cluster, err))
+            parsed = None
+        finally:
+            # also on any other error, so the command and the timer thread do not linger
+            if not finished and process.poll() is None:
+                process.kill()
+            exit_code = process.wait()
+            if timer is not None:
+                timer.cancel()
+            process.stdout.close()
+            if cache_fh is not None:
+                cache_fh.close()
+
+            errors.seek(0)
+            self.logger.debug("Command %s for cluster %s exit code %s, stderr %s" %
+                              (commandlist, cluster, exit_code, errors.read()))
+            errors.close()
+
+        if exit_code != 0 or parsed is None:
+            if cache_path is not None:
+                os.unlink("%s.new" % cache_path)
+
+            if self.cache_pickle:
+                self.logger.debug("Loading cached data")
+                try:
+                    parsed = self.iterparser(cluster, open(os.path.join(self._cache_pickle_directory(),
+                                                                        self._cache_stream_name(cluster))))
+                except (IOError, etree.XMLSyntaxError):
+                    self.logger.exception("Cannot load cached data")
+                    return None
+            else:
+                return None
+        elif cache_path is not None:
+            self.logger.debug("Storing cached data")
+            os.rename("%s.new" % cache_path, cache_path)
+
+        self.logger.debug("Returning parsed output for cluster %s" % (cluster))
+        return parsed
+
+    def iterparser(self, host, stream):
+        """Parse the XML from the file-like stream into the desired data structure for further processing.
+            Used when STREAM is set; without it, the output is parsed afterwards with parser.
+        """
+        self.logger.raiseException("No iterparser for %s" % (self.__class__.__name__), NotImplementedError)
+
+    def _has_iterparser(self):
+        """Return True if the class implements iterparser"""
+        return self.__class__.iterparser.im_func is not MoabCommand.iterparser.im_func
+
+    def _get_host_information(self, host, deadline=None):
+        """Run the moab command for a single host.
+
+        @param host: the host (cluster) in self.clusters
+        @param deadline: number of seconds after which the command is killed (None: no deadline)
+
+        @return: tuple with the (processed) output (None on failure) and the wall time in seconds
+        """
+        start = time.time()
+
+        info = self.clusters[host]
+        command = self._command(info['path'])
+
+        timeout = self.TIMEOUT
+        if deadline is not None:
+            timeout = min(timeout, deadline)
+
+        try:
+            host_job_information = self._run_moab_command(command, host,
+                    ["--host=%s" % (info['master']), "--xml", "--timeout=%s" % timeout] + self._command_options(host),
+                    deadline=deadline)
+        except (EnvironmentError, etree.XMLSyntaxError), err:
+            self.logger.exception("Running moab command for host %s failed: %s" % (host, err))
+            host_job_information = None
+
+        return (host_job_information, time.time() - start)
+
+    def get_moab_command_information(self, workers=None, deadline=None):
         """Accumulate the checkjob information for the users on the given hosts.
 
-        @type path: absolute path to the executable moab command
-        @type master: the master that will provide the information
+        @type workers: int
+        @type deadline: int
+
+        @param workers: number of hosts contacted at the same time (default: WORKERS)
+        @param deadline: number of seconds after which the moab command for a host is killed
+                         and the host is considered failed (default: no deadline)
+
+        The wall time per host is stored in host_timings.
+
+        @return: tuple with the job information, the list of reported hosts and the list of failed hosts
         """
+        if workers is None:
+            workers = self.WORKERS
 
         job_information = self.info()
         failed_hosts = []
         reported_hosts = []
 
-        # Obtain the information from all specified hosts
-        for (host, info) in self.clusters.items():
+        hosts = self.clusters.keys()
+        pool = HostPool(workers=min(workers, len(hosts)))
+        (results, _) = pool.run(hosts, lambda host: self._get_host_information(host, deadline=deadline))
 
-            master = info['master']
-            path = info['path']
-            command = self._command(path)
-
-            host_job_information = self._run_moab_command(command, host, 
-                    ["--host=%s" % (master), "--xml", "--timeout=%s" % self.TIMEOUT])
+        # Combine the information from all specified hosts, in the same order as the hosts
+        self.host_timings = {}
+        for host in hosts:
+            # the hosts with an unexpected error (logged by the pool) have no result
+            (host_job_information, timing) = results.get(host, (None, None))
+            self.host_timings[host] = timing
 
             if not host_job_information:
                 failed_hosts.append(host)
@@ -215,17 +554,27 @@ class MoabCommand(object):
                 job_information.update(host_job_information)
                 reported_hosts.append(host)
 
+        self.logger.debug("Host timings: %s" % (self.host_timings))
+
         return (job_information, reported_hosts, failed_hosts)
 
 
 class SshMoabCommand(MoabCommand):
     """Similar to MoabCommand, but use ssh to contact the Moab master."""
 
-    def __init__(self, target_master, target_user, cache_pickle=False, dry_run=False):
-        """Initialise with a master to run the command at."""
+    def __init__(self, target_master, target_user, cache_pickle=False, dry_run=False, pool=None):
+        """Initialise with a master to run the command at.
+
+        @param pool: optional SessionPool to reuse the ssh connection to the master
+                     (default: new ssh connection per command)
+        """
         MoabCommand.__init__(self, cache_pickle=cache_pickle, dry_run=dry_run)
         self.master = "%s@%s" % (target_user, target_master)
+        self.pool = pool
 
     def _command(self, path):
         """Wrap the command in an ssh shell."""
-        return ['sudo', 'ssh', self.master, path]
+        if self.pool is None:
+            return ['sudo', 'ssh', self.master, path]
+        else:
+            return self.pool.command(self.master, [path])
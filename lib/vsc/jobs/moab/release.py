@@ -0,0 +1,164 @@
+#
+# Copyright 2017 Ghent University
+#
+# This file is part of vsc-jobs,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://www.vscentrum.be),
+# the Flemish Research Foundation (FWO) (http://www.fwo.be/en)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# https://github.com/hpcugent/vsc-jobs
+#
+# vsc-jobs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Library General Public License as
+# published by the Free Software Foundation, either version 2 of
+# the License, or (at your option) any later version.
+#
+# vsc-jobs is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public License
+# along with vsc-jobs. If not, see <http://www.gnu.org/licenses/>.
+"""
+The release counters of the jobs in hold, and the release itself, for release_jobholds.
+
+Only the jobs that were released are kept, indexed by DRMJID, with the number of
+releases and the last time the job was seen in the showq output.
+
+The jobs can be released in batches, several job ids per mjobctl invocation.
+This relies on mjobctl accepting a comma separated list of job ids, which is not verified
+for all moab versions, so the default is one job per invocation.
+"""
+import re
+import time
+
+from vsc.jobs.pool import BoundedPool
+from vsc.utils.cache import FileCache
+from vsc.utils.fancylogger import getLogger
+from vsc.utils.run import RunAsyncLoop
+
+# seconds a counter is kept after the job was last seen
+RELEASE_EXPIRY = 0
+# job ids per mjobctl invocation (more than 1 needs a mjobctl that accepts a comma separated list)
+RELEASE_BATCH_SIZE = 1
+
+_JOBID_TOKEN = re.compile(r'[\w.\[\]-]+')
+_RELEASE_ERROR = re.compile(r'^\s*(?:ERROR|cannot|invalid)\b', re.I)
+
+logger = getLogger(__name__)
+
+
+class ReleaseCounters(object):
+    """
+    Number of releases per job id, stored in a FileCache as DRMJID -> [releases, last seen].
+
+    Counters of jobs that are not seen for more than expiry seconds are removed on close.
+    """
+
+    def __init__(self, filename, expiry=RELEASE_EXPIRY, key='release_counters'):
+        self.filename = filename
+        self.expiry = expiry
+        self.key = key
+        self.now = time.time()
+
+        data = FileCache(filename).load(key)
+        if data is None:
+            self.counters = {}
+        else:
+            self.counters = data[1]
+
+    def release(self, jobid):
+        """Count a release of the job, return the number of releases"""
+        releases = self.counters.get(jobid, [0, 0])[0] + 1
+        self.counters[jobid] = [releases, self.now]
+        return releases
+
+    def seen(self, jobid):
+        """Mark the job as present (not in hold); return the number of releases, None if never released"""
+        counter = self.counters.get(jobid, None)
+        if counter is None:
+            return None
+        counter[1] = self.now
+        return counter[0]
+
+    def expire(self):
+        """Remove the counters of the jobs not seen for more than expiry seconds, return the number removed"""
+        expired = [jobid for (jobid, (_, last_seen)) in self.counters.items() if self.now - last_seen > self.expiry]
+        for jobid in expired:
+            del self.counters[jobid]
+        return len(expired)
+
+    def close(self):
+        """Expire and store the counters"""
+        self.expire()
+        # not retaining old data, also drops the full queue information the older versions stored
+        cache = FileCache(self.filename, False)
+        cache.update(self.key, self.counters, 0)
+        cache.close()
+
+
+def parse_release_output(jobids, exit_code, output):
+    """
+    Determine from the combined mjobctl output which jobs were released.
+
+    A job is failed when it is mentioned on an error line (by its full id or its number),
+    released when only mentioned on other lines. Jobs not mentioned get the result of the exit code.
+
+    @return: dict jobid -> True if released
+    """
+    names = {}
+    for jobid in jobids:
+        names[jobid] = jobid
+        names.setdefault(jobid.split('.')[0], jobid)
+
+    released = {}
+    for line in output.splitlines():
+        ok = not _RELEASE_ERROR.search(line)
+        for token in _JOBID_TOKEN.findall(line):
+            jobid = names.get(token, None)
+            if jobid is not None:
+                released[jobid] = released.get(jobid, True) and ok
+
+    for jobid in jobids:
+        released.setdefault(jobid, exit_code == 0)
+
+    return released
+
+
+def release_jobs(command, jobids, batch_size=RELEASE_BATCH_SIZE, workers=1, dry_run=False):
+    """
+    Release the holds of the jobs, running command -u jobid,jobid,... for batch_size jobs at a time.
+
+    @param command: the mjobctl command (list), e.g. from MoabCommand._command
+    @param batch_size: number of job ids per invocation (1: one invocation per job)
+    @param workers: number of invocations at the same time
+
+    @return: dict jobid -> True if released
+    """
+    batch_size = max(batch_size, 1)
+    batches = [tuple(jobids[idx:idx + batch_size]) for idx in range(0, len(jobids), batch_size)]
+
+    def release(batch):
+        cmd = command + ['-u', ','.join(batch)]
+        if dry_run:
+            logger.info("Dry run %s" % cmd)
+            return dict([(jobid, True) for jobid in batch])
+
+        (exit_code, output) = RunAsyncLoop.run(cmd)
+        released = parse_release_output(batch, exit_code, output)
+        if exit_code != 0:
+            logger.error("Release of jobs %s failed with exit code %s: %s" % (",".join(batch), exit_code, output))
+        return released
+
+    (results, failed) = BoundedPool(workers=workers).run(batches, release)
+
+    released = {}
+    for batch in batches:
+        if batch in failed:
+            released.update(dict([(jobid, False) for jobid in batch]))
+        else:
+            released.update(results[batch])
+    return released
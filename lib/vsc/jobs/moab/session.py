@@ -0,0 +1,239 @@
+#
+# Copyright 2017 Ghent University
+#
+# This file is part of vsc-jobs,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://www.vscentrum.be),
+# the Flemish Research Foundation (FWO) (http://www.fwo.be/en)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# https://github.com/hpcugent/vsc-jobs
+#
+# vsc-jobs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Library General Public License as
+# published by the Free Software Foundation, either version 2 of
+# the License, or (at your option) any later version.
+#
+# vsc-jobs is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public License
+# along with vsc-jobs. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Reusable sessions to run the moab commands on a remote master.
+
+The ssh sessions use the OpenSSH ControlMaster multiplexing: the first command to
+a target sets up the master connection, all further commands to that target reuse it
+and skip the ssh handshake.
+"""
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+from vsc.utils.fancylogger import getLogger
+from vsc.utils.run import RunAsyncLoop
+
+# seconds a session can be unused before it is closed
+IDLE_TIMEOUT = 300
+# seconds between two health checks of a session
+CHECK_INTERVAL = 60
+
+_log = getLogger('moab.session')
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class LocalSession(object):
+    """
+    Stand-in session that runs the commands locally.
+
+    The state of the session is kept in a control file, so it can be used to test
+    the pool without remote hosts.
+    """
+
+    def __init__(self, target, control_dir):
+        """
+        @param target: user@host the session connects to
+        @param control_dir: directory for the control files
+        """
+        self.target = target
+        self.control_path = os.path.join(control_dir, "%s.ctl" % target)
+
+        self.started = 0
+        # number of times the session was (re)started
+        self.starts = 0
+
+    def start(self):
+        """Start the session, return True on success"""
+        open(self.control_path, 'w').close()
+        self.started = time.time()
+        self.starts += 1
+        return True
+
+    def check(self):
+        """Return True if the session is usable"""
+        return os.path.exists(self.control_path)
+
+    def stop(self):
+        """Stop the session"""
+        if os.path.exists(self.control_path):
+            os.unlink(self.control_path)
+
+    def command(self, commandlist):
+        """Return the commandlist to run commandlist through the session"""
+        return list(commandlist)
+
+
+class SshSession(LocalSession):
+    """Session with a multiplexed ssh connection to the target (an ssh ControlMaster)."""
+
+    SSH = ['sudo', 'ssh']
+
+    def __init__(self, target, control_dir, persist=IDLE_TIMEOUT):
+        """
+        @param persist: seconds the ssh master connection stays up after its last use
+        """
+        super(SshSession, self).__init__(target, control_dir)
+        self.control_path = os.path.join(control_dir, "%s.sock" % target)
+        self.persist = persist
+
+    def _ssh(self, options):
+        """Return the ssh command with the control options"""
+        return self.SSH + ['-o', 'ControlPath=%s' % self.control_path] + options + [self.target]
+
+    def start(self):
+        """Start the ssh master connection in the background"""
+        options = [
+            '-o', 'ControlMaster=yes',
+            '-o', 'ControlPersist=%s' % self.persist,
+            '-o', 'BatchMode=yes',
+            '-N', '-f',
+        ]
+        # the backgrounded master keeps its stdout and stderr open, reading them would block until it exits
+        devnull = open(os.devnull, 'r+')
+        try:
+            exit_code = subprocess.call(self._ssh(options), stdin=devnull, stdout=devnull, stderr=devnull)
+        finally:
+            devnull.close()
+        if exit_code != 0:
+            _log.error("Failed to start ssh master to %s: exit code %s" % (self.target, exit_code))
+            return False
+
+        self.started = time.time()
+        self.starts += 1
+        return True
+
+    def check(self):
+        """Ask the ssh master connection if it is still alive"""
+        (exit_code, _) = RunAsyncLoop.run(self._ssh(['-O', 'check']))
+        return exit_code == 0
+
+    def stop(self):
+        """Ask the ssh master connection to exit"""
+        RunAsyncLoop.run(self._ssh(['-O', 'exit']))
+
+    def command(self, commandlist):
+        """Run the commandlist over the ssh master connection"""
+        return self._ssh([]) + list(commandlist)
+
+
+class SessionPool(object):
+    """
+    Pool of sessions, one per target.
+
+    Sessions are started on first use, health checked every check_interval seconds
+    (and restarted if needed), and closed when unused for idle_timeout seconds.
+    """
+
+    def __init__(self, session_class=SshSession, control_dir=None,
+                 idle_timeout=IDLE_TIMEOUT, check_interval=CHECK_INTERVAL):
+        """
+        @param session_class: the session class to use (SshSession or LocalSession)
+        @param control_dir: directory for the control sockets/files (default: a new temporary directory)
+        """
+        self.session_class = session_class
+        self._control_dir = control_dir
+        self._own_control_dir = control_dir is None
+        self.idle_timeout = idle_timeout
+        self.check_interval = check_interval
+
+        self._lock = threading.Lock()
+        # target -> [session, last used, last checked]
+        self._sessions = {}
+
+    @property
+    def control_dir(self):
+        """The directory for the control sockets/files"""
+        if self._control_dir is None:
+            self._control_dir = tempfile.mkdtemp(prefix='vsc-jobs-session-')
+        return self._control_dir
+
+    def _evict(self, now):
+        """Close the idle sessions"""
+        for target, (session, last_used, _) in self._sessions.items():
+            if now - last_used > self.idle_timeout:
+                _log.debug("Closing idle session to %s" % (target))
+                session.stop()
+                del self._sessions[target]
+
+    def session(self, target):
+        """Return a usable session to target, None if it can't be started"""
+        with self._lock:
+            now = time.time()
+            self._evict(now)
+
+            if target in self._sessions:
+                session, _, last_checked = self._sessions[target]
+                if now - last_checked > self.check_interval:
+                    if session.check():
+                        last_checked = now
+                    else:
+                        _log.warning("Session to %s failed health check, restarting" % (target))
+                        session.stop()
+                        del self._sessions[target]
+                if target in self._sessions:
+                    self._sessions[target] = [session, now, last_checked]
+                    return session
+
+            session = self.session_class(target, self.control_dir)
+            if not session.start():
+                return None
+
+            self._sessions[target] = [session, now, now]
+            return session
+
+    def command(self, target, commandlist):
+        """Return the commandlist to run commandlist on target, through a pooled session if possible"""
+        session = self.session(target)
+        if session is None:
+            # no session, single non-multiplexed command
+            return self.session_class(target, self.control_dir).command(commandlist)
+        return session.command(commandlist)
+
+    def close(self):
+        """Close all sessions (and remove the temporary control directory)"""
+        with self._lock:
+            for session, _, _ in self._sessions.values():
+                session.stop()
+            self._sessions = {}
+
+            if self._own_control_dir and self._control_dir is not None:
+                shutil.rmtree(self._control_dir, ignore_errors=True)
+                self._control_dir = None
+
+
+def get_session_pool():
+    """Return the process wide pool of ssh sessions"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SessionPool()
+    return _pool
@@ -28,9 +28,9 @@ All things showq.
 
 @author Andy Georges
 """
-from lxml import etree
+from cStringIO import StringIO
 
-from vsc.jobs.moab.internal import MoabCommand, SshMoabCommand
+from vsc.jobs.moab.internal import MoabCommand, SshMoabCommand, iterparse_elements
 from vsc.utils.missing import RUDict
 
 
@@ -59,17 +59,36 @@ class ShowqInfo(RUDict):
 class Showq(MoabCommand):
     """Run showq and gather the results."""
 
-    def __init__(self, clusters, cache_pickle=False, dry_run=False):
+    STREAM = True
+
+    def __init__(self, clusters, cache_pickle=False, dry_run=False, states=None, jobids=None, blocked_only=False):
+        """
+        @param states: only keep the jobs in these moab states, e.g. ('BatchHold',) (None: keep all jobs)
+        @param jobids: with states, also keep the jobs with these DRMJIDs
+        @param blocked_only: only ask for the blocked jobs (showq -b), held jobs are blocked jobs
+        """
 
         super(Showq, self).__init__(cache_pickle, dry_run)
 
         self.info = ShowqInfo
         self.clusters = clusters
+        self.states = states
+        self.jobids = jobids or set()
+        self.blocked_only = blocked_only
 
     def _cache_pickle_name(self, host):
         """File name for the pickle file to cache results."""
+        if self.blocked_only:
+            # not the same output, not the same cache
+            return ".showq.pickle.blocked.cluster_%s" % (host)
         return ".showq.pickle.cluster_%s" % (host)
 
+    def _command_options(self, host):
+        """Only the blocked jobs if requested"""
+        if self.blocked_only:
+            return ['-b']
+        return []
+
     def parser(self, host, txt):
         """
         Parse showq --xml output
@@ -93,40 +112,46 @@ class Showq(MoabCommand):
         StartPriority="660" StartTime="0" State="Idle" SubmissionTime="1278480000" SuspendDuration="0" User="vsc40000">
         </job>
         """
+        return self.iterparser(host, StringIO(txt))
+
+    def iterparser(self, host, stream):
+        """
+        Parse showq --xml output from the file-like stream, job per job (see parser)
+        """
         mandatory_attributes = ['ReqProcs', 'SubmissionTime', 'JobID', 'DRMJID', 'Class']
         running_attributes = ['MasterHost']
         idle_attributes = []
         blocked_attributes = ['BlockReason', 'Description']
 
         showq_info = ShowqInfo()
-        xml = etree.fromstring(txt)
 
         self.logger.debug("Parsing showq output")
 
-        for job in xml.findall('.//job'):
-            user = job.attrib['User']
+        for job in iterparse_elements(stream):
             state = job.attrib['State']
+            if self.states is not None and state not in self.states and job.attrib.get('DRMJID') not in self.jobids:
+                # filtered, no record is made
+                continue
+
+            user = job.attrib['User']
 
             self.logger.debug("Found job %s for user %s in state %s" % (job.attrib['JobID'], user, state))
 
             showq_info.add(user, host, state)
 
-            j = {}
-            j.update(self._process_attributes(job, mandatory_attributes))
-
             if state in('Running'):
-                j.update(self._process_attributes(job, running_attributes))
+                attributes = mandatory_attributes + running_attributes
             else:
                 if 'BlockReason' in job.attrib:
                     if state in ('Idle'):
                         state = 'IdleBlocked'
                         showq_info.add(user, host, state)
-                    j.update(self._process_attributes(job, blocked_attributes))
+                    attributes = mandatory_attributes + blocked_attributes
                 else:
-                    j.update(self._process_attributes(job, idle_attributes))
+                    attributes = mandatory_attributes + idle_attributes
 
             # append the job
-            showq_info[user][host][state] += [j]
+            showq_info[user][host][state].append(self._process_record(job, attributes))
 
         return showq_info
 
@@ -135,7 +160,9 @@ class SshShowq(Showq, SshMoabCommand):
     """
     Allows for retrieving showq information through an ssh command to the remote master
     """
-    def __init__(self, target_master, target_user, clusters, cache_pickle=False, dry_run=False):
-        Showq.__init__(self, clusters=clusters, cache_pickle=cache_pickle, dry_run=dry_run)
+    def __init__(self, target_master, target_user, clusters, cache_pickle=False, dry_run=False, pool=None,
+                 states=None, jobids=None, blocked_only=False):
+        Showq.__init__(self, clusters=clusters, cache_pickle=cache_pickle, dry_run=dry_run,
+                       states=states, jobids=jobids, blocked_only=blocked_only)
         SshMoabCommand.__init__(self, target_master=target_master, target_user=target_user, cache_pickle=cache_pickle, 
-                dry_run=dry_run)
+                dry_run=dry_run, pool=pool)
@@ -26,14 +26,20 @@
 """
 Module with UGent cluster data
 
-TODO: read this (once) from config file
+The cluster data is read (once) from the config file CLUSTERDATA_CONFIG (or the file in the
+CLUSTERDATA_CONFIG_ENV environment variable) if it exists, the built-in CLUSTERDATA otherwise.
+The derived values (maxppn, overhead and mpp) are computed once per cluster, in immutable ClusterRecords.
 
 @author: Stijn De Weirdt (Ghent University)
 @author: Jens Timmerman (Ghent University)
 """
 
-import copy
+import os
 import re
+from collections import namedtuple
+
+from vsc.jobs.pbs.spec import clear_caches
+from vsc.jobs.pbs.tools import str2byte
 
 MIN_VMEM = 1536 << 20  # minimum amount of ram in our machines.
 
@@ -43,6 +49,12 @@ DEFAULT_SERVER = "default"
 
 MASTER_REGEXP = re.compile(r'master[^.]*\.([^.]+)\.(?:[^.]+\.vsc|os)$')
 
+CLUSTERDATA_CONFIG = '/etc/pbs_clusterdata.conf'
+CLUSTERDATA_CONFIG_ENV = 'VSC_PBS_CLUSTERDATA'
+
+# options in the config file with a memory size (in bytes, or with a unit like kb)
+CONFIG_MEMORY_OPTIONS = ('PHYSMEM', 'TOTMEM', 'AVAILMEM')
+
 # these amounts are in kilobytes as reported by pbsnodes
 # availmem has to be taken from an clean idle node
 # (i.e. no jobs in pbsnodes and right after reboot)
@@ -104,26 +116,147 @@ CLUSTERDATA = {
 }
 
 
-def get_clusterdata(name, make_copy=True):
+ClusterRecord = namedtuple('ClusterRecord', ['name', 'data', 'maxppn', 'overhead', 'ppp', 'vpp'])
+
+
+def make_cluster_record(name, data):
     """
-    Return dict with clusterdata for cluster with name
+    Return the ClusterRecord for the data of the cluster
 
-    If make_copy, return a (deep)copy of the data
+    The data is kept as (frozen) sorted tuple of the items, the records are shared.
     """
+    maxppn = data.get('NP', data.get('DEFMAXNP', 1))
+
+    # amount of unusable memory in bytes
+    if 'AVAILMEM' in data:
+        overhead = data['TOTMEM'] - data['AVAILMEM']
+    else:
+        overhead = 0
+
+    # mem per processing unit, corrected for the system overhead
+    physmem = data['PHYSMEM'] - overhead
+    totmem = data['TOTMEM'] - overhead
+
+    ppp = int(physmem / maxppn)
+    vpp = int((physmem + (totmem - physmem) / 2) / maxppn)
+
+    return ClusterRecord(name, tuple(sorted(data.items())), maxppn, overhead, ppp, vpp)
+
+
+class ClusterRegistry(object):
+    """
+    The clusters, with their ClusterRecord computed on first use
+
+    clusterdata is a dict clustername -> dict with the cluster data (like CLUSTERDATA);
+    clusters can be added or replaced in it, but the data of a cluster should not be changed in place.
+    When clusterdata has no data for the default cluster, the built-in CLUSTERDATA of the default cluster is used.
+    """
+
+    def __init__(self, clusterdata, default=DEFAULT_SERVER_CLUSTER):
+        if default not in clusterdata and default not in CLUSTERDATA:
+            raise ValueError("No data for the default cluster %s" % default)
+        self.clusterdata = clusterdata
+        self.default = default
+        self._records = {}
+        # the cluster data of each record, to pick up replaced data
+        self._sources = {}
+
+    def get(self, name):
+        """Return the ClusterRecord of the cluster (of the default cluster for an unknown cluster)"""
+        data = self.clusterdata.get(name)
+        if data is None:
+            name = self.default
+            data = self.clusterdata.get(name, CLUSTERDATA.get(name))
+
+        record = self._records.get(name)
+        if record is None or self._sources[name] is not data:
+            if record is not None:
+                # the memoized results (e.g. the parsed resources) may use the replaced cluster data
+                clear_caches()
+            record = self._records[name] = make_cluster_record(name, data)
+            self._sources[name] = data
+
+        return record
+
+
+def read_clusterdata(filename):
+    """
+    Read the cluster data from the config file filename
+
+    One section per cluster, with the same (case insensitive) options as in CLUSTERDATA,
+    e.g. physmem = 66045320kb, np = 16
+    Returns dict clustername -> dict with the cluster data
+    """
+    # not imported at the top, the submitfilter only needs it with a config file
+    import ConfigParser
+
+    parser = ConfigParser.SafeConfigParser()
+    if not parser.read(filename):
+        raise IOError("Can't read cluster data config file %s" % filename)
+
+    clusterdata = {}
+    for cluster in parser.sections():
+        data = {}
+        for option, value in parser.items(cluster):
+            option = option.upper()
+            if option in CONFIG_MEMORY_OPTIONS:
+                data[option] = str2byte(value)
+            else:
+                data[option] = int(value)
+            if data[option] is None:
+                raise ValueError("Invalid value %s for %s of cluster %s in %s" % (value, option, cluster, filename))
+        clusterdata[cluster] = data
 
-    data = CLUSTERDATA.get(name, CLUSTERDATA.get(DEFAULT_SERVER_CLUSTER))
+    return clusterdata
 
-    if make_copy:
-        return copy.deepcopy(data)
+
+_registry = None
+
+
+def load_registry(filename=None):
+    """
+    (Re)load the cluster registry
+
+    The cluster data is read from filename (default: the CLUSTERDATA_CONFIG_ENV environment variable
+    or CLUSTERDATA_CONFIG) if it exists, the built-in CLUSTERDATA is used otherwise.
+    """
+    global _registry
+
+    if filename is None:
+        filename = os.environ.get(CLUSTERDATA_CONFIG_ENV, CLUSTERDATA_CONFIG)
+
+    if os.path.exists(filename):
+        clusterdata = read_clusterdata(filename)
     else:
-        return data
+        clusterdata = CLUSTERDATA
+
+    _registry = ClusterRegistry(clusterdata)
+    # the memoized parsers (e.g. of the submitfilter) depend on the cluster data
+    clear_caches()
+
+    return _registry
+
+
+def get_cluster(name):
+    """Return the ClusterRecord of the cluster with name (of the default cluster for an unknown name)"""
+    if _registry is None:
+        load_registry()
+    return _registry.get(name)
+
+
+def get_clusterdata(name, make_copy=True):
+    """
+    Return dict with clusterdata for cluster with name
+
+    The dict is built from the frozen data of the ClusterRecord, so it is always a copy
+    (make_copy is kept for backwards compatibility).
+    """
+    return dict(get_cluster(name).data)
 
 
 def get_cluster_maxppn(cluster):
     """Return max ppn for a cluster"""
-
-    c_d = get_clusterdata(cluster)
-    return c_d.get('NP', c_d.get('DEFMAXNP', 1))
+    return get_cluster(cluster).maxppn
 
 
 def get_cluster_overhead(cluster):
@@ -131,13 +264,7 @@ def get_cluster_overhead(cluster):
     Return amount of unusable memory in bytes.
     This is the difference between totmem and initial availmem.
     """
-    c_d = get_clusterdata(cluster)
-    if 'AVAILMEM' in c_d:
-        overhead = c_d['TOTMEM'] - c_d['AVAILMEM']
-    else:
-        overhead = 0
-
-    return overhead
+    return get_cluster(cluster).overhead
 
 
 def get_cluster_mpp(cluster):
@@ -147,16 +274,5 @@ def get_cluster_mpp(cluster):
 
     Values are corrected for systemoverhead using availmem (if defined for cluster)
     """
-
-    c_d = get_clusterdata(cluster)
-    maxppn = get_cluster_maxppn(cluster)
-
-    overhead = get_cluster_overhead(cluster)
-
-    physmem = c_d['PHYSMEM'] - overhead
-    totmem = c_d['TOTMEM'] - overhead
-
-    ppp = int(physmem / maxppn)
-    vpp = int((physmem + (totmem - physmem) / 2) / maxppn)
-
-    return (ppp, vpp)
+    record = get_cluster(cluster)
+    return (record.ppp, record.vpp)
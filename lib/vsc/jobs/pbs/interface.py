@@ -44,6 +44,27 @@ except ImportError:
     pbs = None
     PBSQuery = None
 
+# gather all attributes
+ALL_ATTRS = 'ALL'
+
+
 def get_query():
     """Return query instance"""
     return PBSQuery()
+
+
+def make_attrib_list(attrs, default_attrs, pbs_module, prefix='ATTR_'):
+    """
+    Return the attrib_list to pass to the query (None means all attributes)
+
+    attrs is an optional list of PBS <prefix> attribute names (e.g. 'owner' for ATTR_owner)
+        default is None, which uses default_attrs
+        if attrs is string 'ALL', gather all attributes
+    names without a <prefix><name> constant in pbs_module are ignored
+    """
+    if isinstance(attrs, basestring) and attrs == ALL_ATTRS:
+        return None
+    elif attrs is None:
+        attrs = default_attrs
+
+    return filter(None, [getattr(pbs_module, prefix + x, None) for x in attrs])
@@ -30,13 +30,15 @@ The main pbs module
 """
 
 import re
+from array import array
 from vsc.utils import fancylogger
-from vsc.jobs.pbs.interface import get_query, pbs
-from vsc.jobs.pbs.tools import str2byte, str2sec
+from vsc.jobs.pbs.interface import get_query, make_attrib_list, pbs
+from vsc.jobs.pbs.spec import parse_byte, parse_nodes_cores, parse_sec, parse_user
 
 _log = fancylogger.getLogger('pbs.jobs', fname=False)
 
 
+
 JOBID_REG = re.compile(r"\w+/\w+(\.|\w|\[|\])+")
 
 # qstat list + exechost + times
@@ -45,191 +47,324 @@ JOBID_REG = re.compile(r"\w+/\w+(\.|\w|\[|\])+")
 DEFAULT_ATTRS = ['name', 'owner', 'used', 'state', 'queue', 'session' ,'l',
                  'exechost'] + [x+'time' for x in ['start_', 'c', 'e', 'q', 'm']]
 
+# order as printed by nagios
+USERJOB_CATEGORIES = [
+    ('R', 'running'),
+    ('RN', 'running nodes'),
+    ('RC', 'running cores'),
+    ('RP', 'running procseconds'),
+
+    ('Q', 'queued'),
+    ('QN', 'queued nodes'),
+    ('QC', 'queued cores'),
+    ('QP', 'queued procseconds'),
+
+    # this one last
+    ('O', 'other jobids')
+]
+
+# value for missing data in the JobTable columns
+JOBTABLE_MISSING = -1
+# PBS ATTR_ attribute names needed for the JobTable columns
+JOBTABLE_ATTRS = ['owner', 'state', 'l', 'used', 'exechost']
 
-def get_jobs(attrs=None):
+
+def get_jobs(attrs=None, query=None):
     """
     Get the jobs
 
     attrs is an optional list of PBS ATTR_ attribute names
         default is None, which uses a predefined set of attributes, i.e. not all
         if attrs is string 'ALL', gather all attributes
+    query is an optional query instance to (re)use, default creates a new one
     """
-    query = get_query()
+    if query is None:
+        query = get_query()
+
+    attrib_list = make_attrib_list(attrs, DEFAULT_ATTRS, pbs)
+    jobs = query.getjobs(attrib_list=attrib_list)
+    return jobs
 
-    attrib_list = None
 
-    if isinstance(attrs, basestring) and attrs == 'ALL':
-        attrs = None
-    elif attrs is None:
-        attrs = DEFAULT_ATTRS
+def get_jobs_dict(attrs=None, query=None):
+    """
+    Get jobs dict with derived info
 
-    if attrs is not None:
-        attrib_list = filter(None, [getattr(pbs, 'ATTR_'+x, None) for x in attrs])
+    attrs and query are passed to get_jobs
+    """
+    jobs = get_jobs(attrs=attrs, query=query)
+
+    for jobdata in jobs.values():
+        jobdata['derived'] = derive_job(jobdata)
 
-    jobs = query.getjobs(attrib_list=attrib_list)
     return jobs
 
 
-def get_jobs_dict(attrs=None):
+def get_nodes_cores(resource_list):
+    """Return the (nodes, cores) requested in the Resource_List of a job, None if unknown"""
+    if 'neednodes' in resource_list:
+        return parse_nodes_cores(resource_list['neednodes'][0])
+    elif 'nodes' in resource_list:
+        return parse_nodes_cores(resource_list['nodes'][0])
+    else:
+        return None
+
+
+def derive_job(jobdata):
     """
-    Get jobs dict with derived info
+    Return the derived info of a single job
 
-    attrs is passed to get_jobs
+    jobdata is a job as returned by the query
     """
-    jobs = get_jobs(attrs=attrs)
+    derived = {}
 
-    reg_user = re.compile(r"(?P<user>\w+)@\S+")
+    derived['state'] = jobdata['job_state'][0]
 
-    nodes_cores = re.compile(r"(?P<nodes>\d+)(:ppn=(?P<cores>\d+))?")
-    namednodes_cores = re.compile(r"(?P<nodes>node\d+[^:+]*)(:ppn=(?P<cores>\d+))?")
-    nodes_nocores = re.compile(r"(?P<nodes>node\d+).*?")
+    user = parse_user(jobdata['Job_Owner'][0])
+    if user is not None:
+        derived['user'] = user
 
-    for jobdata in jobs.values():
-        derived = {}
-
-        derived['state'] = jobdata['job_state'][0]
-
-        r = reg_user.search(jobdata['Job_Owner'][0])
-        if r:
-            derived['user'] = r.group('user')
-
-        if 'Resource_List' in jobdata:
-            resource_list = jobdata['Resource_List']
-            # walltime
-            if 'walltime' in resource_list:
-                totalwallsec = str2sec(resource_list['walltime'][0])
-                if totalwallsec is not None:
-                    derived['totalwalltimesec'] = totalwallsec
-
-            # nodes / cores
-            need_nodes = None
-            if 'neednodes' in resource_list:
-                need_nodes = resource_list['neednodes'][0]
-            elif 'nodes' in resource_list:
-                need_nodes = resource_list['nodes'][0]
-            if need_nodes is not None:
-                m = nodes_cores.match(need_nodes)
-                if not m:
-                    namednode_m = namednodes_cores.match(need_nodes)
-                    if namednode_m:
-                        m = nodes_cores.match("1:ppn=%s" % (namednode_m.groups()[2] or "1"))
-                    elif nodes_nocores.match(need_nodes):
-                        m = nodes_cores.match("1")
-            if m:
-                nodes = int(m.group('nodes'))
-                cores = 1
-                if len(m.groups()) > 1 and m.group('cores'):
-                    cores = int(m.group('cores'))
-                derived['nodes'] = nodes
-                derived['cores'] = cores
-
-        # resource used
-        if 'resources_used' in jobdata:
-            resources_used = jobdata['resources_used']
-
-            if 'mem' in resources_used:
-                derived['used_mem'] = str2byte(resources_used['mem'][0])
-
-            if 'vmem' in resources_used:
-                derived['used_vmem'] = str2byte(resources_used['vmem'][0])
-
-            if 'walltime' in resources_used:
-                sec = str2sec(resources_used['walltime'][0])
-                if sec is not None:
-                    derived['used_walltime'] = sec
-
-            if 'cput' in resources_used:
-                sec = str2sec(resources_used['cput'][0])
-                if sec is not None:
-                    derived['used_cput'] = sec
+    if 'Resource_List' in jobdata:
+        resource_list = jobdata['Resource_List']
+        # walltime
+        if 'walltime' in resource_list:
+            totalwallsec = parse_sec(resource_list['walltime'][0])
+            if totalwallsec is not None:
+                derived['totalwalltimesec'] = totalwallsec
 
-        if 'exec_host' in jobdata:
-            nodes = jobdata.get_nodes()
-            exec_hosts = {}
-            for host in nodes:
-                hostname = host.split('/')[0]
-                if hostname not in exec_hosts:
-                    exec_hosts[hostname] = 0
-                exec_hosts[hostname] += 1
-            derived['exec_hosts'] = exec_hosts
+        # nodes / cores
+        nodes_cores = get_nodes_cores(resource_list)
+        if nodes_cores is not None:
+            derived['nodes'], derived['cores'] = nodes_cores
 
-        jobdata['derived'] = derived
+    # resource used
+    if 'resources_used' in jobdata:
+        resources_used = jobdata['resources_used']
 
-    return jobs
+        if 'mem' in resources_used:
+            derived['used_mem'] = parse_byte(resources_used['mem'][0])
 
+        if 'vmem' in resources_used:
+            derived['used_vmem'] = parse_byte(resources_used['vmem'][0])
 
-def get_userjob_stats():
-    """Report job stats per user"""
-    jobs = get_jobs_dict()
+        if 'walltime' in resources_used:
+            sec = parse_sec(resources_used['walltime'][0])
+            if sec is not None:
+                derived['used_walltime'] = sec
 
-    faults = []
-    stats = {}
+        if 'cput' in resources_used:
+            sec = parse_sec(resources_used['cput'][0])
+            if sec is not None:
+                derived['used_cput'] = sec
 
-    # order as printed by nagios
-    categories = [
-        ('R', 'running'),
-        ('RN', 'running nodes'),
-        ('RC', 'running cores'),
-        ('RP', 'running procseconds'),
+    if 'exec_host' in jobdata:
+        nodes = jobdata.get_nodes()
+        exec_hosts = {}
+        for host in nodes:
+            hostname = host.split('/')[0]
+            if hostname not in exec_hosts:
+                exec_hosts[hostname] = 0
+            exec_hosts[hostname] += 1
+        derived['exec_hosts'] = exec_hosts
 
-        ('Q', 'queued'),
-        ('QN', 'queued nodes'),
-        ('QC', 'queued cores'),
-        ('QP', 'queued procseconds'),
+    return derived
 
-        # this one last
-        ('O', 'other jobids')
-    ]
 
-    cat_map = dict([(x[0], idx) for idx, x in enumerate(categories)])
+def get_userjob_stats(jobs=None):
+    """
+    Report job stats per user
 
-    for name, jobdata in jobs.items():
-        derived = jobdata['derived']
+    jobs is an optional jobs dict as returned by get_jobs or get_jobs_dict (default: get a new one)
+    Returns tuple with stats, faults and categories, the faults are (message, jobdata) tuples.
+    """
+    if jobs is None:
+        jobs = get_jobs(attrs=JOBTABLE_ATTRS)
 
-        if 'user' not in derived:
-            faults.append(('Missing user in job %s' % name, jobdata))
-            continue
+    stats, faults, categories = JobTable.from_jobs(jobs).userjob_stats()
+    return stats, [(msg, jobs[jobid]) for msg, jobid in faults], categories
 
-        if not derived['user'] in stats:
-            stats[derived['user']] = [0] * (len(categories) - 1) + [[]]
-        ustat = stats[derived['user']]
 
-        if 'totalwalltimesec' in derived:
-            totalwalltimesec = derived['totalwalltimesec']
-        else:
-            faults.append(('Missing totalwalltimesec in job %s. Counts as 0.' % (name), jobdata))
-            totalwalltimesec = 0
+class JobTable(object):
+    """
+    Column-wise storage of the job data, for aggregate statistics.
 
-        if 'nodes' not in derived:
-            faults.append(('Missing nodes/cores in job %s. Marked as other.' % (name), jobdata))
-            ustat[-1].append(name)
-            continue
+    Users and states are interned: the user and state columns hold the index in
+    the users and states lists. All columns are array.array instances of longs,
+    with JOBTABLE_MISSING for missing values.
+    """
 
-        nodes = derived['nodes']
-        cores = derived['cores']
-        corenodes = nodes * cores
+    COLUMNS = ['user', 'state', 'nodes', 'cores', 'walltime', 'used_cores', 'used_mem', 'used_vmem', 'used_cput']
+
+    def __init__(self):
+        """Make empty table"""
+        self.jobids = []
+        self.users = []
+        self.states = []
+
+        self._user_idx = {}
+        self._state_idx = {}
+
+        for column in self.COLUMNS:
+            setattr(self, column, array('l'))
+
+    @classmethod
+    def from_jobs(cls, jobs):
+        """Make table from jobs dict as returned by get_jobs (or get_jobs_dict)"""
+        table = cls()
+        for jobid, jobdata in jobs.items():
+            table.add(jobid, jobdata)
+        return table
+
+    @classmethod
+    def from_query(cls, query=None):
+        """Make table from the jobs of the query, only the attributes for the columns are fetched"""
+        return cls.from_jobs(get_jobs(attrs=JOBTABLE_ATTRS, query=query))
+
+    def __len__(self):
+        return len(self.jobids)
+
+    def _intern(self, value, values, idx_map):
+        """Return index of value in values, add it if needed"""
+        try:
+            return idx_map[value]
+        except KeyError:
+            idx_map[value] = len(values)
+            values.append(value)
+            return idx_map[value]
+
+    def _append(self, column, value):
+        """Append value to column, JOBTABLE_MISSING if value is None"""
+        getattr(self, column).append(JOBTABLE_MISSING if value is None else value)
+
+    def add(self, jobid, jobdata):
+        """Add a job as returned by the query, only the data for the columns is parsed"""
+        self.jobids.append(jobid)
+
+        user = parse_user(jobdata['Job_Owner'][0])
+        if user is None:
+            self.user.append(JOBTABLE_MISSING)
+        else:
+            self.user.append(self._intern(user, self.users, self._user_idx))
+
+        self.state.append(self._intern(jobdata['job_state'][0], self.states, self._state_idx))
 
-        if 'exec_hosts' in derived:
-            used_cores = sum(derived['exec_hosts'].values())
-            if not corenodes == used_cores:
-                faults.append(('Mismatch requested %s /running %s cores in job %s. Marked as other.' %
-                               (corenodes, used_cores, name), jobdata))
-                ustat[-1].append(name)
-                continue
-
-        state = derived['state']
-        if state in ('R', 'Q',):
-            pass
-        elif state in ('H',):
-            state = 'Q'
+        resource_list = jobdata.get('Resource_List', {})
+        nodes_cores = get_nodes_cores(resource_list) or (None, None)
+        self._append('nodes', nodes_cores[0])
+        self._append('cores', nodes_cores[1])
+        if 'walltime' in resource_list:
+            self._append('walltime', parse_sec(resource_list['walltime'][0]))
         else:
-            faults.append(('Not counting job with state %s in job %s. Marked as other.' % (name, state), jobdata))
-            ustat[-1].append(name)
-            continue
+            self._append('walltime', None)
 
-        ustat[cat_map['%s' % state]] += 1
-        ustat[cat_map['%sN' % state]] += nodes
-        ustat[cat_map['%sC' % state]] += cores
-        ustat[cat_map['%sP' % state]] += corenodes * totalwalltimesec
+        resources_used = jobdata.get('resources_used', {})
+        for column, name, parser in [('used_mem', 'mem', parse_byte), ('used_vmem', 'vmem', parse_byte),
+                                     ('used_cput', 'cput', parse_sec)]:
+            if name in resources_used:
+                self._append(column, parser(resources_used[name][0]))
+            else:
+                self._append(column, None)
 
-    return stats, faults, categories
+        if 'exec_host' in jobdata:
+            self.used_cores.append(len(jobdata.get_nodes()))
+        else:
+            self.used_cores.append(JOBTABLE_MISSING)
+
+    def _state_categories(self):
+        """Return list with for each state: 'R', 'Q' (also for held jobs) or None (other)"""
+        cats = []
+        for state in self.states:
+            if state in ('R', 'Q',):
+                cats.append(state)
+            elif state in ('H',):
+                cats.append('Q')
+            else:
+                cats.append(None)
+        return cats
+
+    def _job_faults(self, idx, other):
+        """Return list of fault messages for job at idx, other is True if the job is marked as other"""
+        name = self.jobids[idx]
+        if self.user[idx] == JOBTABLE_MISSING:
+            return ['Missing user in job %s' % name]
+
+        faults = []
+        if self.walltime[idx] == JOBTABLE_MISSING:
+            faults.append('Missing totalwalltimesec in job %s. Counts as 0.' % (name))
+
+        if other:
+            corenodes = self.nodes[idx] * self.cores[idx]
+            used_cores = self.used_cores[idx]
+            if self.nodes[idx] == JOBTABLE_MISSING:
+                faults.append('Missing nodes/cores in job %s. Marked as other.' % (name))
+            elif used_cores != JOBTABLE_MISSING and corenodes != used_cores:
+                faults.append('Mismatch requested %s /running %s cores in job %s. Marked as other.' %
+                              (corenodes, used_cores, name))
+            else:
+                state = self.states[self.state[idx]]
+                faults.append('Not counting job with state %s in job %s. Marked as other.' % (name, state))
+
+        return faults
+
+    def userjob_stats(self):
+        """
+        Report job stats per user, with vectorized group-by per user
+
+        Returns tuple with stats, faults and categories (see get_userjob_stats);
+        the faults are (message, jobid) tuples.
+        """
+        if not self.jobids:
+            return {}, [], USERJOB_CATEGORIES[:]
+
+        # not imported at the top, only the statistics need it
+        import numpy
+
+        cat_map = dict([(x[0], idx) for idx, x in enumerate(USERJOB_CATEGORIES)])
+        state_cats = self._state_categories()
+
+        user = numpy.frombuffer(self.user, dtype=numpy.int_)
+        state = numpy.frombuffer(self.state, dtype=numpy.int_)
+        nodes = numpy.frombuffer(self.nodes, dtype=numpy.int_)
+        cores = numpy.frombuffer(self.cores, dtype=numpy.int_)
+        walltime = numpy.frombuffer(self.walltime, dtype=numpy.int_)
+        used_cores = numpy.frombuffer(self.used_cores, dtype=numpy.int_)
+
+        corenodes = nodes * cores
+        has_user = user != JOBTABLE_MISSING
+
+        running = numpy.array([x == 'R' for x in state_cats], dtype=bool)[state]
+        queued = numpy.array([x == 'Q' for x in state_cats], dtype=bool)[state]
+
+        other = has_user & ((nodes == JOBTABLE_MISSING) |
+                            ((used_cores != JOBTABLE_MISSING) & (corenodes != used_cores)) |
+                            ~(running | queued))
+
+        # faults, in job order
+        faults = []
+        fault_idx = numpy.flatnonzero(~has_user | (walltime == JOBTABLE_MISSING) | other)
+        for idx in fault_idx.tolist():
+            faults.extend([(msg, self.jobids[idx]) for msg in self._job_faults(idx, bool(other[idx]))])
+
+        stats = dict([(self.users[x], [0] * (len(USERJOB_CATEGORIES) - 1) + [[]])
+                      for x in numpy.unique(user[has_user]).tolist()])
+        nrusers = len(self.users)
+        procseconds = corenodes * numpy.maximum(walltime, 0)
+
+        for cat, selected in [('R', running), ('Q', queued)]:
+            mask = has_user & ~other & selected
+            users = user[mask]
+            totals = [
+                (cat, numpy.bincount(users, minlength=nrusers)),
+                ('%sN' % cat, numpy.bincount(users, weights=nodes[mask], minlength=nrusers)),
+                ('%sC' % cat, numpy.bincount(users, weights=cores[mask], minlength=nrusers)),
+                ('%sP' % cat, numpy.bincount(users, weights=procseconds[mask], minlength=nrusers)),
+            ]
+            for user_id in numpy.unique(users).tolist():
+                ustat = stats[self.users[user_id]]
+                for key, total in totals:
+                    ustat[cat_map[key]] = int(total[user_id])
+
+        for idx in numpy.flatnonzero(other).tolist():
+            stats[self.users[self.user[idx]]][-1].append(self.jobids[idx])
+
+        return stats, faults, USERJOB_CATEGORIES[:]
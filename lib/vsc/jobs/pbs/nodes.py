@@ -29,9 +29,10 @@ The main pbs module
 @author: Stijn De Weirdt (Ghent University)
 """
 import re
-from math import ceil
 from vsc.utils import fancylogger
-from vsc.jobs.pbs.interface import get_query, pbs
+from vsc.jobs.pbs.interface import get_query, make_attrib_list, pbs
+from vsc.jobs.pbs.nodetypes import collect_nodeinfo_derived, group_node_types, node_type_columns
+from vsc.jobs.pbs.nodetypes import node_type_histogram
 from vsc.jobs.pbs.tools import str2byte
 
 _log = fancylogger.getLogger('pbs.nodes', fname=False)
@@ -125,71 +126,147 @@ ATTR_STATE = 'state'
 ATTR_STATES = 'states'
 ATTR_STATUS = 'status'
 
+# PBS ATTR_NODE_ attribute names
+# needed to derive the node state (pbs has no ATTR_NODE_ constant for error, it is always requested)
+STATE_ATTRS = ['state', 'jobs']
+# needed to derive the node info (cores, memory, disk)
+INFO_ATTRS = ['np', 'status']
+DEFAULT_ATTRS = STATE_ATTRS + INFO_ATTRS
 
-def make_state_map(derived):
-    """Make a mapping for OK/NOTOK?OTHER and nagios OK/WARNING/CRITICAL.
-        derived: the (reference to the) dict that is added to the node state dict as returned by pbs
-            it should already contain the 'states' of the node
-    """
-    states = derived[ATTR_STATES]
-    # what state to report?
-    nd_not_ok = [x for x in ND_STATE_NOTOK if x in states]
-    nd_ok = [x for x in ND_STATE_OK if x in states]
-    if len(nd_not_ok) > 0:
+
+# one bit per node state (states not in TRANSLATE_STATE have no bit)
+STATE_BITS = dict([(state, 1 << idx) for idx, state in enumerate(sorted(TRANSLATE_STATE.keys()))])
+
+
+def states_mask(states):
+    """Return the bitmask of the states"""
+    mask = 0
+    for state in states:
+        mask |= STATE_BITS.get(state, 0)
+    return mask
+
+
+BIT_FREE = STATE_BITS[ND_free]
+BIT_OFFLINE = STATE_BITS[ND_offline]
+BIT_DOWN = STATE_BITS[ND_down]
+
+MASK_STATE_OK = states_mask(ND_STATE_OK)
+MASK_STATE_NOTOK = states_mask(ND_STATE_NOTOK)
+MASK_NAGIOS_CRITICAL = states_mask(ND_NAGIOS_CRITICAL)
+MASK_NAGIOS_WARNING = states_mask(ND_NAGIOS_WARNING)
+
+# lookup table: bitmask of the states -> (nodestate, nagiosstate), filled on first use of each bitmask
+_CLASSIFIED = {}
+
+
+def classify_mask(mask):
+    """Return (nodestate, nagiosstate) for the bitmask of the states of a node"""
+    try:
+        return _CLASSIFIED[mask]
+    except KeyError:
+        pass
+
+    if mask & MASK_STATE_NOTOK:
         ndst = NDST_NOTOK
-    elif (len(nd_ok)):
+    elif mask & MASK_STATE_OK:
         ndst = NDST_OK
     else:
         ndst = NDST_OTHER
-    state = states[0]
-    derived[ATTR_STATE] = str(state)
-    derived[ATTR_NODESTATE] = ndst
 
-    # what nagios state?
-    nag_crit = [x for x in ND_NAGIOS_CRITICAL if x in states]
-    nag_warn = [x for x in ND_NAGIOS_WARNING if x in states]
-    if len(nag_crit) > 0:
+    if mask & MASK_NAGIOS_CRITICAL:
         ndnag = NDNAG_CRITICAL
-    elif len(nag_warn) > 0:
+    elif mask & MASK_NAGIOS_WARNING:
         ndnag = NDNAG_WARNING
     else:
         ndnag = NDNAG_OK
+
+    _CLASSIFIED[mask] = (ndst, ndnag)
+    return (ndst, ndnag)
+
+
+def classify_nodes(states_list):
+    """
+    Classify many nodes at once
+
+    states_list is a list with the (derived) states of each node
+    returns list with (nodestate, nagiosstate, display character of the reported state) for each node
+    """
+    unknown = TRANSLATE_STATE[ND_state_unknown]
+    res = []
+    for states in states_list:
+        ndst, ndnag = classify_mask(states_mask(states))
+        res.append((ndst, ndnag, TRANSLATE_STATE.get(states[0], unknown)))
+    return res
+
+
+def make_state_map(derived):
+    """Make a mapping for OK/NOTOK?OTHER and nagios OK/WARNING/CRITICAL.
+        derived: the (reference to the) dict that is added to the node state dict as returned by pbs
+            it should already contain the 'states' of the node
+    """
+    states = derived[ATTR_STATES]
+    ndst, ndnag = classify_mask(states_mask(states))
+
+    derived[ATTR_STATE] = str(states[0])
+    derived[ATTR_NODESTATE] = ndst
     derived['nagiosstate'] = ndnag
 
 
-def get_nodes_dict():
-    """Get the pbs_nodes equivalent info as dict"""
-    query = get_query()
-    node_states = query.getnodes([])
+def get_nodes_dict(query=None, attrs=None):
+    """
+    Get the pbs_nodes equivalent info as dict
+
+    query is an optional query instance to (re)use, default creates a new one
+    attrs is an optional list of PBS ATTR_NODE_ attribute names
+        default is None, which uses DEFAULT_ATTRS (all attributes used for the derived data)
+        if attrs is string 'ALL', gather all attributes
+    """
+    if query is None:
+        query = get_query()
+    attrib_list = make_attrib_list(attrs, DEFAULT_ATTRS, pbs, prefix='ATTR_NODE_')
+    if attrib_list is not None and ATTR_ERROR not in attrib_list:
+        # needed for the error and down_on_error states
+        attrib_list.append(ATTR_ERROR)
+    node_states = query.getnodes(attrib_list)
     for name, full_state in node_states.items():
         # just add states
         states = full_state[ATTR_STATE]
-        if ND_free in states and ATTR_JOBS in full_state:
+        mask = states_mask(states)
+        has_jobs = ATTR_JOBS in full_state
+        has_error = ATTR_ERROR in full_state
+
+        # states to insert in front (last added first) and to append
+        prefix = []
+        suffix = []
+        if mask & BIT_FREE and has_jobs:
             _log.debug('Added free_and_job node %s' % (name))
-            states.insert(0, ND_free_and_job)
-        if ND_free in states and ATTR_JOBS not in full_state:
+            prefix.insert(0, ND_free_and_job)
+        if mask & BIT_FREE and not has_jobs:
             _log.debug('Append idle node %s' % (name))
-            states.append(ND_idle)  # append it, not insert
-        if ND_offline in states and ATTR_JOBS not in full_state:
+            suffix.append(ND_idle)  # append it, not insert
+        if mask & BIT_OFFLINE and not has_jobs:
             _log.debug('Append idle node %s' % (name))
-            states.append(ND_idle)
+            suffix.append(ND_idle)
 
-        if ATTR_ERROR in full_state:
+        if has_error:
             _log.debug('Added error node %s' % (name))
-            states.insert(0, ND_error)
-        if ND_down in states and ATTR_ERROR in full_state:
+            prefix.insert(0, ND_error)
+        if mask & BIT_DOWN and has_error:
             _log.debug('Added down_on_error node %s' % (name))
-            states.insert(0, ND_down_on_error)
+            prefix.insert(0, ND_down_on_error)
 
         # extend the node dict with derived dict (for convenience)
         derived = {}
-        if ATTR_JOBS in full_state:
+        if has_jobs:
             jobs = full_state.get_jobs()
             if not all(JOBID_REG.search(x.strip()) for x in jobs):
                 _log.debug('Added bad node %s for jobs %s' % (name, jobs))
-                states.insert(0, ND_bad)
+                prefix.insert(0, ND_bad)
             derived[ATTR_JOBS] = jobs
 
+        states[:0] = prefix
+        states.extend(suffix)
+
         derived[ATTR_STATES] = [str(x) for x in states]
         make_state_map(derived)
 
@@ -222,42 +299,31 @@ def get_nodes(nodes_dict=None):
     return node_states
 
 
-def collect_nodeinfo():
-    """Collect node information"""
-    types = {}
-    state_list = []
-    node_list = []
-    re_host_id = re.compile(r"(?P<id>\d+)")
-
-    for idx, (node, full_state) in enumerate(get_nodes()):
-        # A node can have serveral states. We are only interested in first entry.
-        derived = full_state['derived']
-
-        # what state to report?
-        state_list.append(derived[ATTR_STATE])
-
-        if derived[ATTR_NODESTATE] == NDST_OK:
-            cores = derived.get(ATTR_NP, None)
-            physmem = derived.get('physmem', None)
-            totmem = derived.get('totmem', None)
-            size = derived.get('size', None)
-
-            if all([cores, physmem, totmem, size]):  # there shouldn't be any value 0
-                # round mem to 1 gb, size to 5gb
-                GB = str2byte('gb')
-                pmem = ceil(10 * physmem / GB) / 10
-                tmem = ceil(10 * totmem / GB) / 10
-                swap = tmem - pmem
-                dsize = ceil(10 * size / (5 * GB)) / 2
-                typ = (cores, pmem, swap, dsize)
-                if typ not in types:
-                    types[typ] = []
-                types[typ].append(node)
-
-        result = re_host_id.search(node)
-        if result:
-            node_list.append(result.group('id'))
-        else:
-            node_list.append(str(idx + 1))  # offset +1
-
-    return node_list, state_list, types
+def collect_nodeinfo(nodes_dict=None):
+    """
+    Collect node information
+
+    nodes_dict is passed to get_nodes
+    """
+    nodes = [(node, full_state['derived']) for node, full_state in get_nodes(nodes_dict)]
+    return collect_nodeinfo_derived(nodes, NDST_OK)
+
+
+def collect_node_types(nodes_dict=None):
+    """
+    Collect the node types: dict type (cores, physmem GB, swap GB, local disk GB) -> (number of nodes, nodenames range)
+
+    nodes_dict is passed to get_nodes
+    """
+    nodes = [(node, full_state['derived']) for node, full_state in get_nodes(nodes_dict)]
+    return node_type_histogram(group_node_types(*node_type_columns(nodes, NDST_OK)))
+
+
+def node_constants():
+    """
+    Return dict with the node state constants (ND_*, NDST_*, NDNAG_*, ND_STATE_*, ND_NAGIOS_*)
+    and the TRANSLATE_STATE map, e.g. to store them with a node snapshot
+    """
+    constants = dict([(k, v) for (k, v) in globals().items() if k.startswith(('ND_', 'NDST_', 'NDNAG_'))])
+    constants['TRANSLATE_STATE'] = TRANSLATE_STATE
+    return constants
@@ -0,0 +1,185 @@
+#
+# Copyright 2017 Ghent University
+#
+# This file is part of vsc-jobs,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://www.vscentrum.be),
+# the Flemish Research Foundation (FWO) (http://www.fwo.be/en)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# https://github.com/hpcugent/vsc-jobs
+#
+# vsc-jobs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Library General Public License as
+# published by the Free Software Foundation, either version 2 of
+# the License, or (at your option) any later version.
+#
+# vsc-jobs is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public License
+# along with vsc-jobs. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Binary snapshot of the node states, readable without pbs_python.
+
+A producer with access to the pbs server writes the derived node data (see get_nodes_dict)
+to a file; pbsmon and show_nodes can map the file read-only instead of querying the server.
+
+Layout (little endian):
+    header: magic, version, nodename width, number of nodes, length of the constants, timestamp
+    constants: json dict with the node state constants of vsc.jobs.pbs.nodes (see node_constants)
+    records: one fixed size record per node, sorted on nodename
+        nodename, up to MAX_STATES state indices (in the states of the constants, NO_STATE padded),
+        nodestate index, nagiosstate index, np, physmem, totmem, size (0 means unknown)
+"""
+import json
+import mmap
+import os
+import struct
+import tempfile
+import time
+
+from vsc.utils import fancylogger
+from vsc.jobs.pbs.nodetypes import collect_nodeinfo_derived, group_node_types, node_type_columns
+from vsc.jobs.pbs.nodetypes import node_type_histogram
+
+_log = fancylogger.getLogger('pbs.nodesnapshot', fname=False)
+
+NODE_SNAPSHOT_FILE = '/var/cache/pbs_node_snapshot.bin'
+
+MAGIC = 'VSCNODES'
+VERSION = 1
+HEADER = struct.Struct('<8sHHIId')
+
+MAX_STATES = 8
+NO_STATE = 255
+
+NODESTATES = ('ok', 'notok', 'other')
+NAGIOSSTATES = ('OK', 'WARNING', 'CRITICAL')
+
+SIZE_PROPS = ('np', 'physmem', 'totmem', 'size')
+
+
+def _record_struct(width):
+    """Return the Struct for a record with nodenames of width bytes"""
+    return struct.Struct('<%ds%dBBBIQQQ' % (width, MAX_STATES))
+
+
+class Constants(object):
+    """The node state constants as attributes, like the vsc.jobs.pbs.nodes module"""
+
+    def __init__(self, constants):
+        self.__dict__.update(constants)
+
+
+def write_node_snapshot(filename, nodes_dict, constants):
+    """
+    Write the snapshot of the nodes to filename (atomically, readers never see a partial file)
+
+    nodes_dict is as returned by get_nodes_dict
+    constants is as returned by node_constants
+    """
+    names = sorted(nodes_dict.keys())
+    width = max([len(x) for x in names] + [1])
+
+    states = sorted(set(constants['TRANSLATE_STATE'].keys() +
+                        [x for name in names for x in nodes_dict[name]['derived']['states']]))
+    if len(states) >= NO_STATE:
+        _log.raiseException('write_node_snapshot: too many states %s' % len(states))
+    constants = dict(constants)
+    constants['states'] = states
+    state_idx = dict([(x, idx) for idx, x in enumerate(states)])
+
+    record = _record_struct(width)
+    txt = json.dumps(constants, sort_keys=True)
+
+    data = [HEADER.pack(MAGIC, VERSION, width, len(names), len(txt), time.time()), txt]
+    for name in names:
+        derived = nodes_dict[name]['derived']
+        idxs = [state_idx[x] for x in derived['states'][:MAX_STATES]]
+        idxs += [NO_STATE] * (MAX_STATES - len(idxs))
+        sizes = [derived.get(x, 0) or 0 for x in SIZE_PROPS]
+        values = [name] + idxs + [NODESTATES.index(derived['nodestate']),
+                                  NAGIOSSTATES.index(derived['nagiosstate'])] + sizes
+        data.append(record.pack(*values))
+
+    dirname = os.path.dirname(os.path.abspath(filename))
+    fd, tmpname = tempfile.mkstemp(dir=dirname, prefix='.%s.' % os.path.basename(filename))
+    try:
+        try:
+            os.write(fd, ''.join(data))
+        finally:
+            os.close(fd)
+        os.chmod(tmpname, 0644)
+        os.rename(tmpname, filename)
+    except (OSError, IOError):
+        os.unlink(tmpname)
+        raise
+
+    _log.debug("Wrote snapshot of %s nodes to %s" % (len(names), filename))
+
+
+class NodeSnapshot(object):
+    """
+    Read-only memory mapped node snapshot (see write_node_snapshot).
+
+    The records are only decoded when accessed.
+    """
+
+    def __init__(self, filename=NODE_SNAPSHOT_FILE):
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, version, width, self.count, length, self.timestamp) = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            _log.raiseException("NodeSnapshot: %s is not a node snapshot (version %s)" % (filename, version))
+
+        start = HEADER.size
+        self.constants = Constants(json.loads(self._map[start:start + length]))
+        self._states = self.constants.states
+
+        self._record = _record_struct(width)
+        self._offset = start + length
+
+    def __len__(self):
+        return self.count
+
+    def derived(self, idx):
+        """Return (nodename, derived data) of the idx-th node"""
+        values = self._record.unpack_from(self._map, self._offset + idx * self._record.size)
+        name = values[0].rstrip('\0')
+        states = [self._states[x] for x in values[1:MAX_STATES + 1] if x != NO_STATE]
+
+        derived = {
+            'states': states,
+            'state': states[0],
+            'nodestate': NODESTATES[values[MAX_STATES + 1]],
+            'nagiosstate': NAGIOSSTATES[values[MAX_STATES + 2]],
+        }
+        for prop, value in zip(SIZE_PROPS, values[MAX_STATES + 3:]):
+            if value:
+                derived[prop] = value
+
+        return name, derived
+
+    def get_nodes(self):
+        """Like vsc.jobs.pbs.nodes.get_nodes: sorted list of (nodename, {'derived': derived})"""
+        return [(name, {'derived': derived}) for name, derived in [self.derived(x) for x in range(self.count)]]
+
+    def collect_nodeinfo(self):
+        """Like vsc.jobs.pbs.nodes.collect_nodeinfo"""
+        return collect_nodeinfo_derived([self.derived(x) for x in range(self.count)], self.constants.NDST_OK)
+
+    def node_types(self):
+        """Like vsc.jobs.pbs.nodes.collect_node_types"""
+        nodes = [self.derived(x) for x in range(self.count)]
+        return node_type_histogram(group_node_types(*node_type_columns(nodes, self.constants.NDST_OK)))
+
+    def close(self):
+        """Unmap the file"""
+        self._map.close()
@@ -0,0 +1,156 @@
+#
+# Copyright 2017 Ghent University
+#
+# This file is part of vsc-jobs,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://www.vscentrum.be),
+# the Flemish Research Foundation (FWO) (http://www.fwo.be/en)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# https://github.com/hpcugent/vsc-jobs
+#
+# vsc-jobs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Library General Public License as
+# published by the Free Software Foundation, either version 2 of
+# the License, or (at your option) any later version.
+#
+# vsc-jobs is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public License
+# along with vsc-jobs. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Group the nodes on their type (cores, physmem, swap, local disk), from the derived node data.
+
+These functions need no pbs_python: the derived node data can come from the pbs server
+(see vsc.jobs.pbs.nodes) or from a node snapshot (see vsc.jobs.pbs.nodesnapshot).
+"""
+import array
+import re
+from math import ceil
+
+from vsc.jobs.pbs.qstat import convert_to_range
+from vsc.jobs.pbs.tools import str2byte
+
+# first number in a nodename
+NODE_ID_REG = re.compile(r"(?P<id>\d+)")
+
+
+def node_type_columns(nodes, ok_state):
+    """
+    Return the columns (nodenames, cores, physmem, totmem, size) of the nodes that can be typed:
+    the nodes in the ok_state nodestate with all 4 values known (and not 0)
+
+    nodes is a list of (nodename, derived) tuples
+    """
+    names = []
+    columns = [array.array('l') for _ in range(4)]
+    for node, derived in nodes:
+        if derived['nodestate'] != ok_state:
+            continue
+        values = [derived.get(x, None) for x in ('np', 'physmem', 'totmem', 'size')]
+        if all(values):  # there shouldn't be any value 0
+            names.append(node)
+            for column, value in zip(columns, values):
+                column.append(value)
+
+    return [names] + columns
+
+
+def _round_up_many(values, divisor, fraction):
+    """Return ceil(10 * value / divisor) / fraction for all values, each distinct value is rounded only once"""
+    rounded = dict([(x, ceil(10 * x / divisor) / fraction) for x in set(values)])
+    return [rounded[x] for x in values]
+
+
+def group_node_types(names, cores, physmem, totmem, size):
+    """
+    Group the nodes on their type (cores, physmem GB, swap GB, local disk GB)
+
+    names, cores, physmem, totmem and size are columns with a value for each node (see node_type_columns)
+    Returns dict type -> list of nodenames (in the order of names)
+    """
+    # round mem to 1 gb, size to 5gb
+    GB = str2byte('gb')
+    pmems = _round_up_many(physmem, GB, 10)
+    tmems = _round_up_many(totmem, GB, 10)
+    dsizes = _round_up_many(size, 5 * GB, 2)
+
+    types = {}
+    for node, typ in zip(names, zip(cores, pmems, tmems, dsizes)):
+        if typ in types:
+            types[typ].append(node)
+        else:
+            types[typ] = [node]
+
+    # swap is totmem - physmem
+    return dict([((cor, pmem, tmem - pmem, dsize), nodes) for (cor, pmem, tmem, dsize), nodes in types.items()])
+
+
+def compact_nodenames(names):
+    """
+    Condense the nodenames to ranges of the node ids (using convert_to_range).
+
+    E.g. node2801.gent, node2802.gent, node2803.gent and node2805.gent become node[2801-2803,2805].gent
+    Nodenames without id, or with zero padded ids, are kept as is.
+    """
+    groups = {}
+    other = []
+    for name in names:
+        r = NODE_ID_REG.search(name)
+        if r is None or (r.group('id').startswith('0') and len(r.group('id')) > 1):
+            other.append(name)
+        else:
+            key = (name[:r.start()], name[r.end():])
+            groups.setdefault(key, set()).add(int(r.group('id')))
+
+    res = []
+    for (prefix, suffix), ids in sorted(groups.items()):
+        rng = convert_to_range(ids)
+        if len(ids) > 1:
+            rng = '[%s]' % rng
+        res.append('%s%s%s' % (prefix, rng, suffix))
+
+    return ','.join(res + sorted(other))
+
+
+def node_type_histogram(types):
+    """
+    Return dict type -> (number of nodes, compact nodenames (see compact_nodenames))
+
+    types is dict type -> list of nodenames, as returned by group_node_types
+    """
+    return dict([(typ, (len(nodes), compact_nodenames(nodes))) for typ, nodes in types.items()])
+
+
+def collect_nodeinfo_derived(nodes, ok_state):
+    """
+    Collect node information from the derived node data (no pbs needed)
+
+    nodes is a list of (nodename, derived) tuples, sorted on nodename;
+    the nodes with nodestate ok_state are grouped on their type
+
+    Returns the list of node ids, the list of node states and
+    the node types (cores, physmem GB, swap GB, local disk GB) -> list of nodenames
+    """
+    state_list = []
+    node_list = []
+
+    for idx, (node, derived) in enumerate(nodes):
+        # A node can have serveral states. We are only interested in first entry.
+        # what state to report?
+        state_list.append(derived['state'])
+
+        result = NODE_ID_REG.search(node)
+        if result:
+            node_list.append(result.group('id'))
+        else:
+            node_list.append(str(idx + 1))  # offset +1
+
+    types = group_node_types(*node_type_columns(nodes, ok_state))
+
+    return node_list, state_list, types
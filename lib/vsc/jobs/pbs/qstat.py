@@ -118,6 +118,19 @@ def normalise_time(**kwargs):
     return seconds
 
 
+def _info_keys(info):
+    """Return list of (input_key, output_key) tuples from the info string (see transform_info)"""
+    return [k.strip().split(":") for k in info.split(",")]
+
+
+def transform_info_attrs(info):
+    """
+    Return the sorted list of PBS job attribute names needed for transform_info with the info string,
+    e.g. to pass as attrib_list to the query.
+    """
+    return sorted(set([input_key.split(".")[0] for (input_key, _) in _info_keys(info)]))
+
+
 def transform_info(job, info):
     """
     Print the information in the job structure for the requested info items and reformat the data.
@@ -133,10 +146,8 @@ def transform_info(job, info):
         PBS_WALLTIME: normalise_time,
     }
 
-    keys = [k.strip().split(":") for k in info.split(",")]
-
     s = list()
-    for (input_key, output_key) in keys:
+    for (input_key, output_key) in _info_keys(info):
         try:
             (component, item) = input_key.split(".")
             value = job[component][item]
@@ -28,28 +28,46 @@ The main pbs module
 
 @author: Stijn De Weirdt (Ghent University)
 """
-from vsc.jobs.pbs.interface import get_query
+from vsc.jobs.pbs.interface import get_query, make_attrib_list, pbs
 from vsc.utils import fancylogger
 
 _log = fancylogger.getLogger('pbs.queues', fname=False)
 
+# enabled, queue type, default and max resources, route destinations
+DEFAULT_ATTRS = ['enable', 'qtype', 'rescdflt', 'rescmax', 'routedest']
 
-def get_queues():
-    """Get the queues"""
-    query = get_query()
-    queues = query.getqueues()
+
+def get_queues(query=None, attrs=None):
+    """
+    Get the queues
+
+    query is an optional query instance to (re)use, default creates a new one
+    attrs is an optional list of PBS ATTR_ attribute names
+        default is None, which uses DEFAULT_ATTRS
+        if attrs is string 'ALL', gather all attributes
+    """
+    if query is None:
+        query = get_query()
+    queues = query.getqueues(attrib_list=make_attrib_list(attrs, DEFAULT_ATTRS, pbs))
     return queues
 
 
-def get_queues_dict():
-    """Get dict with queues, separated on 'disabled', 'route', 'enabled'"""
+def get_queues_dict(queues=None):
+    """
+    Get dict with queues, separated on 'disabled', 'route', 'enabled'
+
+    queues is an optional queues dict as returned by get_queues (default: get a new one)
+    """
+    if queues is None:
+        queues = get_queues()
+
     queues_dict = {
         'enabled': [],
         'route': [],
         'disabled': [],
     }
 
-    for name, queue in get_queues().items():
+    for name, queue in queues.items():
         if not queue.get('enabled', None):
             queues_dict['disabled'].append((name, queue))
         elif queue['queue_type'][0].lower() == 'route':
@@ -0,0 +1,156 @@
+#
+# Copyright 2017 Ghent University
+#
+# This file is part of vsc-jobs,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://www.vscentrum.be),
+# the Flemish Research Foundation (FWO) (http://www.fwo.be/en)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# https://github.com/hpcugent/vsc-jobs
+#
+# vsc-jobs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Library General Public License as
+# published by the Free Software Foundation, either version 2 of
+# the License, or (at your option) any later version.
+#
+# vsc-jobs is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public License
+# along with vsc-jobs. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Single-pass snapshot of a pbs server: jobs, nodes and queues
+"""
+from vsc.utils import fancylogger
+from vsc.jobs.pbs.interface import get_query
+from vsc.jobs.pbs.jobs import JobTable, get_jobs_dict
+from vsc.jobs.pbs.nodes import get_nodes_dict
+from vsc.jobs.pbs.queues import get_queues
+
+_log = fancylogger.getLogger('pbs.snapshot', fname=False)
+
+
+class ClusterSnapshot(object):
+    """
+    Jobs, nodes and queues of a pbs server, gathered through a single query instance.
+
+    Each part is fetched and derived only once, on first access:
+        jobs: as returned by get_jobs_dict
+        nodes: as returned by get_nodes_dict
+        queues: as returned by get_queues
+        job_table: JobTable made from the jobs
+
+    The jobs are cross-linked (also on first access):
+        job_nodes: jobid -> sorted list of nodes the job runs on
+        node_jobs: node -> sorted list of jobids running on the node
+        user_jobs: user -> sorted list of jobids
+    """
+
+    def __init__(self, query=None, job_attrs=None, node_attrs=None, queue_attrs=None):
+        """
+        query is an optional query instance (default: create one when first needed)
+        job_attrs is passed as attrs to get_jobs_dict
+        node_attrs is passed as attrs to get_nodes_dict
+        queue_attrs is passed as attrs to get_queues
+        """
+        self._query = query
+        self.job_attrs = job_attrs
+        self.node_attrs = node_attrs
+        self.queue_attrs = queue_attrs
+
+        self._jobs = None
+        self._nodes = None
+        self._queues = None
+        self._job_table = None
+
+        self._job_nodes = None
+        self._node_jobs = None
+        self._user_jobs = None
+
+    @property
+    def query(self):
+        """The (shared) query instance"""
+        if self._query is None:
+            self._query = get_query()
+        return self._query
+
+    @property
+    def jobs(self):
+        """The jobs dict with derived data"""
+        if self._jobs is None:
+            _log.debug("Gathering jobs for snapshot")
+            self._jobs = get_jobs_dict(attrs=self.job_attrs, query=self.query)
+        return self._jobs
+
+    @property
+    def job_table(self):
+        """The jobs as JobTable"""
+        if self._job_table is None:
+            self._job_table = JobTable.from_jobs(self.jobs)
+        return self._job_table
+
+    @property
+    def nodes(self):
+        """The nodes dict with derived data"""
+        if self._nodes is None:
+            _log.debug("Gathering nodes for snapshot")
+            self._nodes = get_nodes_dict(query=self.query, attrs=self.node_attrs)
+        return self._nodes
+
+    @property
+    def queues(self):
+        """The queues dict"""
+        if self._queues is None:
+            _log.debug("Gathering queues for snapshot")
+            self._queues = get_queues(query=self.query, attrs=self.queue_attrs)
+        return self._queues
+
+    def _link(self):
+        """Build the job/node/user cross-links from the derived job data"""
+        job_nodes = {}
+        node_jobs = {}
+        user_jobs = {}
+
+        for jobid, jobdata in self.jobs.items():
+            derived = jobdata['derived']
+
+            if 'user' in derived:
+                user_jobs.setdefault(derived['user'], []).append(jobid)
+
+            hosts = sorted(derived.get('exec_hosts', {}).keys())
+            job_nodes[jobid] = hosts
+            for host in hosts:
+                node_jobs.setdefault(host, []).append(jobid)
+
+        for jobids in node_jobs.values() + user_jobs.values():
+            jobids.sort()
+
+        self._job_nodes = job_nodes
+        self._node_jobs = node_jobs
+        self._user_jobs = user_jobs
+
+    @property
+    def job_nodes(self):
+        """Map jobid to list of nodes"""
+        if self._job_nodes is None:
+            self._link()
+        return self._job_nodes
+
+    @property
+    def node_jobs(self):
+        """Map node to list of jobids"""
+        if self._node_jobs is None:
+            self._link()
+        return self._node_jobs
+
+    @property
+    def user_jobs(self):
+        """Map user to list of jobids"""
+        if self._user_jobs is None:
+            self._link()
+        return self._user_jobs
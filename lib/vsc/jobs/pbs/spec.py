@@ -0,0 +1,220 @@
+#
+# Copyright 2017 Ghent University
+#
+# This file is part of vsc-jobs,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://www.vscentrum.be),
+# the Flemish Research Foundation (FWO) (http://www.fwo.be/en)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# https://github.com/hpcugent/vsc-jobs
+#
+# vsc-jobs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Library General Public License as
+# published by the Free Software Foundation, either version 2 of
+# the License, or (at your option) any later version.
+#
+# vsc-jobs is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public License
+# along with vsc-jobs. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Memoized parsers for the resource specification strings found in job data and job scripts
+
+Job data typically contains only a few hundred distinct 'nodes=...', walltime or memory strings,
+even for tens of thousands of jobs. The parsers here cache their results in a bounded LRU cache,
+keyed by the raw string (and any other arguments), so each distinct string is only parsed once.
+"""
+import re
+from functools import wraps
+
+from vsc.jobs.pbs.tools import str2byte, str2sec
+
+# default maximum number of cached results per parser
+SPEC_CACHE_SIZE = 4096
+
+USER_REG = re.compile(r"(?P<user>\w+)@\S+")
+
+NODES_CORES_REG = re.compile(r"(?P<nodes>\d+)(:ppn=(?P<cores>\d+))?")
+NAMEDNODES_CORES_REG = re.compile(r"(?P<nodes>node\d+[^:+]*)(:ppn=(?P<cores>\d+))?")
+NODES_NOCORES_REG = re.compile(r"(?P<nodes>node\d+).*?")
+
+_memoized = []
+
+
+def memoize(maxsize=SPEC_CACHE_SIZE):
+    """
+    Decorator to cache the results of a function with hashable (positional) arguments
+    in a bounded LRU cache with at most maxsize entries.
+
+    The LRU order is tracked per generation rather than per entry (OrderedDict is too slow for this):
+    new results and hits are kept in the current generation, and when it is full,
+    the previous generation (ie the least recently used results) is dropped.
+    A hit costs a single dict lookup.
+
+    The results are shared between callers, so the function should return immutable values.
+    The decorated function has a cache_clear method, a cache_info method
+    (returns dict with hits, misses, size and maxsize) and the original function as uncached attribute.
+    """
+    gensize = max(1, maxsize // 2)
+
+    def decorator(func):
+        # current and previous generation
+        gens = [{}, {}]
+        info = {'hits': 0, 'misses': 0}
+
+        @wraps(func)
+        def wrapper(*args):
+            current = gens[0]
+            try:
+                res = current[args]
+                info['hits'] += 1
+                return res
+            except KeyError:
+                pass
+
+            try:
+                res = gens[1][args]
+                info['hits'] += 1
+            except KeyError:
+                res = func(*args)
+                info['misses'] += 1
+
+            if len(current) >= gensize:
+                gens[1] = current
+                current = gens[0] = {}
+            current[args] = res
+
+            return res
+
+        def cache_clear():
+            gens[0] = {}
+            gens[1] = {}
+            info.update({'hits': 0, 'misses': 0})
+
+        def cache_info():
+            size = len(gens[0]) + len([x for x in gens[1] if x not in gens[0]])
+            return dict(info, size=size, maxsize=maxsize)
+
+        wrapper.cache_clear = cache_clear
+        wrapper.cache_info = cache_info
+        wrapper.uncached = func
+        _memoized.append(wrapper)
+
+        return wrapper
+
+    return decorator
+
+
+def clear_caches():
+    """Clear the caches of all memoized parsers"""
+    for func in _memoized:
+        func.cache_clear()
+
+
+@memoize()
+def parse_user(owner):
+    """Return the user from a Job_Owner user@host string (or None)"""
+    r = USER_REG.search(owner)
+    if r:
+        return r.group('user')
+    else:
+        return None
+
+
+@memoize()
+def parse_nodes_cores(txt):
+    """
+    Return tuple (nodes, cores) from a (need)nodes string (or None)
+
+    Named nodes (eg node1234.cluster:ppn=4) count as a single node
+    """
+    m = NODES_CORES_REG.match(txt)
+    if m:
+        return int(m.group('nodes')), int(m.group('cores') or 1)
+
+    m = NAMEDNODES_CORES_REG.match(txt)
+    if m:
+        return 1, int(m.group('cores') or 1)
+
+    if NODES_NOCORES_REG.match(txt):
+        return 1, 1
+
+    return None
+
+
+@memoize()
+def parse_sec(txt):
+    """Memoized str2sec"""
+    return str2sec(txt)
+
+
+@memoize()
+def parse_byte(txt):
+    """Memoized str2byte"""
+    return str2byte(txt)
+
+
+@memoize()
+def parse_nodes_spec(txt, maxppn):
+    """
+    Parse the value of a -l nodes=<txt> resource, with maxppn the max ppn of the cluster
+
+    Returns tuple with
+        number of nodes
+        total number of cores
+        (possibly modified) nodes text
+        tuple of unknown ppn values (that were replaced by ppn=1)
+
+    Supported modifications:
+        ppn=all/full ; ppn=half
+    """
+    # syntax is a +-separated node_spec
+    # each node_spec has id[:prop[:prop[:...]]]
+    # id is integer (=number of nodes) or a single node name
+    # property: either special ppn=integer or something else/arbitrary
+
+    nrnodes = 0
+    nrcores = 0
+    newtxt = []
+    unknown = []
+    for node_spec in txt.split('+'):
+        props = node_spec.split(':')
+
+        ppns = [(x.split('=')[1], idx) for idx, x in enumerate(props) if x.startswith('ppn=')] or [(1, None)]
+
+        ppn = ppns[0][0]
+        try:
+            ppn = int(ppn)
+        except ValueError:
+            if ppn in ('all', 'full',):
+                ppn = maxppn
+            elif ppn == 'half':
+                ppn = max(1, int(maxppn / 2))
+            else:
+                unknown.append(ppn)
+                ppn = 1
+
+        ppntxt = 'ppn=%s' % ppn
+        if ppns[0][1] is None:
+            props.append(ppntxt)
+        else:
+            props[ppns[0][1]] = ppntxt
+
+        try:
+            nodes = int(props[0])
+        except (ValueError, IndexError):
+            # some description
+            nodes = 1
+
+        nrnodes += nodes
+        nrcores += nodes * ppn
+
+        newtxt.append(':'.join(props))
+
+    return nrnodes, nrcores, '+'.join(newtxt), tuple(unknown)
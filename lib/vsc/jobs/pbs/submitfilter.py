@@ -29,10 +29,14 @@ Module with submitfilter tools
 @author: Stijn De Weirdt (Ghent University)
 """
 import os
+import pwd
 import re
+import syslog
 
-from vsc.jobs.pbs.clusterdata import DEFAULT_SERVER_CLUSTER
-from vsc.jobs.pbs.clusterdata import get_cluster_maxppn, get_cluster_mpp
+from vsc.jobs.pbs.clusterdata import DEFAULT_SERVER_CLUSTER, MASTER_REGEXP
+from vsc.jobs.pbs.clusterdata import get_clusterdata, get_cluster_maxppn, get_cluster_mpp, get_cluster_overhead
+from vsc.jobs.pbs.clusterdata import load_registry
+from vsc.jobs.pbs.spec import memoize, parse_nodes_spec
 
 NODES_PREFIX = 'nodes'
 
@@ -49,6 +53,15 @@ PMEM = 'pmem'
 VMEM = 'vmem'
 MEM = 'mem'
 
+# bytes per read when copying the body of the script
+BODY_CHUNK_SIZE = 1 << 20
+
+# common resource requests, parsed for each cluster by warm_up
+WARM_RESOURCES = [
+    'nodes=1', 'nodes=1:ppn=1', 'nodes=1:ppn=all', 'nodes=1:ppn=half', 'nodes=2:ppn=all',
+    'vmem=full', 'pmem=half', 'walltime=1:00:00', 'walltime=72:00:00',
+]
+
 _warnings = []
 
 
@@ -70,6 +83,12 @@ def warn(*txt):
     _warnings.append(" ".join(txt))
 
 
+@memoize()
+def pbs_header_regexp(dprefix):
+    """Return the compiled regexp for header lines with the directive prefix"""
+    return re.compile(r"^" + dprefix + r"\s+([^#]*)\s*(?:#|$)")
+
+
 class SubmitFilter(object):
     """PBS script processing"""
 
@@ -79,6 +98,9 @@ class SubmitFilter(object):
 
         Sets the header (as list of lines), prebody (as text) and the remainder as iter instance,
         all options and list with index in header where they were found (index None means commandline)
+
+        stdin is a list or tuple of lines, a readline function or a file(-like) object;
+        the body of a file can be copied in chunks with copy_body
         """
 
         self.cmdlineopts = parse_commandline_list(arguments)  # list of (opt, val)
@@ -91,8 +113,14 @@ class SubmitFilter(object):
         self.allopts = []
         self.occur = []
 
+        # file to read the body from in chunks
+        self._stdin_file = None
+
         if isinstance(stdin, (list, tuple)):
             stdin_iter = iter(stdin)
+        elif hasattr(stdin, 'read'):
+            self._stdin_file = stdin
+            stdin_iter = iter(stdin.readline, '')
         else:
             stdin_iter = iter(stdin, '')
         self.stdin = stdin_iter
@@ -106,7 +134,7 @@ class SubmitFilter(object):
             dprefix = cmdlinedict.get('C', os.environ.get('PBS_DPREFIX', PBS_DIRECTIVE_PREFIX_DEFAULT))
 
         self.dprefix = dprefix
-        self.regexp = re.compile(r"^" + dprefix + r"\s+([^#]*)\s*(?:#|$)")
+        self.regexp = pbs_header_regexp(dprefix)
 
     def make_header(self, *opts):
         """Return header line (all args are joined with space)"""
@@ -154,6 +182,29 @@ class SubmitFilter(object):
         self.allopts.extend(self.cmdlineopts)
         self.occur.extend([None] * len(self.cmdlineopts))
 
+    def copy_body(self, out, chunk_size=BODY_CHUNK_SIZE):
+        """
+        Write the remainder of the script (after the prebody) to the out file(-like) object
+
+        The body of a file is copied in chunks of chunk_size bytes, not line per line.
+        Returns the number of bytes written.
+        """
+        size = 0
+        if self._stdin_file is None:
+            for line in self.stdin:
+                out.write(line)
+                size += len(line)
+        else:
+            read = self._stdin_file.read
+            while True:
+                chunk = read(chunk_size)
+                if not chunk:
+                    break
+                out.write(chunk)
+                size += len(chunk)
+
+        return size
+
     def gather_state(self, master_reg):
         """
         Build a total state as defined by the options from headers and commandline
@@ -234,6 +285,28 @@ def parse_resources(txt, cluster, resources, update=False):
     """
     newtxt = []
 
+    for key, newvalue, newvtxt, warnings in _parse_resources_list(txt, cluster):
+        for warning in warnings:
+            warn(warning)
+
+        if update or key not in resources:
+            resources.update(newvalue)
+
+        newtxt.append(newvtxt)
+
+    return ','.join(newtxt)
+
+
+@memoize()
+def _parse_resources_list(txt, cluster):
+    """
+    Parse the resources in txt for cluster (see parse_resources)
+
+    Returns tuple with for each resource: the key, the new values (as tuple of items),
+    the (possibly modified) resource text and the warnings
+    """
+    res = []
+
     # multiple resources in same txt are ',' separated
     for r in txt.split(','):
         values = r.split('=')
@@ -245,6 +318,10 @@ def parse_resources(txt, cluster, resources, update=False):
             # no '=' in resource
             value = None
 
+        # the warnings are returned, not collected
+        warnings = get_warnings()
+        nr_warnings = len(warnings)
+
         newvalue = {}
         if key == NODES_PREFIX:
             newvtxt = parse_resources_nodes(value, cluster, newvalue)
@@ -257,12 +334,12 @@ def parse_resources(txt, cluster, resources, update=False):
             else:
                 newvtxt = "%s=%s" % (key, value)
 
-        if update or key not in resources:
-            resources.update(newvalue)
+        new_warnings = tuple(warnings[nr_warnings:])
+        del warnings[nr_warnings:]
 
-        newtxt.append(newvtxt)
+        res.append((key, tuple(newvalue.items()), newvtxt, new_warnings))
 
-    return ','.join(newtxt)
+    return tuple(res)
 
 
 def _parse_mem_units(txt):
@@ -342,58 +419,20 @@ def parse_resources_nodes(txt, cluster, resources):
     Supported modifications:
         ppn=all/full ; ppn=half
     """
-    # syntax is a +-separated node_spec
-    # each node_spec has id[:prop[:prop[:...]]]
-    # id is integer (=number of nodes) or a single node name
-    # property: either special ppn=integer or something else/arbitrary
-
     maxppn = get_cluster_maxppn(cluster)
 
-    nrnodes = 0
-    nrcores = 0
-    newtxt = []
-    for node_spec in txt.split('+'):
-        props = node_spec.split(':')
-
-        ppns = [(x.split('=')[1], idx) for idx, x in enumerate(props) if x.startswith('ppn=')] or [(1, None)]
-
-        ppn = ppns[0][0]
-        try:
-            ppn = int(ppn)
-        except ValueError:
-            if ppn in ('all', 'full',):
-                ppn = maxppn
-            elif ppn == 'half':
-                ppn = max(1, int(maxppn / 2))
-            else:
-                # it's ok to always warn for this
-                # (even if it is not the final used option)
-                warn("Warning: unknown ppn (%s) detected, using ppn=1" % (ppn,))
-                ppn = 1
-
-        ppntxt = 'ppn=%s' % ppn
-        if ppns[0][1] is None:
-            props.append(ppntxt)
-        else:
-            props[ppns[0][1]] = ppntxt
-
-        try:
-            nodes = int(props[0])
-        except (ValueError, IndexError):
-            # some description
-            nodes = 1
-
-        nrnodes += nodes
-        nrcores += nodes * ppn
-
-        newtxt.append(':'.join(props))
+    nrnodes, nrcores, nodestxt, unknown_ppns = parse_nodes_spec(txt, maxppn)
+    for ppn in unknown_ppns:
+        # it's ok to always warn for this
+        # (even if it is not the final used option)
+        warn("Warning: unknown ppn (%s) detected, using ppn=1" % (ppn,))
 
     # update shared resources dict
     resources.update({
         '_nrnodes': nrnodes,
         '_nrcores': nrcores,
         '_ppn': max(1, int(nrcores / nrnodes)),
-        NODES_PREFIX: '+'.join(newtxt),
+        NODES_PREFIX: nodestxt,
     })
 
     return "%s=%s" % (NODES_PREFIX, resources[NODES_PREFIX])
@@ -428,3 +467,224 @@ def cluster_from_options(opts, master_reg):
          (DEFAULT_SERVER_CLUSTER, ', '.join(warntxt)))
 
     return DEFAULT_SERVER_CLUSTER
+
+
+class SysLogger(object):
+    """
+    Logger that only logs to syslog, with the syslog module.
+
+    The submitfilter runs for every qsub, and importing fancylogger (and vsc.utils)
+    takes most of its startup time.
+    """
+
+    def __init__(self, ident):
+        self.ident = ident
+        self._opened = False
+
+    def warn(self, msg, *args):
+        """Log msg (formatted with args) with warning priority"""
+        if not self._opened:
+            syslog.openlog(self.ident, syslog.LOG_PID, syslog.LOG_USER)
+            self._opened = True
+        if args:
+            msg = msg % args
+        syslog.syslog(syslog.LOG_WARNING, msg)
+
+    warning = warn
+
+
+syslogger = SysLogger('submitfilter')
+
+
+def make_new_header(sf, current_user=None):
+    """
+    Generate a new header by rewriting selected options and adding missing ones.
+
+    Takes a submitfilter instance and optionally the name of the submitting user (default: the current user),
+    returns the header as a list of strings (one line per element)
+    """
+    state, newopts = sf.gather_state(MASTER_REGEXP)
+
+    ppn = state['l'].get('_ppn', 1)
+    make = sf.make_header
+
+    # make a copy, leave original untouched
+    header = sf.header[:]
+
+    # resources: rewrite all resource lines
+    for (opt, orig), idx, new in zip(sf.allopts, sf.occur, newopts):
+        if opt == 'l' and idx is not None:
+            header[idx] = header[idx].replace(orig, new)
+
+    # fix missing
+    #
+    #    mail: force no mail when no mail is specified
+    if 'm' not in state:
+        header.extend([
+            "# No mail specified - added by submitfilter",
+            make("-m", "n"),
+        ])
+
+    if current_user is None:
+        current_user = pwd.getpwuid(os.getuid()).pw_name
+
+    # vmem: add default when not specified
+    if VMEM not in state['l'] and PMEM not in state['l'] and MEM not in state['l']:
+        (_, vpp) = get_cluster_mpp(state['_cluster'])
+        vmem = vpp * ppn
+        state['l'].update({
+            VMEM: "%s" % vmem,
+            '_%s' % VMEM: vmem,
+        })
+        header.extend([
+            "# No pmem or vmem limit specified - added by submitfilter (server found: %s)" % state['_cluster'],
+            make("-l", "%s=%s" % (VMEM, vmem)),
+        ])
+        syslogger.warn("submitfilter - no [vp]mem specified by user %s. adding %s", current_user, vmem)
+    else:
+        try:
+            requested_memory = (VMEM, state['l'][VMEM])
+        except KeyError:
+            try:
+                requested_memory = (PMEM, state['l'][PMEM])
+            except KeyError:
+                requested_memory = (MEM, state['l'][MEM])
+
+        syslogger.warn("submitfilter - %s requested by user %s was %s",
+                       requested_memory[0], current_user, requested_memory[1])
+
+    #  check whether VSC_NODE_PARTITION environment variable is set
+    if 'VSC_NODE_PARTITION' in os.environ:
+        header.extend([
+            "# Adding PARTITION as specified in VSC_NODE_PARTITION",
+            make("-W", "x=PARTITION:%s" % os.environ['VSC_NODE_PARTITION']),
+        ])
+
+    # test/warn:
+    cl_data = get_clusterdata(state['_cluster'], make_copy=False)
+
+    #    cores on cluster: warn when non-ideal number of cores is used (eg 8 cores on 6-core numa domain etc)
+    #    ideal: either less than NP_LCD or multiple of NP_LCD
+    np_lcd = cl_data['NP_LCD']
+
+    if ppn > np_lcd and ppn % np_lcd:
+        warn('The chosen ppn %s is not considered ideal: should use either lower than or multiple of %s' %
+             (ppn, np_lcd))
+
+    #    vmem too high: job will not start
+    overhead = get_cluster_overhead(state['_cluster'])
+    availmem = cl_data['TOTMEM'] - overhead
+    if state['l'].get('_%s' % VMEM) > availmem:
+        warn("Warning, requested %sb vmem per node, this is more than the available vmem (%sb), this"
+             " job will never start." % (state['l']['_%s' % VMEM], availmem))
+
+    #    TODO: mem too low on big-memory systems ?
+
+    return header
+
+
+def warm_up(resources=None):
+    """
+    Load the cluster registry, compile the header regexps and parse the common resources for each cluster,
+    e.g. before forking the processes that filter the scripts
+
+    Returns the cluster registry
+    """
+    if resources is None:
+        resources = WARM_RESOURCES
+
+    registry = load_registry()
+    pbs_header_regexp(os.environ.get('PBS_DPREFIX', PBS_DIRECTIVE_PREFIX_DEFAULT))
+    pbs_header_regexp(PBS_DIRECTIVE_PREFIX_DEFAULT)
+    for cluster in registry.clusterdata:
+        registry.get(cluster)
+        for txt in resources:
+            _parse_resources_list(txt, cluster)
+
+    return registry
+
+
+def filter_script(arguments, stdin, stdout, stderr, current_user=None):
+    """
+    Filter the job script read from stdin, write the new script to stdout and the warnings to stderr
+
+    Returns the exitcode
+    """
+    reset_warnings()
+
+    sf = SubmitFilter(arguments, stdin)
+    sf.parse_header()
+
+    header = make_new_header(sf, current_user=current_user)
+
+    # flush it so it doesn't get mixed with stderr
+    stdout.flush()
+    stderr.flush()
+
+    # prebody is not stripped of the newline
+    stdout.write("\n".join(header+[sf.prebody]))
+    sf.copy_body(stdout)
+
+    # print all generated warnings
+    # flush it so it doesn't get mixed with stderr
+    stdout.flush()
+    for warning in ["%s\n" % w for w in get_warnings()]:
+        stderr.write(warning)
+    stderr.flush()
+
+    return 0
+
+
+def filter_batch(jobs, outdir, current_user=None):
+    """
+    Filter many job scripts in one process
+
+    The scripts share the cluster data, the parsed resources and the header regexps.
+
+    jobs is an iterable of (name, arguments, script) tuples, with the script a filename or a file(-like) object;
+    the filtered script is written to outdir/name, and the warnings (if any) to outdir/name.err
+    a script that fails to filter has no outdir/name, the error is written to outdir/name.err
+
+    Returns the number of filtered scripts and the list of names of the scripts that failed
+    """
+    if current_user is None:
+        current_user = pwd.getpwuid(os.getuid()).pw_name
+
+    count = 0
+    failed = []
+    for name, arguments, script in jobs:
+        outname = os.path.join(outdir, name)
+        errname = "%s.err" % outname
+        stdin = None
+        try:
+            stdin = open(script) if isinstance(script, basestring) else script
+            with open(outname, 'w') as stdout:
+                with open(errname, 'w') as stderr:
+                    filter_script(arguments, stdin, stdout, stderr, current_user=current_user)
+        except (Exception, SystemExit) as err:
+            # SystemExit from the option parser for invalid arguments
+            failed.append(name)
+            if os.path.exists(outname):
+                os.unlink(outname)
+            with open(errname, 'w') as stderr:
+                stderr.write("ERROR: failed to filter job script %s: %s\n" % (name, err))
+            continue
+        finally:
+            if stdin is not None and stdin is not script:
+                stdin.close()
+
+        if not get_warnings():
+            os.unlink(errname)
+        count += 1
+
+    return count, failed
+
+
+def scripts_in_dir(directory, arguments):
+    """Return list of (name, arguments, filename) for filter_batch of all files in directory"""
+    res = []
+    for name in sorted(os.listdir(directory)):
+        filename = os.path.join(directory, name)
+        if os.path.isfile(filename):
+            res.append((name, arguments, filename))
+    return res
@@ -0,0 +1,95 @@
+#
+# Copyright 2017 Ghent University
+#
+# This file is part of vsc-jobs,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://www.vscentrum.be),
+# the Flemish Research Foundation (FWO) (http://www.fwo.be/en)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# https://github.com/hpcugent/vsc-jobs
+#
+# vsc-jobs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Library General Public License as
+# published by the Free Software Foundation, either version 2 of
+# the License, or (at your option) any later version.
+#
+# vsc-jobs is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public License
+# along with vsc-jobs. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Client side of the submitfilter daemon: sends the arguments, the environment and the job script
+to the daemon and returns the filtered job script.
+
+Only the python standard library is imported, to keep the startup of the client fast.
+
+Protocol (over the Unix socket):
+    request: one json line with the arguments and the environment, followed by the job script
+    reply: one json line with the exitcode and the warnings (or the error), followed by the filtered job script
+"""
+
+import json
+import os
+import socket
+
+SOCKET = '/var/run/vsc-submitfilter.sock'
+SOCKET_ENV = 'VSC_SUBMITFILTER_SOCKET'
+# seconds to wait for the daemon, before falling back to filtering in-process
+TIMEOUT = 10
+
+# the environment variables used by the submitfilter
+ENVIRONMENT = ('PBS_DEFAULT', 'PBS_DPREFIX', 'VSC_NODE_PARTITION')
+
+
+def socket_path():
+    """Return the path of the daemon socket"""
+    return os.environ.get(SOCKET_ENV, SOCKET)
+
+
+def filter_remote(arguments, script, path=None, timeout=TIMEOUT):
+    """
+    Filter the job script with the daemon
+
+    Returns (exitcode, stdout, stderr), or None if the daemon is not available or failed
+    """
+    if path is None:
+        path = socket_path()
+
+    request = {
+        'arguments': arguments,
+        'environment': dict([(x, os.environ[x]) for x in ENVIRONMENT if x in os.environ]),
+    }
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(path)
+        sock.sendall("%s\n%s" % (json.dumps(request), script))
+        sock.shutdown(socket.SHUT_WR)
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    except socket.error:
+        return None
+    finally:
+        sock.close()
+
+    header, _, stdout = ''.join(chunks).partition('\n')
+    try:
+        reply = json.loads(header)
+    except ValueError:
+        return None
+
+    if 'error' in reply:
+        return None
+
+    return reply['exitcode'], stdout, reply['stderr']
@@ -28,22 +28,35 @@ Some convenient tools
 
 @author: Stijn De Weirdt (Ghent University)
 """
+import array
 import re
-from vsc.utils import fancylogger
-
-_log = fancylogger.getLogger('pbs.tools', fname=False)
 
 # units
 UNIT_PREFIX = ['', 'k', 'm', 'g', 't']
 UNITS_LOWER = ['%sb' % x for x in UNIT_PREFIX]
 UNIT_REG = re.compile(r'^\s*(?P<value>\d+)?(?P<unit>%s)?\s*$' % '|'.join(UNITS_LOWER), re.I)
+# lowercase unit -> multiplier in bytes
+UNIT_MULTIPLIER = dict([(unit, 1024 ** idx) for idx, unit in enumerate(UNITS_LOWER)])
 
 # DD:HH:MM:SS regexp
 TIME_REG = re.compile(r"((((?P<day>\d+):)?(?P<hour>\d+):)?(?P<min>\d+):)?(?P<sec>\d+)")
+# multiplier in seconds for DD, HH, MM and SS field
+TIME_MULTIPLIER = (24 * 60 * 60, 60 * 60, 60, 1)
 
 
-def str2byte(txt):
-    """Simple conversion of string to integer as per units used in pbs"""
+def _get_log():
+    """
+    Return the logger
+
+    fancylogger is only imported when needed: the submitfilter uses str2byte and str2sec,
+    and importing vsc.utils takes most of its startup time
+    """
+    from vsc.utils import fancylogger
+    return fancylogger.getLogger('pbs.tools', fname=False)
+
+
+def _str2byte_reg(txt):
+    """str2byte using the regexp (handles all supported formats)"""
     r = UNIT_REG.search(txt)
     if r is None:
         return None
@@ -57,13 +70,27 @@ def str2byte(txt):
     unit = r.group('unit')
     if unit is None:
         unit = 'b'
-    unit_int = 1024 ** UNITS_LOWER.index(unit.lower())
+    unit_int = UNIT_MULTIPLIER[unit.lower()]
 
     return value * unit_int
 
 
-def str2sec(txt):
-    """Convert a DD:HH:MM:SS format to seconds"""
+def str2byte(txt):
+    """Simple conversion of string to integer as per units used in pbs"""
+    # fast path for the common NNNN<unit> and NNNN forms
+    multiplier = UNIT_MULTIPLIER.get(txt[-2:].lower(), None)
+    if multiplier is not None:
+        value = txt[:-2]
+        if value.isdigit():
+            return int(value) * multiplier
+    elif txt.isdigit():
+        return int(txt)
+
+    return _str2byte_reg(txt)
+
+
+def _str2sec_reg(txt):
+    """str2sec using the regexp (handles all supported formats)"""
     m = TIME_REG.search(txt)
     if m:
         totalwallsec = int(m.group('sec'))
@@ -78,3 +105,56 @@ def str2sec(txt):
         return None
 
 
+def str2sec(txt):
+    """Convert a DD:HH:MM:SS format to seconds"""
+    # fast path for the common (DD:)(HH:)(MM:)SS forms with only digits
+    parts = txt.split(':')
+    nrparts = len(parts)
+    if nrparts <= len(TIME_MULTIPLIER) and '' not in parts and ''.join(parts).isdigit():
+        return sum([int(part) * mult for part, mult in zip(parts, TIME_MULTIPLIER[-nrparts:])])
+
+    return _str2sec_reg(txt)
+
+
+def _convert_many(convert, txts, typecode, missing):
+    """
+    Apply convert on all txts, each distinct value is converted only once.
+    None values in txts are not converted, and give None.
+    """
+    converted = {None: None}
+    res = []
+    for txt in txts:
+        try:
+            value = converted[txt]
+        except KeyError:
+            value = converted[txt] = convert(txt)
+        res.append(value)
+
+    if typecode is None:
+        return res
+
+    if missing is None and None in res:
+        _get_log().raiseException("Can't convert %s values to array of type %s: missing value required" %
+                            (convert.__name__, typecode), ValueError)
+
+    return array.array(typecode, [missing if x is None else x for x in res])
+
+
+def str2byte_many(txts, typecode=None, missing=None):
+    """
+    Convert a column of values with str2byte
+
+    Returns a list (with None for values that can not be converted),
+    or if typecode is set, an array.array of that typecode (with missing for values that can not be converted)
+    """
+    return _convert_many(str2byte, txts, typecode, missing)
+
+
+def str2sec_many(txts, typecode=None, missing=None):
+    """
+    Convert a column of values with str2sec
+
+    Returns a list (with None for values that can not be converted),
+    or if typecode is set, an array.array of that typecode (with missing for values that can not be converted)
+    """
+    return _convert_many(str2sec, txts, typecode, missing)
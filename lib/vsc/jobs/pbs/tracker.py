@@ -0,0 +1,147 @@
+#
+# Copyright 2017 Ghent University
+#
+# This file is part of vsc-jobs,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://www.vscentrum.be),
+# the Flemish Research Foundation (FWO) (http://www.fwo.be/en)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# https://github.com/hpcugent/vsc-jobs
+#
+# vsc-jobs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Library General Public License as
+# published by the Free Software Foundation, either version 2 of
+# the License, or (at your option) any later version.
+#
+# vsc-jobs is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public License
+# along with vsc-jobs. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Incremental tracking of the pbs jobs, based on the job modification time
+"""
+from vsc.utils import fancylogger
+from vsc.jobs.pbs.interface import ALL_ATTRS, get_query, make_attrib_list, pbs
+from vsc.jobs.pbs.jobs import DEFAULT_ATTRS, derive_job, get_jobs
+
+_log = fancylogger.getLogger('pbs.tracker', fname=False)
+
+# events reported by JobTracker.poll
+EVENT_ADDED = 'added'
+EVENT_CHANGED = 'changed'
+EVENT_FINISHED = 'finished'
+
+# attribute used to detect modified jobs
+MTIME_ATTRS = ['mtime']
+
+# if more than this number of jobs is modified, fetch all jobs in one query
+# instead of one query per modified job
+MAX_SINGLE_FETCHES = 100
+
+
+class JobTracker(object):
+    """
+    Keep track of the jobs of a pbs server between polls.
+
+    Each poll only queries the mtime of all jobs; the other attributes are fetched
+    and derived only for new jobs and jobs with a different mtime. The derived data
+    of the unmodified jobs is reused.
+
+    jobs is the jobs dict with derived info of the last poll (like get_jobs_dict)
+    """
+
+    def __init__(self, query=None, attrs=None):
+        """
+        query is an optional query instance (default: create one when first needed)
+        attrs is passed as attrs to get_jobs (mtime is always added)
+        """
+        self._query = query
+        if attrs is None:
+            attrs = DEFAULT_ATTRS
+        if attrs != ALL_ATTRS and 'mtime' not in attrs:
+            attrs = list(attrs) + MTIME_ATTRS
+        self.attrs = attrs
+
+        self.jobs = {}
+        self.mtimes = {}
+
+        # number of derived jobs, for all polls
+        self.derived = 0
+
+    @property
+    def query(self):
+        """The (shared) query instance"""
+        if self._query is None:
+            self._query = get_query()
+        return self._query
+
+    def _get_mtime(self, jobdata):
+        """Return the mtime of the job, None if unknown"""
+        mtime = jobdata.get('mtime', None)
+        if mtime:
+            return mtime[0]
+        else:
+            return None
+
+    def _fetch(self, jobids):
+        """Return dict with the job data for the jobids"""
+        if not self.jobs or len(jobids) > MAX_SINGLE_FETCHES:
+            jobs = get_jobs(attrs=self.attrs, query=self.query)
+            return dict([(jobid, jobs[jobid]) for jobid in jobids if jobid in jobs])
+
+        attrib_list = make_attrib_list(self.attrs, DEFAULT_ATTRS, pbs)
+        jobs = {}
+        for jobid in jobids:
+            jobdata = self.query.getjob(jobid, attrib_list=attrib_list)
+            # job might have finished in between
+            if jobdata and 'job_state' in jobdata:
+                jobs[jobid] = jobdata
+        return jobs
+
+    def poll(self):
+        """
+        Update the jobs, return list of (event, jobid) tuples sorted by jobid
+
+        event is one of EVENT_ADDED, EVENT_CHANGED or EVENT_FINISHED
+        jobs without mtime are always considered changed
+        """
+        stamps = self.query.getjobs(attrib_list=make_attrib_list(MTIME_ATTRS, MTIME_ATTRS, pbs))
+
+        mtimes = dict([(jobid, self._get_mtime(jobdata)) for jobid, jobdata in stamps.items()])
+        modified = [jobid for jobid, mtime in mtimes.items()
+                    if mtime is None or jobid not in self.mtimes or self.mtimes[jobid] != mtime]
+
+        fetched = self._fetch(modified)
+
+        events = []
+        for jobid in modified:
+            if jobid in fetched:
+                jobdata = fetched[jobid]
+                jobdata['derived'] = derive_job(jobdata)
+                self.derived += 1
+
+                if jobid in self.jobs:
+                    events.append((EVENT_CHANGED, jobid))
+                else:
+                    events.append((EVENT_ADDED, jobid))
+                self.jobs[jobid] = jobdata
+                mtimes[jobid] = self._get_mtime(jobdata)
+            else:
+                # gone between the mtime query and the fetch
+                del mtimes[jobid]
+
+        for jobid in self.jobs.keys():
+            if jobid not in mtimes:
+                del self.jobs[jobid]
+                events.append((EVENT_FINISHED, jobid))
+
+        self.mtimes = mtimes
+        _log.debug("poll: %s jobs, %s modified, %s events" % (len(self.jobs), len(modified), len(events)))
+
+        return sorted(events, key=lambda x: x[1])
@@ -0,0 +1,123 @@
+#
+# Copyright 2017 Ghent University
+#
+# This file is part of vsc-jobs,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://www.vscentrum.be),
+# the Flemish Research Foundation (FWO) (http://www.fwo.be/en)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# https://github.com/hpcugent/vsc-jobs
+#
+# vsc-jobs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Library General Public License as
+# published by the Free Software Foundation, either version 2 of
+# the License, or (at your option) any later version.
+#
+# vsc-jobs is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public License
+# along with vsc-jobs. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Bounded pool of threads to call a function for many items, e.g. the filesystem writes or
+the remote requests of the moab scripts, which are bound by latency.
+"""
+import math
+import threading
+import time
+from Queue import Queue, Empty
+
+from vsc.utils.fancylogger import getLogger
+
+logger = getLogger(__name__)
+
+
+def percentile(values, pct):
+    """Return the pct-th percentile (nearest rank) of the sorted values, None if there are no values"""
+    if not values:
+        return None
+    idx = max(int(math.ceil(pct / 100.0 * len(values))) - 1, 0)
+    return values[min(idx, len(values) - 1)]
+
+
+class BoundedPool(object):
+    """
+    Call a function for each item with a bounded pool of threads.
+
+    Errors are captured per item, and the duration of each call is kept for the latency stats.
+    """
+
+    PERCENTILES = (50, 90, 99)
+
+    # logged (with the item) when the function fails
+    FAILURE = "Call failed for %s"
+
+    def __init__(self, workers=1):
+        """
+        @param workers: maximal number of calls at the same time (1: call in the calling thread)
+        """
+        self.workers = max(workers, 1)
+
+        self.latencies = []
+        self.results = {}
+        self.failed = {}
+
+    def _call(self, func, item):
+        """Call func for the item, keep result or error and the duration"""
+        start = time.time()
+        try:
+            self.results[item] = func(item)
+        except Exception, err:
+            logger.exception(self.FAILURE % (item,))
+            self.failed[item] = err
+        self.latencies.append(time.time() - start)
+
+    def run(self, items, func):
+        """
+        Call func(item) for each item.
+
+        @return: tuple with dict item -> result of func, dict item -> exception for the failed items
+        """
+        self.latencies = []
+        self.results = {}
+        self.failed = {}
+
+        if self.workers == 1:
+            for item in items:
+                self._call(func, item)
+        else:
+            todo = Queue()
+            for item in items:
+                todo.put(item)
+
+            def worker():
+                while True:
+                    try:
+                        item = todo.get_nowait()
+                    except Empty:
+                        return
+                    self._call(func, item)
+
+            threads = [threading.Thread(target=worker, name="worker-%s" % idx) for idx in range(self.workers)]
+            for thread in threads:
+                thread.daemon = True
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        return (self.results, self.failed)
+
+    def latency_stats(self, prefix='latency'):
+        """Return dict with the latency percentiles and maximum (in ms) of the last run, for the nagios stats"""
+        latencies = sorted(self.latencies)
+        stats = {}
+        if latencies:
+            for pct in self.PERCENTILES:
+                stats['%s_p%s' % (prefix, pct)] = int(percentile(latencies, pct) * 1000)
+            stats['%s_max' % prefix] = int(latencies[-1] * 1000)
+        return stats
@@ -32,6 +32,7 @@ PACKAGE = {
         'vsc-install >= 0.10.25',
     ],
     'install_requires': [
+        'jsonpickle',
         'lxml',
         # don't use installs from pbs-python from pypi
         # use local install from https://oss.trac.surfsara.nl/pbs_python/ticket/41#attachments
@@ -45,6 +46,7 @@ PACKAGE = {
         #'vsc-ldap-extension >= 1.10',
         'vsc-utils >= 1.4.6',
         'lxml',
+        'numpy',
     ],
     'tests_require': [
         'mock',
@@ -33,6 +33,7 @@ import sys
 from vsc.install.testing import TestCase
 
 from vsc.jobs.moab.checkjob import SshCheckjob, CheckjobInfo
+from vsc.jobs.moab.internal import JobRecord
 
 
 class TestSshCheckjob(TestCase):
@@ -51,3 +52,19 @@ class TestSshCheckjob(TestCase):
         self.assertEqual(checkjob._command('/opt/moab/bin/showq'), ['sudo', 'ssh', 'testuser@master1', '/opt/moab/bin/showq'])
         self.assertEquals(checkjob.info, CheckjobInfo)
         self.assertEquals(checkjob.info(), {})
+
+    def test_parser(self):
+        """Test the jobs are parsed into records"""
+        xml = ('<Data><job JobID="1" User="vsc40000" State="Idle"><req AllocNodeList="node1" ReqProcs="1"></req></job>'
+               '<job JobID="2" User="vsc40000" State="Idle"><req AllocNodeList="node2" ReqProcs="1"></req>'
+               '<req AllocNodeList="node3" ReqProcs="2"></req></job></Data>')
+        checkjob = SshCheckjob('master1', 'testuser', clusters={}, dry_run=True)
+        info = checkjob.parser('gengar', xml)
+
+        jobs = info['vsc40000']['gengar']
+        self.assertEqual(len(jobs), 2)
+        self.assertEqual(jobs[1][0], {'JobID': '2', 'User': 'vsc40000', 'State': 'Idle'})
+        self.assertEqual(jobs[1][1], [{'AllocNodeList': 'node2', 'ReqProcs': '1'},
+                                      {'AllocNodeList': 'node3', 'ReqProcs': '2'}])
+        self.assertTrue(isinstance(jobs[0][0], JobRecord))
+        self.assertTrue(jobs[0][0]._names is jobs[1][0]._names)
@@ -0,0 +1,130 @@
+#
+# Copyright 2017 Ghent University
+#
+# This file is part of vsc-jobs,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://www.vscentrum.be),
+# the Flemish Research Foundation (FWO) (http://www.fwo.be/en)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# https://github.com/hpcugent/vsc-jobs
+#
+# vsc-jobs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Library General Public License as
+# published by the Free Software Foundation, either version 2 of
+# the License, or (at your option) any later version.
+#
+# vsc-jobs is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public License
+# along with vsc-jobs. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Tests for the cached account page lookups
+"""
+import BaseHTTPServer
+import json
+import os
+import shutil
+import tempfile
+import threading
+from vsc.install.testing import TestCase
+
+from vsc.jobs.moab.accountpage import AccountpageResolver
+from vsc.utils.rest import RestClient
+
+VOS = {
+    'gvo00001': {'vsc_id': 'gvo00001', 'status': 'active', 'members': ['vsc40001', 'vsc40002']},
+    'gvo00002': {'vsc_id': 'gvo00002', 'status': 'active', 'members': ['vsc40003']},
+    'gvo00003': {'vsc_id': 'gvo00003', 'status': 'inactive', 'members': ['vsc40004']},
+}
+
+
+class StubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Stub account page: /vo/ and /vo/<vo_id>/"""
+
+    def do_GET(self):
+        self.server.paths.append(self.path)
+        parts = [x for x in self.path.split('/') if x]
+        if parts == ['vo']:
+            # the VO list without the members, like the summary of the real account page
+            body = [dict([(k, v) for (k, v) in vo.items() if k != 'members']) for vo in VOS.values()]
+        elif len(parts) == 2 and parts[0] == 'vo' and parts[1] in VOS:
+            body = VOS[parts[1]]
+        else:
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps(body))
+
+    def log_message(self, *args):
+        pass
+
+
+class TestAccountpageResolver(TestCase):
+    def setUp(self):
+        super(TestAccountpageResolver, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), StubHandler)
+        self.server.paths = []
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.client = RestClient('http://127.0.0.1:%s' % self.server.server_port)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmpdir)
+        super(TestAccountpageResolver, self).tearDown()
+
+    def test_vo(self):
+        """Test the VO lookups against the stub server, and the cache between runs"""
+        cache_file = os.path.join(self.tmpdir, 'accountpage.json.gz')
+        resolver = AccountpageResolver(self.client, cache_file=cache_file, workers=2)
+        user_to_vo = resolver.user_vo_map()
+        self.assertEqual(user_to_vo, {'vsc40001': 'gvo00001', 'vsc40002': 'gvo00001', 'vsc40003': 'gvo00002'})
+        self.assertEqual(sorted(self.server.paths), ['/vo', '/vo/gvo00001', '/vo/gvo00002'],
+                         msg='inactive VO not fetched')
+        self.assertEqual(resolver.vo_members('gvo00001'), ['vsc40001', 'vsc40002'])
+        self.assertEqual(resolver.requests, 3)
+        resolver.close()
+
+        # next run: everything from the cache
+        resolver = AccountpageResolver(self.client, cache_file=cache_file)
+        self.assertEqual(resolver.user_vo_map(), user_to_vo)
+        self.assertEqual(resolver.vo_members('gvo00002'), ['vsc40003'])
+        self.assertEqual(resolver.requests, 0)
+
+        # expired
+        resolver = AccountpageResolver(self.client, cache_file=cache_file, ttl=-1)
+        self.assertEqual(resolver.user_vo_map(), user_to_vo)
+        self.assertEqual(resolver.requests, 3)
+
+    def test_pickle_path(self):
+        """Test the pickle paths are resolved once, and failures are retried on use"""
+        calls = []
+
+        def path_function(location, user_id, rest_client):
+            calls.append(user_id)
+            self.assertTrue(rest_client is self.client)
+            if user_id == 'vsc40003':
+                raise KeyError(user_id)
+            return '/user/home/gent/vsc400/%s' % user_id
+
+        resolver = AccountpageResolver(self.client, workers=4)
+        users = ['vsc40001', 'vsc40002', 'vsc40003']
+        resolver.prefetch_pickle_paths('delcatty', users, path_function)
+        self.assertEqual(sorted(calls), users)
+
+        self.assertEqual(resolver.pickle_path('delcatty', 'vsc40001', path_function), '/user/home/gent/vsc400/vsc40001')
+        self.assertEqual(len(calls), 3, msg='prefetched path is cached')
+        self.assertErrorRegex(KeyError, 'vsc40003', resolver.pickle_path, 'delcatty', 'vsc40003', path_function)
+        self.assertEqual(len(calls), 4)
@@ -0,0 +1,162 @@
+#
+# Copyright 2017 Ghent University
+#
+# This file is part of vsc-jobs,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://www.vscentrum.be),
+# the Flemish Research Foundation (FWO) (http://www.fwo.be/en)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# https://github.com/hpcugent/vsc-jobs
+#
+# vsc-jobs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Library General Public License as
+# published by the Free Software Foundation, either version 2 of
+# the License, or (at your option) any later version.
+#
+# vsc-jobs is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public License
+# along with vsc-jobs. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Tests for the digests, encoding and writes of the user filesets
+"""
+import os
+import shutil
+import tempfile
+import time
+from vsc.install.testing import TestCase
+
+from vsc.jobs.moab.fileset import DigestStore, FilesetWriter, PayloadEncoder, per_thread
+from vsc.jobs.moab.fileset import payload_digest, touch_on_gpfs, write_on_gpfs
+from vsc.jobs.moab.internal import JobRecord
+from vsc.utils.cache import FileCache
+
+
+class FakeGpfs(object):
+    """Only what touch_on_gpfs and write_on_gpfs need"""
+
+    def __init__(self):
+        self.chmods = []
+
+    def is_symlink(self, path):
+        return os.path.islink(path)
+
+    def chmod(self, mode, filename):
+        self.chmods.append(filename)
+        os.chmod(filename, mode)
+
+    def chown(self, uid, gid, filename):
+        pass
+
+
+class TestFileset(TestCase):
+    def setUp(self):
+        super(TestFileset, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        super(TestFileset, self).tearDown()
+
+    def test_digest(self):
+        """Test the digest depends on the content only"""
+        job = {'JobID': '1', 'Class': 'short'}
+        info1 = {'vsc40000': {'gengar': {'Running': [job]}}, 'vsc40001': {}}
+        info2 = {'vsc40001': {}, 'vsc40000': {'gengar': {'Running': [JobRecord(['Class', 'JobID'], ['short', '1'])]}}}
+        self.assertEqual(payload_digest(info1), payload_digest(info2))
+
+        info2['vsc40000']['gengar']['Running'][0]['Class'] = 'long'
+        self.assertNotEqual(payload_digest(info1), payload_digest(info2))
+
+    def test_digest_store(self):
+        """Test the digests are kept between runs"""
+        filename = os.path.join(self.tmpdir, 'digests.json.gz')
+        digests = DigestStore(filename)
+        self.assertFalse(digests.unchanged('vsc40000', 'abc'))
+        digests.update('vsc40000', 'abc')
+        digests.close()
+
+        digests = DigestStore(filename)
+        self.assertTrue(digests.unchanged('vsc40000', 'abc'))
+        self.assertFalse(digests.unchanged('vsc40000', 'def'))
+        self.assertFalse(digests.unchanged('vsc40001', 'abc'))
+        digests.close()
+
+        digests = DigestStore(filename)
+        self.assertFalse(digests.unchanged('vsc40000', 'abc'), msg='only users of the last run are kept')
+
+    def test_touch(self):
+        """Test touching the stored file, also through the login mount point symlink"""
+        login = os.path.join(self.tmpdir, 'login')
+        gpfs = os.path.join(self.tmpdir, 'gpfs')
+        # the login mount point is the NFS mount of the same storage, here just another directory
+        os.makedirs(os.path.join(gpfs, 'vsc40000'))
+        os.makedirs(os.path.join(login, 'vsc40000'))
+        os.symlink(os.path.join(login, 'vsc40000'), os.path.join(self.tmpdir, 'home'))
+
+        path = os.path.join(self.tmpdir, 'home')
+        filename = os.path.join(gpfs, 'vsc40000', '.showq.json.gz')
+
+        self.assertFalse(touch_on_gpfs('vsc40000', path, FakeGpfs(), login, gpfs, '.showq.json.gz'),
+                         msg='missing file is not touched')
+
+        open(filename, 'w').close()
+        os.utime(filename, (1000, 1000))
+        self.assertTrue(touch_on_gpfs('vsc40000', path, FakeGpfs(), login, gpfs, '.showq.json.gz', dry_run=True))
+        self.assertEqual(os.stat(filename).st_mtime, 1000)
+
+        self.assertTrue(touch_on_gpfs('vsc40000', path, FakeGpfs(), login, gpfs, '.showq.json.gz'))
+        self.assertTrue(os.stat(filename).st_mtime > 1000)
+
+    def test_encoder(self):
+        """Test shared payloads are encoded once, and can be read with FileCache"""
+        vo_info = {'vsc40000': {}, 'vsc40001': {'gengar': {'Running': [JobRecord(['JobID'], ['1'])]}}}
+        vo_map = {'vsc40000': '', 'vsc40001': ''}
+        own_info = {'vsc40002': {}}
+        own_map = {'vsc40002': ''}
+
+        encoder = PayloadEncoder('showq', ignore=['timeinfo'])
+        digests = [encoder.digest((vo_info, vo_map)), encoder.digest((vo_info, vo_map)),
+                   encoder.digest((own_info, own_map))]
+        self.assertEqual(digests[0], digests[1])
+        self.assertNotEqual(digests[0], digests[2])
+
+        vo_info['timeinfo'] = 123
+        self.assertEqual(payload_digest((vo_info, vo_map), ignore=['timeinfo']), digests[0],
+                         msg='timeinfo not in the digest')
+
+        gpfs = FakeGpfs()
+        os.makedirs(os.path.join(self.tmpdir, 'vsc40000'))
+        os.makedirs(os.path.join(self.tmpdir, 'vsc40001'))
+        for user in ['vsc40000', 'vsc40001']:
+            write_on_gpfs(user, os.path.join(self.tmpdir, user), encoder.encode((vo_info, vo_map)),
+                          gpfs, '/login', '/gpfs', '.showq.json.gz')
+        self.assertEqual(encoder.encoded, 1, msg='shared payload encoded once')
+        self.assertEqual(len(gpfs.chmods), 2)
+
+        data = FileCache(os.path.join(self.tmpdir, 'vsc40001', '.showq.json.gz')).load('showq')[1]
+        self.assertEqual(data[0], {'vsc40000': {}, 'vsc40001': {'gengar': {'Running': [{'JobID': '1'}]}},
+                                   'timeinfo': 123})
+        self.assertEqual(data[1], vo_map)
+
+    def test_per_thread(self):
+        """Test each writer thread gets its own instance"""
+        gpfs = per_thread(FakeGpfs)
+        self.assertTrue(gpfs() is gpfs(), msg='same instance in the same thread')
+
+        users = ['vsc4%04d' % x for x in range(20)]
+        instances = {}
+
+        def store(user):
+            time.sleep(0.01)
+            instances[user] = gpfs()
+
+        FilesetWriter(workers=4).run(users, store)
+        self.assertTrue(1 < len(set([id(x) for x in instances.values()])) <= 4, msg='one instance per writer')
+        self.assertFalse(gpfs() in instances.values(), msg='writers do not use the instance of this thread')
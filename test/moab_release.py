@@ -0,0 +1,139 @@
+#
+# Copyright 2017 Ghent University
+#
+# This file is part of vsc-jobs,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://www.vscentrum.be),
+# the Flemish Research Foundation (FWO) (http://www.fwo.be/en)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# https://github.com/hpcugent/vsc-jobs
+#
+# vsc-jobs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Library General Public License as
+# published by the Free Software Foundation, either version 2 of
+# the License, or (at your option) any later version.
+#
+# vsc-jobs is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public License
+# along with vsc-jobs. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Tests for the release counters and the batched release of the job holds
+"""
+import os
+import shutil
+import tempfile
+from mock import patch
+from vsc.install.testing import TestCase
+
+from vsc.jobs.moab.release import ReleaseCounters, parse_release_output, release_jobs
+
+FAKE_MJOBCTL = """#!/bin/sh
+# fake mjobctl -u jobid[,jobid...]: fails for the jobs starting with bad
+echo "$@" >> "$(dirname "$0")/calls"
+rc=0
+for jid in $(echo "$2" | tr ',' ' '); do
+    case $jid in
+        bad*) echo "ERROR:  cannot release hold on job $jid"; rc=1;;
+        *) echo "holds modified for job $jid";;
+    esac
+done
+exit $rc
+"""
+
+
+class TestReleaseCounters(TestCase):
+    def setUp(self):
+        super(TestReleaseCounters, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'release_jobholds.json.gz')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        super(TestReleaseCounters, self).tearDown()
+
+    def counters(self, now, expiry=0):
+        with patch('vsc.jobs.moab.release.time.time', return_value=now):
+            return ReleaseCounters(self.filename, expiry=expiry)
+
+    def test_counters(self):
+        """Test the counters are kept between runs, and expire when the job is gone"""
+        counters = self.counters(1000)
+        self.assertEqual(counters.release('1.master'), 1)
+        self.assertEqual(counters.release('2.master'), 1)
+        self.assertEqual(counters.seen('3.master'), None, msg='jobs never in hold have no counter')
+        counters.close()
+        self.assertEqual(sorted(counters.counters.keys()), ['1.master', '2.master'])
+
+        counters = self.counters(2000)
+        self.assertEqual(counters.release('1.master'), 2)
+        # no longer in hold, but keeps its counter
+        self.assertEqual(counters.seen('2.master'), 1)
+        counters.close()
+
+        counters = self.counters(3000)
+        self.assertEqual(counters.release('2.master'), 2, msg='counter kept while the job was not in hold')
+        counters.close()
+        self.assertEqual(counters.counters, {'2.master': [2, 3000]}, msg='gone job expired')
+
+    def test_expiry(self):
+        """Test the counters of jobs not seen are kept for expiry seconds"""
+        counters = self.counters(1000, expiry=600)
+        counters.release('1.master')
+        counters.close()
+
+        counters = self.counters(1500, expiry=600)
+        self.assertEqual(counters.expire(), 0)
+        counters.close()
+
+        counters = self.counters(1700, expiry=600)
+        self.assertEqual(counters.expire(), 1)
+
+    def test_parse(self):
+        """Test the per job result from the combined output"""
+        jobids = ['1.master15.delcatty.gent.vsc', '2.master15.delcatty.gent.vsc', '3.master15.delcatty.gent.vsc']
+        output = "\n".join([
+            "holds modified for job 1",
+            "ERROR:  invalid job specified (2.master15.delcatty.gent.vsc)",
+            "holds modified for job 3 (invalidated reservation)",
+        ])
+        self.assertEqual(parse_release_output(jobids, 1, output), {
+            '1.master15.delcatty.gent.vsc': True,
+            '2.master15.delcatty.gent.vsc': False,
+            '3.master15.delcatty.gent.vsc': True,
+        })
+        self.assertFalse(parse_release_output(jobids, 0, "cannot release job 3")['3.master15.delcatty.gent.vsc'])
+        self.assertTrue(parse_release_output(jobids, 0, '')['3.master15.delcatty.gent.vsc'])
+
+    def test_release(self):
+        """Test the batched release with a fake mjobctl"""
+        mjobctl = os.path.join(self.tmpdir, 'mjobctl')
+        open(mjobctl, 'w').write(FAKE_MJOBCTL)
+        os.chmod(mjobctl, 0755)
+        calls = os.path.join(self.tmpdir, 'calls')
+
+        jobids = ['%s.master' % x for x in range(1, 8)] + ['bad1.master']
+        released = release_jobs([mjobctl], jobids, batch_size=3)
+        self.assertEqual(sorted(released.keys()), sorted(jobids))
+        self.assertEqual([x for x in jobids if not released[x]], ['bad1.master'])
+        self.assertEqual(open(calls).read().splitlines(), [
+            '-u 1.master,2.master,3.master',
+            '-u 4.master,5.master,6.master',
+            '-u 7.master,bad1.master',
+        ])
+
+        # one job per command, in parallel
+        os.unlink(calls)
+        released = release_jobs([mjobctl], jobids, batch_size=1, workers=4)
+        self.assertEqual([x for x in jobids if not released[x]], ['bad1.master'])
+        self.assertEqual(len(open(calls).read().splitlines()), 8)
+
+        os.unlink(calls)
+        self.assertTrue(all(release_jobs([mjobctl], jobids, dry_run=True).values()))
+        self.assertFalse(os.path.exists(calls))
@@ -0,0 +1,118 @@
+#
+# Copyright 2017 Ghent University
+#
+# This file is part of vsc-jobs,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://www.vscentrum.be),
+# the Flemish Research Foundation (FWO) (http://www.fwo.be/en)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# https://github.com/hpcugent/vsc-jobs
+#
+# vsc-jobs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Library General Public License as
+# published by the Free Software Foundation, either version 2 of
+# the License, or (at your option) any later version.
+#
+# vsc-jobs is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public License
+# along with vsc-jobs. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Tests for the pool of ssh sessions
+"""
+from mock import patch
+
+import os
+from vsc.install.testing import TestCase
+
+from vsc.jobs.moab.session import LocalSession, SessionPool, SshSession
+from vsc.jobs.moab.showq import SshShowq
+
+
+class TestSessionPool(TestCase):
+    def setUp(self):
+        super(TestSessionPool, self).setUp()
+        self.now = [1000.0]
+        self.time_patcher = patch('vsc.jobs.moab.session.time.time', side_effect=lambda: self.now[0])
+        self.time_patcher.start()
+        self.pool = SessionPool(session_class=LocalSession, idle_timeout=300, check_interval=60)
+
+    def tearDown(self):
+        self.pool.close()
+        self.time_patcher.stop()
+        super(TestSessionPool, self).tearDown()
+
+    def test_reuse(self):
+        """Test the session is reused across commands and clusters"""
+        showq = SshShowq('master1', 'testuser', clusters={}, dry_run=True, pool=self.pool)
+        self.assertEqual(showq._command('/opt/moab/bin/showq'), ['/opt/moab/bin/showq'])
+
+        session = self.pool.session('testuser@master1')
+        for _ in range(10):
+            self.now[0] += 10
+            showq._command('/opt/moab/bin/showq')
+            self.assertTrue(self.pool.session('testuser@master1') is session)
+        self.assertEqual(session.starts, 1, msg='session started only once')
+
+        other = self.pool.session('testuser@master2')
+        self.assertFalse(other is session, msg='one session per target')
+
+        control_dir = self.pool.control_dir
+        self.pool.close()
+        self.assertFalse(os.path.exists(control_dir), msg='temporary control dir removed')
+
+    def test_idle(self):
+        """Test idle sessions are closed"""
+        session = self.pool.session('testuser@master1')
+        self.now[0] += 301
+        self.pool.session('testuser@master2')
+        self.assertFalse(session.check(), msg='idle session stopped')
+
+        new = self.pool.session('testuser@master1')
+        self.assertFalse(new is session, msg='new session after idle timeout')
+
+    def test_health(self):
+        """Test broken sessions are restarted after the health check"""
+        session = self.pool.session('testuser@master1')
+        session.stop()
+
+        self.now[0] += 30
+        self.assertTrue(self.pool.session('testuser@master1') is session, msg='no check before check_interval')
+
+        self.now[0] += 31
+        new = self.pool.session('testuser@master1')
+        self.assertFalse(new is session, msg='broken session replaced')
+        self.assertTrue(new.check())
+
+    def test_ssh(self):
+        """Test the ssh commands"""
+        session = SshSession('testuser@master1', '/tmp/ctl', persist=10)
+        self.assertEqual(session.command(['/opt/moab/bin/showq']),
+                         ['sudo', 'ssh', '-o', 'ControlPath=/tmp/ctl/testuser@master1.sock',
+                          'testuser@master1', '/opt/moab/bin/showq'])
+
+        with patch('vsc.jobs.moab.session.subprocess.call', return_value=0) as mocked_call:
+            self.assertTrue(session.start())
+            cmd = mocked_call.call_args[0][0]
+            kwargs = mocked_call.call_args[1]
+
+        self.assertTrue('ControlMaster=yes' in cmd)
+        self.assertTrue('ControlPersist=10' in cmd)
+        self.assertEqual(kwargs['stdout'].name, os.devnull, msg='output of the backgrounded master not read')
+        self.assertEqual(kwargs['stderr'].name, os.devnull, msg='output of the backgrounded master not read')
+
+        with patch('vsc.jobs.moab.session.RunAsyncLoop.run', return_value=(0, '')) as mocked_run:
+            self.assertTrue(session.check())
+            cmds = [x[0][0] for x in mocked_run.call_args_list]
+        self.assertEqual(cmds[0][-3:], ['-O', 'check', 'testuser@master1'])
+
+        # failed master: pool falls back to plain command over the control path
+        pool = SessionPool(control_dir='/tmp/ctl')
+        with patch('vsc.jobs.moab.session.subprocess.call', return_value=255):
+            self.assertEqual(pool.command('testuser@master1', ['showq']), session.command(['showq']))
@@ -27,15 +27,33 @@
 @author: stdweird
 """
 import os
+import shutil
 import sys
+import tempfile
 from vsc.install.testing import TestCase
 
 from vsc.jobs.pbs.clusterdata import get_clusterdata, \
     get_cluster_maxppn, get_cluster_mpp, get_cluster_overhead, \
     MIN_VMEM, DEFAULT_SERVER_CLUSTER, DEFAULT_SERVER, CLUSTERDATA
+from vsc.jobs.pbs.clusterdata import ClusterRegistry, get_cluster, load_registry, read_clusterdata
+from vsc.jobs.pbs.submitfilter import parse_resources
 
 SORTED_CLUSTERS = ['banette', 'delcatty', 'golett', 'muk', 'phanpy', 'raichu', 'shuppet', 'swalot']
 
+CONFIG = """
+[delcatty]
+physmem = 66045320kb
+totmem = 87016832kb
+availmem = 84240480kb
+np = 16
+np_lcd = 4
+
+[mycluster]
+PHYSMEM = 4gb
+TOTMEM = 8gb
+DEFMAXNP = 4
+"""
+
 class TestPbsClusterdata(TestCase):
     def setUp(self):
         # insert test cluster to test
@@ -104,3 +122,60 @@ class TestPbsClusterdata(TestCase):
                         ('zzzmytest', (2116052906, 2339749077)),
                         ('zzzmytestavail', (1902719573, 2126415744))]:
             self.assertEqual(get_cluster_mpp(cl), mpp, msg="expected mpp %s for %s" % (mpp, cl,))
+
+    def test_registry(self):
+        """Test the precomputed cluster records"""
+        for cluster in CLUSTERDATA.keys():
+            record = get_cluster(cluster)
+            self.assertTrue(get_cluster(cluster) is record, msg='same record for %s' % cluster)
+            self.assertEqual(dict(record.data), CLUSTERDATA[cluster], msg='data of %s' % cluster)
+            self.assertEqual((record.maxppn, record.overhead, (record.ppp, record.vpp)),
+                             (get_cluster_maxppn(cluster), get_cluster_overhead(cluster), get_cluster_mpp(cluster)))
+
+        self.assertEqual(get_cluster('doesnotexists').name, DEFAULT_SERVER_CLUSTER)
+        self.assertErrorRegex(AttributeError, "can't set attribute", setattr, get_cluster('muk'), 'maxppn', 1)
+        # the data handed out can not change the shared record
+        get_clusterdata('muk', make_copy=False)['NP'] = 1
+        self.assertEqual(get_clusterdata('muk', make_copy=False), CLUSTERDATA['muk'])
+
+        # replaced cluster data is picked up, also by the memoized resource parsing
+        orig = CLUSTERDATA['zzzmytest']
+        self.assertEqual(parse_resources('nodes=1:ppn=all', 'zzzmytest', {}), 'nodes=1:ppn=48')
+        CLUSTERDATA['zzzmytest'] = dict(orig, DEFMAXNP=24)
+        self.assertEqual(get_cluster_maxppn('zzzmytest'), 24)
+        self.assertEqual(parse_resources('nodes=1:ppn=all', 'zzzmytest', {}), 'nodes=1:ppn=24')
+        CLUSTERDATA['zzzmytest'] = orig
+        self.assertEqual(get_cluster_maxppn('zzzmytest'), 48)
+        self.assertEqual(parse_resources('nodes=1:ppn=all', 'zzzmytest', {}), 'nodes=1:ppn=48')
+
+        # the built-in data of the default cluster is used when it is not in the cluster data
+        registry = ClusterRegistry({'mycluster': CLUSTERDATA['muk']})
+        self.assertEqual(registry.get('golett').name, DEFAULT_SERVER_CLUSTER)
+        self.assertEqual(dict(registry.get('golett').data), CLUSTERDATA[DEFAULT_SERVER_CLUSTER])
+        self.assertErrorRegex(ValueError, 'No data for the default cluster', ClusterRegistry, {},
+                              default='nosuchcluster')
+
+    def test_config(self):
+        """Test the cluster data from a config file"""
+        tmpdir = tempfile.mkdtemp()
+        filename = os.path.join(tmpdir, 'clusterdata.conf')
+        open(filename, 'w').write(CONFIG)
+
+        clusterdata = read_clusterdata(filename)
+        self.assertEqual(clusterdata['delcatty'], CLUSTERDATA['delcatty'])
+        self.assertEqual(clusterdata['mycluster'], {'PHYSMEM': 4 << 30, 'TOTMEM': 8 << 30, 'DEFMAXNP': 4})
+
+        os.environ['VSC_PBS_CLUSTERDATA'] = filename
+        try:
+            load_registry()
+            self.assertEqual(get_cluster_mpp('mycluster'), (1 << 30, (3 << 30) // 2))
+            self.assertEqual(get_cluster_mpp('delcatty'), (4049213952, 4720302336))
+            # unknown (and only built-in) clusters use the default cluster
+            self.assertEqual(get_cluster('golett').name, DEFAULT_SERVER_CLUSTER)
+        finally:
+            del os.environ['VSC_PBS_CLUSTERDATA']
+            shutil.rmtree(tmpdir)
+            load_registry()
+
+        self.assertEqual(get_cluster('golett').name, 'golett')
+        self.assertErrorRegex(IOError, "Can't read", read_clusterdata, filename)
@@ -28,18 +28,17 @@
 """
 from mock import patch
 
+import gc
 import os
 import sys
+import time
 from vsc.install.testing import TestCase
 
-from vsc.jobs.pbs.jobs import DEFAULT_ATTRS, get_jobs, get_jobs_dict
+from vsc.jobs.pbs.jobs import DEFAULT_ATTRS, USERJOB_CATEGORIES, get_jobs, get_jobs_dict, get_userjob_stats, JobTable
+from vsc.jobs.pbs.jobs import derive_job
+from vsc.jobs.pbs.spec import clear_caches
 
-
-class JobData(dict):
-    """Mocked job class to mimick the return value of get_query"""
-
-    def get_nodes(self):
-        return self.get('exec_host')
+from fake_query import JobData
 
 
 def wrap_jobdata(jobs):
@@ -52,6 +51,63 @@ def wrap_jobdata(jobs):
     return res
 
 
+def userjob_stats_loop(jobs):
+    """The stats per user with a loop over the derived data of the jobs, to compare with"""
+    cat_map = dict([(x[0], idx) for idx, x in enumerate(USERJOB_CATEGORIES)])
+    faults = []
+    stats = {}
+    for name, jobdata in jobs.items():
+        derived = jobdata['derived']
+        if 'user' not in derived:
+            faults.append(('Missing user in job %s' % name, jobdata))
+            continue
+
+        ustat = stats.setdefault(derived['user'], [0] * (len(USERJOB_CATEGORIES) - 1) + [[]])
+        totalwalltimesec = derived.get('totalwalltimesec', 0)
+        if 'totalwalltimesec' not in derived:
+            faults.append(('Missing totalwalltimesec in job %s. Counts as 0.' % (name), jobdata))
+
+        if 'nodes' not in derived:
+            faults.append(('Missing nodes/cores in job %s. Marked as other.' % (name), jobdata))
+            ustat[-1].append(name)
+            continue
+
+        corenodes = derived['nodes'] * derived['cores']
+        if 'exec_hosts' in derived and corenodes != sum(derived['exec_hosts'].values()):
+            faults.append(('Mismatch requested %s /running %s cores in job %s. Marked as other.' %
+                           (corenodes, sum(derived['exec_hosts'].values()), name), jobdata))
+            ustat[-1].append(name)
+            continue
+
+        state = {'R': 'R', 'Q': 'Q', 'H': 'Q'}.get(derived['state'])
+        if state is None:
+            faults.append(('Not counting job with state %s in job %s. Marked as other.' % (name, derived['state']),
+                           jobdata))
+            ustat[-1].append(name)
+            continue
+
+        ustat[cat_map[state]] += 1
+        ustat[cat_map['%sN' % state]] += derived['nodes']
+        ustat[cat_map['%sC' % state]] += derived['cores']
+        ustat[cat_map['%sP' % state]] += corenodes * totalwalltimesec
+
+    return stats, faults
+
+
+def best_time(func, repeat=3):
+    """Return the best wall time of repeat calls of func, like timeit without the garbage collector"""
+    times = []
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.time()
+            func()
+            times.append(time.time() - start)
+    finally:
+        gc.enable()
+    return min(times)
+
+
 class TestJobs(TestCase):
     @patch('vsc.jobs.pbs.jobs.pbs')
     @patch('vsc.jobs.pbs.interface.PBSQuery.__init__', return_value=None)
@@ -143,3 +199,104 @@ class TestJobs(TestCase):
                 'used_walltime': 344,
                 'user': 'vsc40075',
             }, msg='first job has expected derived data')
+
+    def _master3_jobs(self):
+        """Return jobs dict with derived data from the master3 dump"""
+        data = {}
+        execfile(os.path.join(os.path.dirname(__file__), 'testpbs', 'master3_dump_20130316.py'), data)
+        jobs = {}
+        for jobid, value in data['jobs'].items():
+            jd = JobData()
+            jd.update(value)
+            if 'exec_host' in jd:
+                jd['exec_host'] = jd['exec_host'][0].split('+')
+            jobs[jobid] = jd
+
+        # add some faulty jobs
+        jobs['nouser.master3'] = JobData({'job_state': ['R'], 'Job_Owner': ['@'], 'Resource_List': {}})
+        jobs['nowall.master3'] = JobData({'job_state': ['H'], 'Job_Owner': ['vsc40001@login'],
+                                          'Resource_List': {'nodes': ['2:ppn=4']}})
+        jobs['nonodes.master3'] = JobData({'job_state': ['Q'], 'Job_Owner': ['vsc40001@login'],
+                                           'Resource_List': {'walltime': ['1:00:00']}})
+        jobs['mismatch.master3'] = JobData({'job_state': ['R'], 'Job_Owner': ['vsc40001@login'],
+                                            'Resource_List': {'nodes': ['2:ppn=4'], 'walltime': ['1:00:00']},
+                                            'exec_host': ['node1/0', 'node1/1']})
+        jobs['exiting.master3'] = JobData({'job_state': ['E'], 'Job_Owner': ['vsc40001@login'],
+                                           'Resource_List': {'nodes': ['1'], 'walltime': ['1:00:00']}})
+
+        with patch('vsc.jobs.pbs.jobs.get_jobs', return_value=jobs):
+            return get_jobs_dict()
+
+    def test_jobtable(self):
+        """Test JobTable userjob_stats gives the stats of the derived data"""
+        jobs = self._master3_jobs()
+
+        stats, faults = userjob_stats_loop(jobs)
+        self.assertEqual(len(faults), 5, msg='expected faults %s' % [x[0] for x in faults])
+
+        self.assertEqual(get_userjob_stats(jobs=jobs), (stats, faults, USERJOB_CATEGORIES))
+
+        table = JobTable.from_jobs(jobs)
+        self.assertEqual(len(table), len(jobs), msg='all jobs in table')
+        self.assertTrue(len(table.users) < len(jobs), msg='users are interned')
+
+        tstats, tfaults, tcategories = table.userjob_stats()
+        self.assertEqual(tstats, stats, msg='same stats')
+        self.assertEqual(tcategories, USERJOB_CATEGORIES, msg='same categories')
+        self.assertEqual(tfaults, [(msg, self._fault_jobid(msg)) for msg, _ in faults], msg='same faults, with jobid')
+
+        # the columns only need the query results, not the derived data
+        for jobdata in jobs.values():
+            del jobdata['derived']
+        self.assertEqual(JobTable.from_jobs(jobs).userjob_stats(), (tstats, tfaults, tcategories))
+
+        self.assertEqual(JobTable().userjob_stats()[:2], ({}, []), msg='empty table')
+
+    def _fault_jobid(self, msg):
+        """Get the jobid from a fault message"""
+        for jobid in ['nouser', 'nowall', 'nonodes', 'mismatch', 'exiting']:
+            if jobid in msg:
+                return '%s.master3' % jobid
+
+    def test_jobtable_benchmark(self):
+        """Time JobTable statistics for a big backlog, compared to the loop over the derived data"""
+        jobs = {}
+        nr = 20000
+        for idx in range(nr):
+            nodes = 1 + idx % 4
+            jobs['%s.master' % idx] = JobData({
+                'Job_Owner': ['vsc4%04d@login' % (idx % 500)],
+                'job_state': ['RQH'[idx % 3]],
+                'Resource_List': {'nodes': ['%s:ppn=%s' % (nodes, 1 + idx % 16)],
+                                  'walltime': ['%s:00:00' % (1 + idx % 72)]},
+            })
+
+        def derive_jobs():
+            """The derived data per job, as added by get_jobs"""
+            clear_caches()
+            for jobdata in jobs.values():
+                jobdata['derived'] = derive_job(jobdata)
+
+        def make_table():
+            clear_caches()
+            return JobTable.from_jobs(jobs)
+
+        # the loop used before JobTable: derived data per job, then the stats
+        derive_time = best_time(derive_jobs)
+        loop_time = best_time(lambda: userjob_stats_loop(jobs))
+        table = make_table()
+        table_time = best_time(make_table)
+        stats_time = best_time(table.userjob_stats)
+
+        # the statistics are many times faster (typically 8x), building the table takes somewhat longer
+        # than the derived data (typically 1.2x for table and statistics together)
+        self.assertTrue(stats_time * 4 < loop_time,
+                        msg='userjob_stats %.3f s faster than the loop %.3f s' % (stats_time, loop_time))
+        self.assertTrue(table_time + stats_time < 2 * (derive_time + loop_time),
+                        msg='JobTable %.3f s at most twice the derived data and loop %.3f s' %
+                        (table_time + stats_time, derive_time + loop_time))
+
+        stats, faults, _ = table.userjob_stats()
+        self.assertEqual(len(stats), 500, msg='all users found')
+        self.assertEqual(faults, [], msg='no faults')
+        self.assertEqual(sum([x[0] + x[4] for x in stats.values()]), nr, msg='all jobs counted')
@@ -0,0 +1,96 @@
+#
+# Copyright 2017 Ghent University
+#
+# This file is part of vsc-jobs,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://www.vscentrum.be),
+# the Flemish Research Foundation (FWO) (http://www.fwo.be/en)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# https://github.com/hpcugent/vsc-jobs
+#
+# vsc-jobs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Library General Public License as
+# published by the Free Software Foundation, either version 2 of
+# the License, or (at your option) any later version.
+#
+# vsc-jobs is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public License
+# along with vsc-jobs. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Tests for the node state classification
+"""
+import itertools
+from vsc.install.testing import TestCase
+
+from vsc.jobs.pbs import nodes
+from vsc.jobs.pbs.nodes import classify_mask, classify_nodes, get_nodes_dict, make_state_map, states_mask
+
+from fake_query import FakeQuery
+
+
+def classify_lists(states):
+    """The classification with lists, to compare with"""
+    if [x for x in nodes.ND_STATE_NOTOK if x in states]:
+        ndst = nodes.NDST_NOTOK
+    elif [x for x in nodes.ND_STATE_OK if x in states]:
+        ndst = nodes.NDST_OK
+    else:
+        ndst = nodes.NDST_OTHER
+
+    if [x for x in nodes.ND_NAGIOS_CRITICAL if x in states]:
+        ndnag = nodes.NDNAG_CRITICAL
+    elif [x for x in nodes.ND_NAGIOS_WARNING if x in states]:
+        ndnag = nodes.NDNAG_WARNING
+    else:
+        ndnag = nodes.NDNAG_OK
+    return (ndst, ndnag)
+
+
+class TestNodes(TestCase):
+
+    def test_classify(self):
+        """Test the bitmask classification against the list based one"""
+        all_states = sorted(nodes.TRANSLATE_STATE.keys())
+        for state in nodes.ND_STATE_OK + nodes.ND_STATE_NOTOK + nodes.ND_NAGIOS_CRITICAL + nodes.ND_NAGIOS_WARNING:
+            self.assertTrue(state in nodes.STATE_BITS, msg="state %s has a bit" % state)
+
+        for size in range(1, 4):
+            for states in itertools.permutations(all_states + ['nosuchstate'], size):
+                states = list(states)
+                self.assertEqual(classify_mask(states_mask(states)), classify_lists(states), msg=states)
+
+                derived = {nodes.ATTR_STATES: states}
+                make_state_map(derived)
+                self.assertEqual(derived[nodes.ATTR_STATE], states[0])
+                self.assertEqual((derived[nodes.ATTR_NODESTATE], derived['nagiosstate']), classify_lists(states))
+
+    def test_classify_nodes(self):
+        """Test the batch classification gives the derived states"""
+        nodes_dict = get_nodes_dict(query=FakeQuery())
+        names = sorted(nodes_dict.keys())
+        derived = [nodes_dict[name]['derived'] for name in names]
+
+        res = classify_nodes([d[nodes.ATTR_STATES] for d in derived])
+        self.assertEqual(len(res), 56)
+        for (ndst, ndnag, char), d in zip(res, derived):
+            self.assertEqual((ndst, ndnag), (d[nodes.ATTR_NODESTATE], d['nagiosstate']))
+            self.assertEqual(char, nodes.TRANSLATE_STATE[d[nodes.ATTR_STATE]])
+
+    def test_error_states(self):
+        """Test the error states are derived with the default attributes"""
+        query = FakeQuery()
+        query.data['nodes']['node329.gastly.gent.vsc']['error'] = ['Node is unhealthy']
+        query.data['nodes']['node329.gastly.gent.vsc']['state'] = [nodes.ND_down]
+        nodes_dict = get_nodes_dict(query=query, attrs=nodes.STATE_ATTRS)
+
+        self.assertTrue(nodes.ATTR_ERROR in query.attribs['nodes'], msg='error attribute requested')
+        derived = nodes_dict['node329.gastly.gent.vsc']['derived']
+        self.assertEqual(derived[nodes.ATTR_STATES], [nodes.ND_down_on_error, nodes.ND_error, nodes.ND_down])
+        self.assertEqual(derived[nodes.ATTR_NODESTATE], nodes.NDST_NOTOK)
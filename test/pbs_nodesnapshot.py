@@ -0,0 +1,133 @@
+#
+# Copyright 2017 Ghent University
+#
+# This file is part of vsc-jobs,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://www.vscentrum.be),
+# the Flemish Research Foundation (FWO) (http://www.fwo.be/en)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# https://github.com/hpcugent/vsc-jobs
+#
+# vsc-jobs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Library General Public License as
+# published by the Free Software Foundation, either version 2 of
+# the License, or (at your option) any later version.
+#
+# vsc-jobs is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public License
+# along with vsc-jobs. If not, see <http://www.gnu.org/licenses/>.
+#
+#
+"""
+Tests for the node snapshot
+"""
+from mock import patch
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from vsc.install.testing import TestCase
+
+from vsc.jobs.pbs.nodes import collect_node_types, collect_nodeinfo, get_nodes, get_nodes_dict, node_constants
+from vsc.jobs.pbs.nodesnapshot import HEADER, VERSION, NodeSnapshot, write_node_snapshot
+
+from fake_query import FakeQuery
+
+BIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bin')
+
+# pbsmon in snapshot mode, with pbs_python unavailable
+NO_PBS_PBSMON = """
+import sys
+sys.modules['pbs'] = None
+sys.modules['PBSQuery'] = None
+sys.argv = ['pbsmon', '--snapshot', sys.argv[1]]
+sys.path.insert(0, %r)
+import pbsmon
+pbsmon.main()
+print 'PBS_MODULES', ','.join(sorted([x for x in sys.modules if x.startswith('vsc.jobs.pbs.') and sys.modules[x]]))
+""" % BIN
+
+
+class TestNodeSnapshot(TestCase):
+    def setUp(self):
+        super(TestNodeSnapshot, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'nodes.bin')
+        self.nodes_dict = get_nodes_dict(query=FakeQuery())
+        write_node_snapshot(self.filename, self.nodes_dict, node_constants())
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        super(TestNodeSnapshot, self).tearDown()
+
+    def test_snapshot(self):
+        """Test the snapshot has the same derived data as the pbs server"""
+        snap = NodeSnapshot(self.filename)
+        self.assertEqual(len(snap), 56)
+
+        nodes = get_nodes(self.nodes_dict)
+        snap_nodes = snap.get_nodes()
+        self.assertEqual([x[0] for x in snap_nodes], [x[0] for x in nodes])
+        for (_, full_state), (_, snap_state) in zip(nodes, snap_nodes):
+            derived = full_state['derived']
+            expected = dict([(k, v) for (k, v) in derived.items() if k != 'jobs'])
+            self.assertEqual(snap_state['derived'], expected)
+
+        self.assertEqual(snap.collect_nodeinfo(), collect_nodeinfo(self.nodes_dict))
+        node_types = snap.node_types()
+        self.assertEqual(node_types, collect_node_types(self.nodes_dict))
+        self.assertEqual(node_types.values()[0][0], 47)
+        self.assertEqual(snap.constants.TRANSLATE_STATE['free'], '_')
+        self.assertEqual(snap.constants.ND_offline_idle, 'idle_offline')
+        snap.close()
+
+    def test_version(self):
+        """Test a snapshot with another version is refused, with the version of the file"""
+        data = open(self.filename, 'rb').read()
+        header = list(HEADER.unpack_from(data, 0))
+        header[1] = VERSION + 1
+        open(self.filename, 'wb').write(HEADER.pack(*header) + data[HEADER.size:])
+
+        self.assertErrorRegex(Exception, 'not a node snapshot \\(version %s\\)' % (VERSION + 1),
+                              NodeSnapshot, self.filename)
+
+    def test_write_failure(self):
+        """Test a failing write closes and removes the temporary file, and keeps the old snapshot"""
+        fds = []
+
+        def mkstemp(*args, **kwargs):
+            fd, name = real_mkstemp(*args, **kwargs)
+            fds.append(fd)
+            return fd, name
+
+        real_mkstemp = tempfile.mkstemp
+        with patch('vsc.jobs.pbs.nodesnapshot.tempfile.mkstemp', side_effect=mkstemp):
+            with patch('vsc.jobs.pbs.nodesnapshot.os.write', side_effect=OSError('No space left on device')):
+                self.assertErrorRegex(OSError, 'No space left', write_node_snapshot, self.filename,
+                                      self.nodes_dict, node_constants())
+
+        self.assertErrorRegex(OSError, 'Bad file descriptor', os.fstat, fds[0])
+        self.assertEqual(os.listdir(self.tmpdir), ['nodes.bin'])
+        self.assertEqual(len(NodeSnapshot(self.filename)), 56)
+
+    def test_pbsmon(self):
+        """Test pbsmon renders the snapshot without pbs_python"""
+        script = os.path.join(self.tmpdir, 'pbsmon_nopbs.py')
+        open(script, 'w').write(NO_PBS_PBSMON)
+        # ROWS/COLUMNS from the environment are not converted to int by get_row_col
+        env = dict([(k, v) for (k, v) in os.environ.items() if k not in ('ROWS', 'COLUMNS')])
+        output = subprocess.check_output([sys.executable, script, self.filename], env=env)
+
+        self.assertTrue('Node type:' in output)
+        modules = [x for x in output.splitlines() if x.startswith('PBS_MODULES')][0]
+        # only modules that do not need pbs_python
+        self.assertEqual(modules.split()[1].split(','), ['vsc.jobs.pbs.nodesnapshot', 'vsc.jobs.pbs.nodetypes',
+                                                         'vsc.jobs.pbs.qstat', 'vsc.jobs.pbs.tools'])
@@ -0,0 +1,86 @@
+#
+# Copyright 2017 Ghent University
+#
+# This file is part of vsc-jobs,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://www.vscentrum.be),
+# the Flemish Research Foundation (FWO) (http://www.fwo.be/en)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# https://github.com/hpcugent/vsc-jobs
+#
+# vsc-jobs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Library General Public License as
+# published by the Free Software Foundation, either version 2 of
+# the License, or (at your option) any later version.
+#
+# vsc-jobs is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public License
+# along with vsc-jobs. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Tests for the node types
+"""
+import array
+from vsc.install.testing import TestCase
+
+from vsc.jobs.pbs.nodetypes import collect_nodeinfo_derived, compact_nodenames, group_node_types
+from vsc.jobs.pbs.nodetypes import node_type_columns, node_type_histogram
+
+
+class TestNodeTypes(TestCase):
+    def test_node_types(self):
+        """Test the grouped node types"""
+        gb = 1024 ** 3
+        ok = {'nodestate': 'ok', 'np': 8, 'physmem': 12 * gb, 'totmem': 32 * gb, 'size': 100 * gb}
+        big = dict(ok, np=16)
+        nodes = [('node%s.gent' % idx, ok) for idx in (1, 2, 3, 5)] + [
+            ('node4.gent', big),
+            ('node6.gent', dict(ok, nodestate='notok')),
+            ('node7.gent', dict(ok, size=0)),
+            ('master1.gent', big),
+        ]
+
+        columns = node_type_columns(nodes, 'ok')
+        self.assertEqual(columns[0], ['node1.gent', 'node2.gent', 'node3.gent', 'node5.gent', 'node4.gent',
+                                      'master1.gent'])
+        self.assertTrue(isinstance(columns[1], array.array), msg='array columns')
+        self.assertEqual(columns[1].tolist(), [8, 8, 8, 8, 16, 16])
+
+        typ = (8, 12.0, 20.0, 100.0)
+        self.assertEqual(group_node_types(*columns), {
+            typ: ['node1.gent', 'node2.gent', 'node3.gent', 'node5.gent'],
+            (16, 12.0, 20.0, 100.0): ['node4.gent', 'master1.gent'],
+        })
+        self.assertEqual(node_type_histogram(group_node_types(*columns)), {
+            typ: (4, 'node[1-3,5].gent'),
+            (16, 12.0, 20.0, 100.0): (2, 'master1.gent,node4.gent'),
+        })
+
+    def test_compact_nodenames(self):
+        """Test compact_nodenames"""
+        self.assertEqual(compact_nodenames([]), '')
+        self.assertEqual(compact_nodenames(['node12.a', 'node10.a', 'node11.a', 'node2.b', 'login', 'node01.a']),
+                         'node[10-12].a,node2.b,login,node01.a')
+
+    def test_collect_nodeinfo_derived(self):
+        """Test the node ids, states and types"""
+        gb = 1024 ** 3
+        ok = {'state': 'free', 'nodestate': 'ok', 'np': 8, 'physmem': 12 * gb, 'totmem': 32 * gb, 'size': 100 * gb}
+        nodes = [
+            ('login', dict(ok, state='down', nodestate='notok')),
+            ('node1.gent', ok),
+            ('node2.gent', dict(ok, state='job-exclusive')),
+        ]
+        self.assertEqual(collect_nodeinfo_derived(nodes, 'ok'), (
+            ['1', '1', '2'],
+            ['down', 'free', 'job-exclusive'],
+            {(8, 12.0, 20.0, 100.0): ['node1.gent', 'node2.gent']},
+        ))
+        # the nodestate of the nodes to type is the one of the pbs server or the snapshot
+        self.assertEqual(collect_nodeinfo_derived(nodes, 'OK')[2], {})
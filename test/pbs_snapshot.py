@@ -0,0 +1,103 @@
+#
+# Copyright 2017 Ghent University
+#
+# This file is part of vsc-jobs,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://www.vscentrum.be),
+# the Flemish Research Foundation (FWO) (http://www.fwo.be/en)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# https://github.com/hpcugent/vsc-jobs
+#
+# vsc-jobs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Library General Public License as
+# published by the Free Software Foundation, either version 2 of
+# the License, or (at your option) any later version.
+#
+# vsc-jobs is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public License
+# along with vsc-jobs. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Tests for the cluster snapshot
+"""
+from vsc.install.testing import TestCase
+
+from vsc.jobs.pbs.snapshot import ClusterSnapshot
+
+from fake_query import FakeQuery
+
+
+class TestClusterSnapshot(TestCase):
+    def test_snapshot(self):
+        """Test ClusterSnapshot fetches each part once"""
+        query = FakeQuery()
+        snap = ClusterSnapshot(query=query)
+
+        self.assertEqual(query.calls, [], msg='nothing fetched on creation')
+
+        self.assertEqual(len(snap.jobs), 711, msg='all jobs found')
+        self.assertEqual(len(snap.nodes), 56, msg='all nodes found')
+        self.assertEqual(sorted(snap.queues.keys()), sorted(query.data['queues'].keys()), msg='all queues found')
+
+        # access all again
+        snap.jobs
+        snap.nodes
+        snap.queues
+        self.assertEqual(query.calls, ['jobs', 'nodes', 'queues'], msg='each part fetched only once')
+
+        for jobdata in snap.jobs.values():
+            self.assertTrue('derived' in jobdata, msg='jobs have derived data')
+        for nodedata in snap.nodes.values():
+            self.assertTrue('derived' in nodedata, msg='nodes have derived data')
+
+    def test_links(self):
+        """Test the job/node/user cross-links"""
+        query = FakeQuery()
+        snap = ClusterSnapshot(query=query)
+
+        running = [jobid for jobid, jobdata in snap.jobs.items() if 'exec_hosts' in jobdata['derived']]
+        self.assertTrue(running, msg='some running jobs')
+
+        for jobid in running:
+            nodes = snap.job_nodes[jobid]
+            self.assertEqual(nodes, sorted(snap.jobs[jobid]['derived']['exec_hosts'].keys()),
+                             msg='job %s linked to its exec hosts' % jobid)
+            for node in nodes:
+                self.assertTrue(jobid in snap.node_jobs[node], msg='node %s linked back to job %s' % (node, jobid))
+
+        self.assertEqual(sum([len(x) for x in snap.user_jobs.values()]), 711, msg='all jobs linked to a user')
+        for user, jobids in snap.user_jobs.items():
+            for jobid in jobids:
+                self.assertEqual(snap.jobs[jobid]['derived']['user'], user, msg='job %s of user %s' % (jobid, user))
+
+        # linking does not fetch anything else
+        self.assertEqual(query.calls, ['jobs'], msg='only jobs fetched for links')
+
+    def test_snapshot_attrs(self):
+        """Test the attribute projection is passed to the query"""
+        query = FakeQuery()
+        snap = ClusterSnapshot(query=query, node_attrs=['state', 'doesnotexist'], queue_attrs='ALL')
+        snap.jobs
+        snap.nodes
+        snap.queues
+
+        self.assertTrue('exec_host' in query.attribs['jobs'], msg='default job attributes requested')
+        self.assertTrue('resources_used' in query.attribs['jobs'], msg='default job attributes requested')
+        self.assertEqual(query.attribs['nodes'], ['state', 'error'], msg='only known node attributes requested')
+        self.assertEqual(query.attribs['queues'], None, msg='all queue attributes requested')
+
+        query = FakeQuery()
+        snap = ClusterSnapshot(query=query)
+        snap.nodes
+        snap.queues
+        self.assertEqual(query.attribs['nodes'], ['state', 'jobs', 'np', 'status', 'error'],
+                         msg='default node attributes')
+        self.assertEqual(query.attribs['queues'],
+                         ['enabled', 'queue_type', 'resources_default', 'resources_max', 'route_destinations'],
+                         msg='default queue attributes')
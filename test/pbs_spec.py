@@ -0,0 +1,130 @@
+#
+# Copyright 2017 Ghent University
+#
+# This file is part of vsc-jobs,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://www.vscentrum.be),
+# the Flemish Research Foundation (FWO) (http://www.fwo.be/en)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# https://github.com/hpcugent/vsc-jobs
+#
+# vsc-jobs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Library General Public License as
+# published by the Free Software Foundation, either version 2 of
+# the License, or (at your option) any later version.
+#
+# vsc-jobs is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public License
+# along with vsc-jobs. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Tests for the memoized parsing of the job specifications
+"""
+import time
+from mock import patch
+from vsc.install.testing import TestCase
+
+import vsc.jobs.pbs.jobs
+from vsc.jobs.pbs.jobs import get_jobs_dict
+from vsc.jobs.pbs.spec import memoize, clear_caches, parse_user, parse_nodes_cores, parse_sec, parse_byte, \
+    parse_nodes_spec
+
+from fake_query import JobData
+
+
+def make_jobs(nr):
+    """Make nr jobs with a limited set of distinct resource strings"""
+    jobs = {}
+    for idx in range(nr):
+        jd = JobData()
+        jd.update({
+            'job_state': ['RQ'[idx % 2]],
+            'Job_Owner': ['vsc4%04d@login.cluster' % (idx % 100)],
+            'Resource_List': {
+                'walltime': ['%02d:00:00' % (idx % 72)],
+                'neednodes': ['%d:ppn=%d' % (1 + idx % 8, 1 + idx % 16)],
+            },
+            'resources_used': {
+                'mem': ['%dkb' % (idx % 50 * 1024)],
+                'vmem': ['%dkb' % (idx % 50 * 2048)],
+                'walltime': ['00:%02d:00' % (idx % 60)],
+                'cput': ['01:%02d:00' % (idx % 60)],
+            },
+        })
+        jobs['%d.master' % idx] = jd
+    return jobs
+
+
+class TestSpec(TestCase):
+    def setUp(self):
+        clear_caches()
+        super(TestSpec, self).setUp()
+
+    def test_memoize(self):
+        """Test the LRU cache"""
+        calls = []
+
+        @memoize(maxsize=2)
+        def double(x):
+            calls.append(x)
+            return 2 * x
+
+        self.assertEqual([double(x) for x in [1, 2, 1, 3, 1, 2]], [2, 4, 2, 6, 2, 4])
+        # 2 is least recently used when 3 is added
+        self.assertEqual(calls, [1, 2, 3, 2], msg='only evicted values are recomputed')
+        self.assertEqual(double.cache_info(), {'hits': 2, 'misses': 4, 'size': 2, 'maxsize': 2})
+
+        double.cache_clear()
+        self.assertEqual(double.cache_info()['size'], 0, msg='cache cleared')
+        self.assertEqual(double.uncached(5), 10, msg='uncached original function')
+
+    def test_parsers(self):
+        """Test the parsers"""
+        self.assertEqual(parse_user('vsc40075@gligar01.gligar.gent.vsc'), 'vsc40075')
+        self.assertEqual(parse_user('nohost'), None)
+
+        self.assertEqual(parse_nodes_cores('2:ppn=4'), (2, 4))
+        self.assertEqual(parse_nodes_cores('3'), (3, 1))
+        self.assertEqual(parse_nodes_cores('node2617.swalot.gent.vsc:ppn=20'), (1, 20))
+        self.assertEqual(parse_nodes_cores('node2617.swalot.gent.vsc'), (1, 1))
+        self.assertEqual(parse_nodes_cores('something'), None)
+
+        self.assertEqual(parse_sec('01:02:03'), 3723)
+        self.assertEqual(parse_byte('2kb'), 2048)
+
+        self.assertEqual(parse_nodes_spec('2:ppn=all+node1:ib', 16), (3, 33, '2:ppn=16+node1:ib:ppn=1', ()))
+        self.assertEqual(parse_nodes_spec('1:ppn=whatever', 16), (1, 1, '1:ppn=1', ('whatever',)))
+
+        for func in [parse_user, parse_nodes_cores, parse_sec, parse_byte, parse_nodes_spec]:
+            self.assertTrue(func.cache_info()['size'] > 0, msg='results cached for %s' % func.__name__)
+
+    def test_benchmark(self):
+        """Compare per-job derivation cost of get_jobs_dict with and without caches"""
+        nr = 20000
+
+        parsers = [parse_user, parse_nodes_cores, parse_sec, parse_byte]
+
+        def derive(cached):
+            jobs = make_jobs(nr)
+            funcs = dict([(f.__name__, f if cached else f.uncached) for f in parsers])
+            with patch('vsc.jobs.pbs.jobs.get_jobs', return_value=jobs):
+                with patch.multiple(vsc.jobs.pbs.jobs, **funcs):
+                    start = time.time()
+                    res = get_jobs_dict()
+                    return time.time() - start, res
+
+        before, res_before = min([derive(False) for _ in range(3)])
+        after, res_after = min([derive(True) for _ in range(3)])
+
+        self.assertEqual([x['derived'] for x in res_before.values()], [x['derived'] for x in res_after.values()],
+                         msg='same derived data with and without caches')
+        # typically 2.5x faster
+        self.assertTrue(after * 1.5 < before,
+                        msg='per-job derivation for %s jobs: cached %.2f us faster than uncached %.2f us' %
+                        (nr, 1e6 * after / nr, 1e6 * before / nr))
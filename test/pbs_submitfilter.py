@@ -26,19 +26,49 @@
 """
 @author: stdweird
 """
+import hashlib
 import os
 import re
+import shutil
+import subprocess
 import sys
+import tempfile
+import time
+from cStringIO import StringIO
 from vsc.install.testing import TestCase
 
 from vsc.jobs.pbs.submitfilter import parse_resources, parse_resources_nodes, SubmitFilter, \
                                 parse_commandline_string, parse_commandline_list, \
                                 get_warnings, reset_warnings, \
                                 _parse_mem_units, parse_mem, PBS_DIRECTIVE_PREFIX_DEFAULT, \
-                                cluster_from_options
+                                cluster_from_options, filter_batch, filter_script, scripts_in_dir, \
+                                _parse_resources_list
 
 from vsc.jobs.pbs.clusterdata import DEFAULT_SERVER_CLUSTER, MASTER_REGEXP, CLUSTERDATA
 
+# size of the body of the throughput test script
+BIG_BODY_SIZE = 16 << 20
+
+# number of scripts in the batch benchmark
+BATCH_SCRIPTS = 1000
+# number of scripts filtered with a process per script
+BATCH_SINGLE_SCRIPTS = 10
+# filter the script on stdin, like the submitfilter script
+BATCH_SINGLE_FILTER = """
+import sys
+from vsc.jobs.pbs.submitfilter import filter_script
+sys.exit(filter_script(sys.argv[1:], sys.stdin, sys.stdout, sys.stderr, current_user='vsc40000'))
+"""
+
+BATCH_SCRIPT = """#!/bin/bash
+#PBS -N job%(idx)s
+#PBS -l nodes=1:ppn=%(ppn)s
+#PBS -l %(mem)s
+#PBS -l walltime=1:00:00
+cd $PBS_O_WORKDIR
+./run --input data.%(idx)s
+"""
+
 RESOURCE_NODES = [
     {
         'orig': '1',
@@ -461,3 +491,153 @@ class TestSubmitfilter(TestCase):
         ], msg="expected newopts %s" % newopts)
 
         del os.environ['PBS_DEFAULT']
+
+    def test_copy_body(self):
+        """Test copy of the body after the header"""
+        lines = [x + "\n" for x in SCRIPTS[0].split("\n")]
+        body = ''.join(lines[12:])
+
+        for stdin in [lines, StringIO(''.join(lines))]:
+            h = SubmitFilter([], stdin)
+            h.parse_header()
+            self.assertEqual(h.prebody, "cd $VSC_HOME\n")
+
+            out = StringIO()
+            self.assertEqual(h.copy_body(out, chunk_size=7), len(body))
+            self.assertEqual(out.getvalue(), body)
+
+    def test_copy_body_throughput(self):
+        """Test the body of a big script is copied as is, faster than line per line"""
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        script = os.path.join(tmpdir, 'big.script')
+        filtered = os.path.join(tmpdir, 'big.out')
+
+        # lines of a job script, and a 1MB heredoc line
+        body_lines = [
+            "echo 'some work' && ./run --input data.$PBS_ARRAYID > out.$PBS_ARRAYID\n",
+            "cat > input.txt << EOF\n%s\nEOF\n" % ('x' * (1 << 20)),
+        ]
+        md5 = hashlib.md5()
+        with open(script, 'w') as f:
+            f.write("#!/bin/bash\n#PBS -l nodes=1:ppn=4\n\ncd $PBS_O_WORKDIR\n")
+            size = 0
+            while size < BIG_BODY_SIZE:
+                block = body_lines[0] * 10000 + body_lines[1]
+                f.write(block)
+                md5.update(block)
+                size += len(block)
+
+        def copy(lines):
+            """Copy the body, in chunks from the file or line per line from its readline; return the wall time"""
+            with open(script) as stdin:
+                with open(filtered, 'w') as out:
+                    h = SubmitFilter([], stdin.readline if lines else stdin)
+                    h.parse_header()
+                    self.assertEqual(h.prebody, "cd $PBS_O_WORKDIR\n")
+
+                    start = time.time()
+                    self.assertEqual(h.copy_body(out), size)
+                    return time.time() - start
+
+        line_time = min([copy(True) for _ in range(3)])
+        chunk_time = min([copy(False) for _ in range(3)])
+
+        res = hashlib.md5()
+        with open(filtered) as f:
+            for chunk in iter(lambda: f.read(1 << 20), ''):
+                res.update(chunk)
+
+        self.assertEqual(res.hexdigest(), md5.hexdigest(), msg='body copied as is')
+        # typically 15x faster
+        self.assertTrue(chunk_time * 4 < line_time,
+                        msg='copy in chunks %.3f s faster than line per line %.3f s' % (chunk_time, line_time))
+
+    def test_resources_warnings(self):
+        """Test the warnings of the memoized resource parsing are repeated"""
+        for _ in range(2):
+            reset_warnings()
+            resources = {}
+            self.assertEqual(parse_resources('nodes=1:ppn=foo,pvmem=half', 'delcatty', resources, update=True),
+                             'nodes=1:ppn=1,pvmem=64787423232')
+            self.assertEqual(resources['_pvmem'], 64787423232)
+            self.assertEqual(get_warnings(), [
+                'Warning: unknown ppn (foo) detected, using ppn=1',
+                'Unsupported memory specification pvmem with value half',
+            ])
+
+    def test_filter_batch(self):
+        """Benchmark filter_batch, and compare with a submitfilter process per script"""
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        indir = os.path.join(tmpdir, 'in')
+        outdir = os.path.join(tmpdir, 'out')
+        os.mkdir(indir)
+        os.mkdir(outdir)
+
+        mems = ['vmem=full', 'pmem=4gb', 'mem=10g', 'walltime=2:00:00']
+        for idx in range(BATCH_SCRIPTS):
+            script = BATCH_SCRIPT % {'idx': idx, 'ppn': [1, 4, 'all', 5][idx % 4], 'mem': mems[idx % len(mems)]}
+            open(os.path.join(indir, 'job%04d.sh' % idx), 'w').write(script)
+
+        arguments = ['submitfilter', '-q', 'short@master19.golett.gent.vsc']
+        jobs = scripts_in_dir(indir, arguments)
+        self.assertEqual(len(jobs), BATCH_SCRIPTS)
+
+        _parse_resources_list.cache_clear()
+        start = time.time()
+        self.assertEqual(filter_batch(jobs, outdir, current_user='vsc40000'), (BATCH_SCRIPTS, []))
+        batch_time = time.time() - start
+        self.assertTrue(_parse_resources_list.cache_info()['hits'] > BATCH_SCRIPTS)
+
+        for idx in [0, 1, 2, 3, BATCH_SCRIPTS - 1]:
+            name = 'job%04d.sh' % idx
+            stdout = StringIO()
+            stderr = StringIO()
+            filter_script(arguments, open(os.path.join(indir, name)), stdout, stderr, current_user='vsc40000')
+            self.assertEqual(open(os.path.join(outdir, name)).read(), stdout.getvalue())
+
+            errname = os.path.join(outdir, '%s.err' % name)
+            if stderr.getvalue():
+                self.assertEqual(open(errname).read(), stderr.getvalue())
+            else:
+                self.assertFalse(os.path.exists(errname), msg='no warnings file without warnings')
+
+        # a submitfilter process per script, for a few scripts
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join([p for p in sys.path if p] + [env.get('PYTHONPATH', '')])
+        single_time = 0
+        for idx in range(BATCH_SINGLE_SCRIPTS):
+            name = 'job%04d.sh' % idx
+            start = time.time()
+            proc = subprocess.Popen([sys.executable, '-B', '-c', BATCH_SINGLE_FILTER] + arguments, env=env,
+                                    stdin=open(os.path.join(indir, name)),
+                                    stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            output = proc.communicate()[0]
+            single_time += time.time() - start
+            self.assertEqual(output, open(os.path.join(outdir, name)).read())
+
+        # typically several 100x faster per script
+        batch_time /= BATCH_SCRIPTS
+        single_time /= BATCH_SINGLE_SCRIPTS
+        self.assertTrue(batch_time * 10 < single_time,
+                        msg='filter_batch %.2f ms per script faster than a process per script %.2f ms' %
+                        (batch_time * 1000, single_time * 1000))
+
+    def test_filter_batch_failed(self):
+        """Test a failing script does not stop the batch"""
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+
+        jobs = [
+            ('job1.sh', ['submitfilter'], StringIO(BATCH_SCRIPT % {'idx': 1, 'ppn': 1, 'mem': 'pmem=4gb'})),
+            ('missing.sh', ['submitfilter'], os.path.join(tmpdir, 'doesnotexist.sh')),
+            ('job2.sh', ['submitfilter'], StringIO(BATCH_SCRIPT % {'idx': 2, 'ppn': 1, 'mem': 'pmem=4gb'})),
+        ]
+        self.assertEqual(filter_batch(jobs, tmpdir, current_user='vsc40000'), (2, ['missing.sh']))
+
+        self.assertTrue(os.path.exists(os.path.join(tmpdir, 'job2.sh')), msg='next script filtered')
+        self.assertFalse(os.path.exists(os.path.join(tmpdir, 'missing.sh')), msg='no output of failed script')
+        err = open(os.path.join(tmpdir, 'missing.sh.err')).read()
+        self.assertTrue(err.startswith('ERROR: failed to filter job script missing.sh: '), msg=err)
+        self.assertTrue('doesnotexist.sh' in err, msg=err)
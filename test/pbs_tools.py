@@ -0,0 +1,71 @@
+#
+# Copyright 2017 Ghent University
+#
+# This file is part of vsc-jobs,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://www.vscentrum.be),
+# the Flemish Research Foundation (FWO) (http://www.fwo.be/en)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# https://github.com/hpcugent/vsc-jobs
+#
+# vsc-jobs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Library General Public License as
+# published by the Free Software Foundation, either version 2 of
+# the License, or (at your option) any later version.
+#
+# vsc-jobs is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public License
+# along with vsc-jobs. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Tests for the pbs tools
+"""
+import array
+from vsc.install.testing import TestCase
+
+from vsc.jobs.pbs.tools import str2byte, str2sec, str2byte_many, str2sec_many, _str2byte_reg, _str2sec_reg
+
+BYTES = ['12345kb', '12345KB', '1b', '0kb', '7mb', '3gb', '2tb', '42', '12b', ' 12kb', '12kb ', 'kb', 'b', '',
+         '1.5gb', 'abc', '12pb', '12k', '-1kb']
+TIMES = ['12', '01:02', '01:02:03', '1:01:02:03', '00:00:00', '1:2:3:4:5', ' 01:02', '01:', ':01', '1::2',
+         'abc', '', 'x01:02:03', '01:02:03x', '-1:00']
+
+
+class TestTools(TestCase):
+    def test_str2byte(self):
+        """Test str2byte fast path gives same result as regexp"""
+        for txt in BYTES:
+            self.assertEqual(str2byte(txt), _str2byte_reg(txt), msg='same str2byte result for %r' % txt)
+
+        self.assertEqual(str2byte('12345kb'), 12345 * 1024)
+        self.assertEqual(str2byte('2GB'), 2 * 1024 ** 3)
+        self.assertEqual(str2byte('42'), 42)
+        self.assertEqual(str2byte('gb'), 1024 ** 3)
+        self.assertEqual(str2byte('1.5gb'), None)
+
+    def test_str2sec(self):
+        """Test str2sec fast path gives same result as regexp"""
+        for txt in TIMES:
+            self.assertEqual(str2sec(txt), _str2sec_reg(txt), msg='same str2sec result for %r' % txt)
+
+        self.assertEqual(str2sec('01:02:03'), 3723)
+        self.assertEqual(str2sec('1:01:02:03'), 86400 + 3723)
+        self.assertEqual(str2sec('abc'), None)
+
+    def test_many(self):
+        """Test batch conversions"""
+        self.assertEqual(str2byte_many(BYTES), [str2byte(x) for x in BYTES])
+        self.assertEqual(str2sec_many(TIMES + [None]), [str2sec(x) for x in TIMES] + [None])
+
+        res = str2sec_many(['01:00', 'abc', None], typecode='l', missing=-1)
+        self.assertTrue(isinstance(res, array.array), msg='array returned with typecode')
+        self.assertEqual(res.tolist(), [60, -1, -1])
+
+        self.assertErrorRegex(ValueError, 'missing value required', str2byte_many, ['1kb', 'abc'], typecode='l')
+        self.assertEqual(str2byte_many(['1kb', '2kb'], typecode='l').tolist(), [1024, 2048])
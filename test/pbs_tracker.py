@@ -0,0 +1,102 @@
+#
+# Copyright 2017 Ghent University
+#
+# This file is part of vsc-jobs,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://www.vscentrum.be),
+# the Flemish Research Foundation (FWO) (http://www.fwo.be/en)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# https://github.com/hpcugent/vsc-jobs
+#
+# vsc-jobs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Library General Public License as
+# published by the Free Software Foundation, either version 2 of
+# the License, or (at your option) any later version.
+#
+# vsc-jobs is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public License
+# along with vsc-jobs. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Tests for the incremental job tracker
+"""
+import copy
+from vsc.install.testing import TestCase
+
+from vsc.jobs.pbs.jobs import get_jobs_dict
+from vsc.jobs.pbs.tracker import JobTracker, EVENT_ADDED, EVENT_CHANGED, EVENT_FINISHED, MAX_SINGLE_FETCHES
+
+from fake_query import FakeQuery
+
+
+class TestJobTracker(TestCase):
+    def test_poll(self):
+        """Test the events and that only modified jobs are fetched and derived"""
+        query = FakeQuery()
+        tracker = JobTracker(query=query)
+
+        events = tracker.poll()
+        self.assertEqual(len(events), 711, msg='all jobs added')
+        self.assertEqual(set([x[0] for x in events]), set([EVENT_ADDED]))
+        self.assertEqual(tracker.derived, 711)
+
+        # same result as get_jobs_dict
+        jobs = get_jobs_dict(query=query)
+        self.assertEqual(sorted(tracker.jobs.keys()), sorted(jobs.keys()))
+        for jobid, jobdata in jobs.items():
+            self.assertEqual(tracker.jobs[jobid]['derived'], jobdata['derived'])
+
+        query.fetched = 0
+        self.assertEqual(tracker.poll(), [], msg='no events without modifications')
+        self.assertEqual(query.fetched, 0, msg='nothing fetched without modifications')
+        self.assertEqual(tracker.derived, 711, msg='nothing derived without modifications')
+
+        jobids = sorted(query.jobs.keys())
+        query.touch(jobids[0])
+        query.touch(jobids[1])
+        del query.jobs[jobids[2]]
+        newjob = 'new.master3.gent.vsc'
+        query.jobs[newjob] = copy.deepcopy(query.jobs[jobids[3]])
+
+        events = tracker.poll()
+        self.assertEqual(sorted(events), sorted([
+            (EVENT_CHANGED, jobids[0]),
+            (EVENT_CHANGED, jobids[1]),
+            (EVENT_FINISHED, jobids[2]),
+            (EVENT_ADDED, newjob),
+        ]))
+        self.assertEqual(query.fetched, 3, msg='only the modified jobs are fetched')
+        self.assertEqual(tracker.derived, 714, msg='only the modified jobs are derived')
+        self.assertEqual(tracker.jobs[jobids[0]]['derived']['state'], 'C')
+        self.assertFalse(jobids[2] in tracker.jobs)
+        self.assertEqual(len(tracker.jobs), 711)
+
+    def test_poll_many(self):
+        """Test that all jobs are fetched at once when many jobs are modified"""
+        query = FakeQuery()
+        tracker = JobTracker(query=query)
+        tracker.poll()
+
+        jobids = sorted(query.jobs.keys())
+        for jobid in jobids[:MAX_SINGLE_FETCHES]:
+            query.touch(jobid)
+
+        query.fetched = 0
+        events = tracker.poll()
+        self.assertEqual(len(events), MAX_SINGLE_FETCHES)
+        self.assertEqual(query.fetched, MAX_SINGLE_FETCHES, msg='one query per modified job')
+
+        for jobid in jobids[:MAX_SINGLE_FETCHES + 1]:
+            query.touch(jobid)
+
+        query.fetched = 0
+        events = tracker.poll()
+        self.assertEqual(len(events), MAX_SINGLE_FETCHES + 1)
+        self.assertEqual(set([x[0] for x in events]), set([EVENT_CHANGED]))
+        self.assertEqual(query.fetched, 711, msg='one query for all jobs')
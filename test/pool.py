@@ -0,0 +1,90 @@
+#
+# Copyright 2017 Ghent University
+#
+# This file is part of vsc-jobs,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://www.vscentrum.be),
+# the Flemish Research Foundation (FWO) (http://www.fwo.be/en)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# https://github.com/hpcugent/vsc-jobs
+#
+# vsc-jobs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Library General Public License as
+# published by the Free Software Foundation, either version 2 of
+# the License, or (at your option) any later version.
+#
+# vsc-jobs is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public License
+# along with vsc-jobs. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Tests for the bounded pool of threads
+"""
+import threading
+import time
+from vsc.install.testing import TestCase
+
+from vsc.jobs.moab.fileset import FilesetWriter
+from vsc.jobs.pool import BoundedPool, percentile
+
+
+class TestBoundedPool(TestCase):
+    def test_run(self):
+        """Test the workers run at the same time, and the errors are kept per item"""
+        users = ['vsc4%04d' % x for x in range(20)]
+        running = [0, 0]
+        lock = threading.Lock()
+
+        def store(user):
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+            time.sleep(0.01)
+            with lock:
+                running[0] -= 1
+            if user.endswith('3'):
+                raise IOError("no space left for %s" % user)
+            return 'store'
+
+        pool = BoundedPool(workers=4)
+        (results, failed) = pool.run(users, store)
+        self.assertEqual(sorted(failed.keys()), ['vsc40003', 'vsc40013'])
+        self.assertTrue(isinstance(failed['vsc40003'], IOError))
+        self.assertEqual(len(results), 18)
+        self.assertEqual(set(results.values()), set(['store']))
+        self.assertTrue(1 < running[1] <= 4, msg='bounded number of workers: %s' % running[1])
+
+        stats = pool.latency_stats()
+        self.assertEqual(sorted(stats.keys()), ['latency_max', 'latency_p50', 'latency_p90', 'latency_p99'])
+        self.assertTrue(10 <= stats['latency_p50'] <= stats['latency_p99'] <= stats['latency_max'])
+
+        # a single worker runs in order in this thread
+        order = []
+        pool = BoundedPool()
+        pool.run(users, order.append)
+        self.assertEqual(order, users)
+        self.assertEqual(BoundedPool().latency_stats(), {})
+
+    def test_fileset_writer(self):
+        """Test the FilesetWriter reports the store latency"""
+        writer = FilesetWriter(workers=2)
+        (results, failed) = writer.run(['vsc40000', 'vsc40001'], lambda user: 'store')
+        self.assertEqual(results, {'vsc40000': 'store', 'vsc40001': 'store'})
+        self.assertEqual(failed, {})
+        self.assertEqual(sorted(writer.latency_stats().keys()), ['store_latency_max', 'store_latency_p50',
+                                                                 'store_latency_p90', 'store_latency_p99'])
+
+    def test_percentile(self):
+        """Test the nearest rank percentiles"""
+        values = range(1, 101)
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 90), 90)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([3], 99), 3)
+        self.assertEqual(percentile([], 50), None)
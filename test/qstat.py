@@ -31,6 +31,7 @@
 from vsc.install.testing import TestCase
 
 from vsc.jobs.pbs.qstat import ranges, convert_to_range, normalise_exec_host, normalise_time, transform_info
+from vsc.jobs.pbs.qstat import transform_info_attrs
 
 
 class TestQstatWrapper(TestCase):
@@ -93,3 +94,10 @@ class TestQstatWrapper(TestCase):
 
         # pass non-existing named arg blablah to make sure that possible future argumnets do not cause failures
         self.assertEqual(normalise_exec_host(job=job, time=None, blablah='future argument'), expected1)
+
+    def test_transform_info_attrs(self):
+        """
+        test the list of attributes to query for an info string
+        """
+        info = "exec_host:exec_host,Resource_List.walltime:walltime,resources_used.walltime:used,Resource_List.mem:mem"
+        self.assertEqual(transform_info_attrs(info), ['Resource_List', 'exec_host', 'resources_used'])
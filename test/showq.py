@@ -26,13 +26,38 @@
 """
 @author: stdweird
 """
+from cStringIO import StringIO
 from mock import patch
 
+import cPickle
+import jsonpickle
 import os
+import shutil
+import subprocess
 import sys
+import tempfile
+import threading
+import time
 from vsc.install.testing import TestCase
 
-from vsc.jobs.moab.showq import SshShowq, ShowqInfo
+from vsc.jobs.moab.internal import JobRecord, MoabCommand, iterparse_elements
+from vsc.jobs.moab.showq import Showq, SshShowq, ShowqInfo
+
+SHOWQ_JOB_RUNNING = ('<job AWDuration="3931" Account="gvo00000" Class="short" DRMJID="%(jobid)s.master.gengar.gent.vsc" '
+                     'JobID="%(jobid)s" MasterHost="node129" ReqProcs="8" State="Running" SubmissionTime="1278470000" '
+                     'User="vsc4000%(user)s"></job>')
+SHOWQ_JOB_IDLE = ('<job Account="gvo00000" BlockReason="IdlePolicy" Class="short" DRMJID="%(jobid)s.master.gengar.gent.vsc" '
+                  'Description="job %(jobid)s violates idle HARD MAXIPROC limit" JobID="%(jobid)s" ReqProcs="8" '
+                  'State="Idle" SubmissionTime="1278480000" User="vsc4000%(user)s"></job>')
+
+
+def make_showq_xml(nrjobs):
+    """Return showq --xml like output with nrjobs running and nrjobs idle jobs"""
+    running = ''.join([SHOWQ_JOB_RUNNING % {'jobid': x, 'user': x % 3} for x in range(nrjobs)])
+    idle = ''.join([SHOWQ_JOB_IDLE % {'jobid': nrjobs + x, 'user': x % 5} for x in range(nrjobs)])
+    return ('<Data><Object>queue</Object><cluster LocalActiveNodes="10"></cluster>'
+            '<queue count="%s" option="active">%s</queue><queue count="%s" option="blocked">%s</queue></Data>' %
+            (nrjobs, running, nrjobs, idle))
 
 
 class TestSshShowq(TestCase):
@@ -51,3 +76,285 @@ class TestSshShowq(TestCase):
         self.assertEqual(showq._command('/opt/moab/bin/checkjob'), ['sudo', 'ssh', 'testuser@master1', '/opt/moab/bin/checkjob'])
         self.assertEquals(showq.info, ShowqInfo)
         self.assertEquals(showq.info(), {})
+
+
+class SleepShowq(Showq):
+    """Showq that sleeps for the number of seconds in the path"""
+
+    STREAM = False
+
+    def __init__(self, *args, **kwargs):
+        super(SleepShowq, self).__init__(*args, **kwargs)
+        # hosts being contacted now, and the max at the same time
+        self.running = [0, 0]
+        self._running_lock = threading.Lock()
+
+    def _get_host_information(self, host, deadline=None):
+        with self._running_lock:
+            self.running[0] += 1
+            self.running[1] = max(self.running)
+        try:
+            return super(SleepShowq, self)._get_host_information(host, deadline=deadline)
+        finally:
+            with self._running_lock:
+                self.running[0] -= 1
+
+    def _command(self, path):
+        # the command is run in a shell, the moab options are commented out
+        # exec, so the sleep itself is killed after the deadline
+        return ['echo', path, ';', 'exec', 'sleep', path, '#']
+
+    def parser(self, host, txt):
+        if txt.strip() == '0':
+            # mimick broken output
+            return {}
+        return {host: txt.strip()}
+
+
+class TestShowqFanOut(TestCase):
+    def setUp(self):
+        """Clusters with different latency"""
+        super(TestShowqFanOut, self).setUp()
+        self.clusters = {
+            'fast': {'path': '0.1', 'master': 'master1'},
+            'medium': {'path': '0.5', 'master': 'master2'},
+            'slow': {'path': '1', 'master': 'master3'},
+            'broken': {'path': '0', 'master': 'master4'},
+        }
+
+    def test_workers(self):
+        """Test concurrent hosts give the same result and take the time of the slowest host"""
+        serial_showq = SleepShowq(self.clusters)
+        start = time.time()
+        (info, reported, failed) = serial_showq.get_moab_command_information()
+        serial = time.time() - start
+
+        showq = SleepShowq(self.clusters)
+        (pinfo, preported, pfailed) = showq.get_moab_command_information(workers=4)
+
+        self.assertEqual(pinfo, info)
+        self.assertEqual(pinfo, {'fast': '0.1', 'medium': '0.5', 'slow': '1'})
+        self.assertEqual(sorted(preported), sorted(reported))
+        self.assertEqual(sorted(preported), ['fast', 'medium', 'slow'])
+        self.assertEqual(pfailed, failed)
+        self.assertEqual(pfailed, ['broken'])
+
+        self.assertEqual(sorted(showq.host_timings.keys()), sorted(self.clusters.keys()))
+        self.assertTrue(showq.host_timings['slow'] >= 1)
+        self.assertTrue(showq.host_timings['fast'] < showq.host_timings['slow'])
+        self.assertTrue(serial >= 1.6, msg='serial time is the sum %s' % serial)
+        self.assertEqual(serial_showq.running[1], 1, msg='one host at a time without workers')
+        self.assertTrue(1 < showq.running[1] <= 4, msg='hosts contacted at the same time: %s' % showq.running[1])
+
+    def test_deadline(self):
+        """Test slow host is killed after the deadline and reported as failed"""
+        self.clusters['stuck'] = {'path': '30', 'master': 'master5'}
+        showq = SleepShowq(self.clusters)
+        start = time.time()
+        (info, reported, failed) = showq.get_moab_command_information(workers=5, deadline=2)
+        self.assertTrue(time.time() - start < 10)
+        self.assertEqual(sorted(reported), ['fast', 'medium', 'slow'])
+        self.assertEqual(sorted(failed), ['broken', 'stuck'])
+        self.assertTrue(showq.host_timings['stuck'] < 10)
+
+
+class CatShowq(Showq):
+    """Showq that streams the file in path"""
+
+    def __init__(self, *args, **kwargs):
+        self.cache_dir = kwargs.pop('cache_dir', None)
+        super(CatShowq, self).__init__(*args, **kwargs)
+
+    def _command(self, path):
+        # the moab options are passed as positional args to the shell
+        return ['/bin/sh', '-c', 'cat %s' % path, 'sh']
+
+    def _cache_pickle_directory(self):
+        return self.cache_dir
+
+
+class CatCommand(MoabCommand):
+    """Moab command with STREAM set, but without iterparser"""
+
+    STREAM = True
+
+    def __init__(self, clusters):
+        super(CatCommand, self).__init__()
+        self.clusters = clusters
+        self.info = dict
+
+    def _command(self, path):
+        # the command is run in a shell (without streaming), the moab options are commented out
+        return ['cat', path, '#']
+
+    def parser(self, host, txt):
+        return {host: txt.strip()}
+
+
+class TestShowqStream(TestCase):
+    def setUp(self):
+        super(TestShowqStream, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        super(TestShowqStream, self).tearDown()
+
+    def test_iterparse_elements(self):
+        """Test the parsed elements are removed from the tree"""
+        xml = make_showq_xml(100)
+        previous = None
+        count = 0
+        for job in iterparse_elements(StringIO(xml)):
+            count += 1
+            # only the previous job is kept, cleared
+            if job.getprevious() is not None:
+                self.assertTrue(job.getprevious() is previous)
+                self.assertEqual(len(previous.attrib), 0, msg='previous job cleared')
+                self.assertTrue(previous.getprevious() is None, msg='preceding jobs removed')
+            previous = job
+        self.assertEqual(count, 200)
+
+    def test_stream(self):
+        """Test streaming the command output gives the same result as parsing the output"""
+        xml = make_showq_xml(50)
+        path = os.path.join(self.tmpdir, 'showq.xml')
+        open(path, 'w').write(xml)
+
+        clusters = {'gengar': {'path': path, 'master': 'master1'}}
+        showq = CatShowq(clusters, cache_pickle=True, cache_dir=self.tmpdir)
+        (info, reported, failed) = showq.get_moab_command_information()
+        self.assertEqual(reported, ['gengar'])
+        self.assertEqual(failed, [])
+
+        expected = showq.parser('gengar', xml)
+        self.assertEqual(info, expected)
+        self.assertEqual(len(info['vsc40000']['gengar']['Running']), 17)
+        self.assertEqual(len(info['vsc40000']['gengar']['IdleBlocked']), 10)
+
+        # raw output is cached, and used when the command fails
+        cache = os.path.join(self.tmpdir, showq._cache_stream_name('gengar'))
+        self.assertEqual(open(cache).read(), xml)
+
+        os.unlink(path)
+        (info, reported, failed) = showq.get_moab_command_information()
+        self.assertEqual(info, expected)
+
+        # broken output
+        open(path, 'w').write(xml[:-100])
+        showq.cache_pickle = False
+        (info, reported, failed) = showq.get_moab_command_information()
+        self.assertEqual(failed, ['gengar'])
+
+    def test_stream_without_iterparser(self):
+        """Test a command without iterparser parses the output afterwards"""
+        path = os.path.join(self.tmpdir, 'output.txt')
+        open(path, 'w').write('some output\n')
+
+        command = CatCommand({'gengar': {'path': path, 'master': 'master1'}})
+        self.assertFalse(command._has_iterparser())
+        self.assertTrue(CatShowq({})._has_iterparser())
+        self.assertEqual(command.get_moab_command_information(), ({'gengar': 'some output'}, ['gengar'], []))
+
+    def test_stream_cleanup(self):
+        """Test the command is stopped when the parser fails"""
+        path = os.path.join(self.tmpdir, 'showq.xml')
+        open(path, 'w').write(make_showq_xml(5))
+        showq = CatShowq({}, cache_pickle=True, cache_dir=self.tmpdir)
+
+        processes = []
+        timers = []
+        real_popen = subprocess.Popen
+        real_timer = threading.Timer
+
+        def popen(*args, **kwargs):
+            processes.append(real_popen(*args, **kwargs))
+            return processes[-1]
+
+        def timer(*args, **kwargs):
+            timers.append(real_timer(*args, **kwargs))
+            return timers[-1]
+
+        # the command keeps running (and reading its stdin) after the output
+        commandlist = ['/bin/sh', '-c', 'cat %s; cat; sleep 60' % path, 'sh']
+        with patch('vsc.jobs.moab.internal.subprocess.Popen', side_effect=popen):
+            with patch('vsc.jobs.moab.internal.threading.Timer', side_effect=timer):
+                with patch.object(showq, 'iterparser', side_effect=ValueError('parser bug')):
+                    self.assertErrorRegex(ValueError, 'parser bug', showq._run_moab_command_stream,
+                                          commandlist, 'gengar', [], deadline=100)
+
+        self.assertNotEqual(processes[0].returncode, None, msg='command stopped and waited for')
+        self.assertTrue(processes[0].stdout.closed)
+        self.assertTrue(timers[0].finished.is_set(), msg='deadline timer cancelled')
+
+    def test_filter(self):
+        """Test only the jobs in the requested states (or with the requested ids) are kept"""
+        xml = make_showq_xml(50)
+        path = os.path.join(self.tmpdir, 'showq.xml')
+        open(path, 'w').write(xml)
+        clusters = {'gengar': {'path': path, 'master': 'master1'}}
+
+        showq = CatShowq(clusters, states=('Running',), jobids=set(['51.master.gengar.gent.vsc']))
+        (info, _, _) = showq.get_moab_command_information()
+        jobs = [j for u in info.values() for h in u.values() for st in h.values() for j in st]
+        self.assertEqual(len(jobs), 51)
+        self.assertEqual(sorted(set([st for u in info.values() for h in u.values() for st in h if h[st]])),
+                         ['IdleBlocked', 'Running'])
+        self.assertEqual(showq._command_options('gengar'), [])
+
+        showq = CatShowq(clusters, blocked_only=True)
+        self.assertEqual(showq._command_options('gengar'), ['-b'])
+        self.assertNotEqual(showq._cache_pickle_name('gengar'), CatShowq(clusters)._cache_pickle_name('gengar'))
+
+
+class TestJobRecord(TestCase):
+    def test_record(self):
+        """Test dict-style access"""
+        rec = JobRecord(['JobID', 'Class'], ['123', 'short'])
+        self.assertEqual(rec['JobID'], '123')
+        self.assertEqual(rec.get('MasterHost'), None)
+        self.assertEqual(rec.get('MasterHost', 'x'), 'x')
+        self.assertTrue('Class' in rec)
+        self.assertFalse('MasterHost' in rec)
+        self.assertEqual(sorted(rec), ['Class', 'JobID'])
+        self.assertEqual(len(rec), 2)
+        self.assertEqual(rec, {'JobID': '123', 'Class': 'short'})
+        self.assertEqual(rec.to_dict(), {'JobID': '123', 'Class': 'short'})
+        self.assertRaises(KeyError, lambda: rec['MasterHost'])
+
+        other = JobRecord.from_items([('JobID', '456'), ('Class', 'short')])
+        self.assertTrue(other._names is rec._names, msg='names are shared')
+        self.assertTrue(other['Class'] is rec['Class'], msg='values are interned')
+
+        rec['_release'] = 1
+        rec['Class'] = 'long'
+        self.assertEqual(rec, {'JobID': '123', 'Class': 'long', '_release': 1})
+        self.assertEqual(other, {'JobID': '456', 'Class': 'short'})
+
+        self.assertEqual(cPickle.loads(cPickle.dumps(rec, 2)), rec)
+        decoded = jsonpickle.decode(jsonpickle.encode([rec]))
+        self.assertEqual(decoded, [rec.to_dict()], msg='stored as plain dict in json')
+        self.assertEqual(type(decoded[0]), dict)
+
+    def test_showq_records(self):
+        """Test showq jobs are records, and smaller than dicts"""
+        xml = make_showq_xml(20000)
+        info = Showq({}).parser('gengar', xml)
+        jobs = [j for u in info.values() for h in u.values() for st in h.values() for j in st]
+        self.assertEqual(len(jobs), 40000)
+        self.assertTrue(all([isinstance(j, JobRecord) for j in jobs]))
+
+        dicts = [j.to_dict() for j in jobs]
+        self.assertEqual(jobs, dicts)
+
+        rec_size = sum([sys.getsizeof(j) + sys.getsizeof(j._values) for j in jobs])
+        dict_size = sum([sys.getsizeof(j) for j in dicts])
+        # typically 5x smaller
+        self.assertTrue(rec_size * 3 < dict_size,
+                        msg='records %s bytes, dicts %s bytes in memory' % (rec_size, dict_size))
+
+        # the pickles are about the same size (the dicts pickle the keys by reference too)
+        rec_pickle = len(cPickle.dumps(jobs, 2))
+        dict_pickle = len(cPickle.dumps(dicts, 2))
+        self.assertTrue(rec_pickle <= dict_pickle * 1.1,
+                        msg='pickle of the records %s bytes, of the dicts %s bytes' % (rec_pickle, dict_pickle))
@@ -28,21 +28,57 @@
 """
 
 import glob
+import json
 import os
+import shutil
+import socket
 import sys
 import re
+import tempfile
+import threading
+import time
+from cStringIO import StringIO
 
 import submitfilter
+import submitfilter_client as submitfilter_client_bin
+import submitfilter_daemon
 
 #from vsc.install.shared_setup import REPO_BASE_DIR
 from vsc.install.shared_setup import vsc_setup
 from vsc.install.testing import TestCase
 from vsc.jobs.pbs.submitfilter import SubmitFilter, get_warnings, reset_warnings, MEM_REGEXP
+from vsc.jobs.pbs.submitfilter import _parse_resources_list, pbs_header_regexp
+from vsc.jobs.pbs import clusterdata, submitfilter_client
 from vsc.jobs.pbs.clusterdata import DEFAULT_SERVER_CLUSTER
 from vsc.utils.run import run_simple
 
 REPO_BASE_DIR = vsc_setup().REPO_BASE_DIR
 
+# report the modules imported by submitfilter to filter a trivial script in a fresh python,
+# after the setup of the namespace packages (done by site with an installed vsc-jobs)
+STARTUP_MODULES = """
+import sys
+import vsc.jobs.pbs
+before = set(sys.modules)
+import submitfilter
+from cStringIO import StringIO
+submitfilter.filter_script(['submitfilter'], StringIO('#!/bin/bash\\nhostname\\n'), StringIO(), StringIO())
+print ' '.join(sorted(set(sys.modules) - before))
+"""
+# modules that must not be imported to filter a script
+STARTUP_HEAVY_MODULES = ['copy', 'logging', 'vsc.jobs.pbs.qstat', 'vsc.utils.fancylogger']
+# maximal number of modules imported to filter a script (16 at the time of writing)
+STARTUP_MODULES_BUDGET = 20
+
+
+def process_time(cmd, stdin=None):
+    """Return the wall time of the command"""
+    start = time.time()
+    ec, output = run_simple(cmd, input=stdin)
+    if ec:
+        raise RuntimeError("%s failed: %s" % (cmd, output))
+    return time.time() - start
+
 SCRIPTS = ["""#!/bin/sh
 #
 #
@@ -221,7 +257,20 @@ class TestSubmitfilter(TestCase):
         """Read data from testjobs_submitfilter and feed it through submitfilter script"""
 
         testdir = os.path.join(os.path.dirname(__file__), 'testjobs_submitfilter')
-        for scriptfn in glob.glob("%s/*.script" % testdir):
+
+        # the scripts are installed without .py suffix, and bin is not on the PYTHONPATH
+        bindir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, bindir)
+        bins = []
+        for module in [submitfilter, submitfilter_client_bin]:
+            bin_fn = os.path.join(bindir, os.path.basename(module.__file__).split('.')[0])
+            shutil.copy(os.path.splitext(module.__file__)[0] + '.py', bin_fn)
+            bins.append(bin_fn)
+        pythonpath = [p for p in sys.path if p.startswith(REPO_BASE_DIR)]
+        pythonpath += os.environ.get('PYTHONPATH', '').split(os.pathsep)
+        pythonpath = [p for p in pythonpath if p and os.path.basename(p.rstrip(os.sep)) != 'bin']
+
+        for bin_fn, scriptfn in [(x, y) for x in bins for y in glob.glob("%s/*.script" % testdir)]:
             scriptname = os.path.basename(scriptfn)
             name = '.'.join(scriptname.split('.')[:-1])
 
@@ -232,8 +281,10 @@ class TestSubmitfilter(TestCase):
             cmdline = os.path.join(testdir, "%s.cmdline" % name)
 
             # avoid pyc files in e.g. bin
-            cmd = 'PYTHONPATH=%s:$PYTHONPATH ' % os.pathsep.join([p for p in sys.path if p.startswith(REPO_BASE_DIR)])
-            cmd += "python -B %s" % submitfilter.__file__
+            cmd = 'PYTHONPATH=%s ' % os.pathsep.join(pythonpath)
+            # the client without daemon filters the script itself
+            cmd += '%s=%s ' % (submitfilter_client.SOCKET_ENV, os.path.join(REPO_BASE_DIR, 'no_such_socket'))
+            cmd += "python -B %s" % bin_fn
             if os.path.exists(cmdline):
                 cmd += " " + open(cmdline).readline().strip()
 
@@ -265,6 +316,99 @@ class TestSubmitfilter(TestCase):
 
             self.assertEqual(output, res, msg="expected output for script %s and cmdline %s" % (name, cmd))
 
+    def test_daemon(self):
+        """Filter the scripts with the daemon"""
+        tmpdir = tempfile.mkdtemp()
+        path = os.path.join(tmpdir, 'submitfilter.sock')
+        server = submitfilter_daemon.SubmitFilterServer(path)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+
+        os.environ['VSC_NODE_PARTITION'] = 'mypartition'
+        try:
+            for idx, script in enumerate(SCRIPTS):
+                arguments = ['submitfilter', '-q', 'short'] if idx % 2 else ['submitfilter']
+
+                stdout = StringIO()
+                stderr = StringIO()
+                ec = submitfilter.filter_script(arguments, StringIO(script), stdout, stderr)
+
+                res = submitfilter_client.filter_remote(arguments, script, path=path)
+                self.assertEqual(res, (ec, stdout.getvalue(), stderr.getvalue()), msg='same result for script %s' % idx)
+                self.assertTrue('x=PARTITION:mypartition' in res[1], msg='environment passed to the daemon')
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+            shutil.rmtree(tmpdir)
+
+        self.assertFalse(os.path.exists(path), msg='socket removed')
+        self.assertEqual(submitfilter_client.filter_remote(['submitfilter'], SCRIPTS[1], path=path), None,
+                         msg='no result without daemon')
+
+    def test_daemon_warm_up(self):
+        """The daemon loads the cluster data and fills the caches before forking"""
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'submitfilter.sock')
+
+        clusterdata.clear_caches()
+        server = submitfilter_daemon.SubmitFilterServer(path)
+        try:
+            self.assertTrue(clusterdata._registry is server.registry, msg='registry loaded in the parent')
+            self.assertEqual(sorted(server.registry._records), sorted(server.registry.clusterdata))
+            self.assertTrue(pbs_header_regexp.cache_info()['size'] > 0)
+            self.assertTrue(_parse_resources_list.cache_info()['size'] > 0)
+            self.assertEqual(get_warnings(), [], msg='no warnings left by the warm up')
+        finally:
+            server.server_close()
+
+    def test_daemon_deadline(self):
+        """A client that does not send its request gets an error after the deadline"""
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'submitfilter.sock')
+        deadline = submitfilter_daemon.REQUEST_DEADLINE
+        submitfilter_daemon.REQUEST_DEADLINE = 1
+        server = submitfilter_daemon.SubmitFilterServer(path)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            client.settimeout(10)
+            client.connect(path)
+            client.sendall('{"arguments": ')
+            reply = json.loads(client.makefile().readline())
+        finally:
+            client.close()
+            server.shutdown()
+            server.server_close()
+            thread.join()
+            submitfilter_daemon.REQUEST_DEADLINE = deadline
+
+        self.assertTrue('No complete request after 1 seconds' in reply['error'], msg='deadline error %s' % reply)
+
+    def test_startup(self):
+        """Benchmark the startup of submitfilter"""
+        env = 'PYTHONPATH=%s:$PYTHONPATH ' % os.pathsep.join([p for p in sys.path if p.startswith(REPO_BASE_DIR)])
+        cmd = env + 'python -B -'
+
+        ec, output = run_simple(cmd, input=STARTUP_MODULES)
+        self.assertEqual(ec, 0, msg="startup modules ran: %s" % output)
+        modules = output.strip().splitlines()[-1].split()
+        self.assertTrue('submitfilter' in modules)
+        for module in STARTUP_HEAVY_MODULES:
+            self.assertFalse(module in modules, msg='%s not imported by submitfilter' % module)
+        self.assertTrue(len(modules) <= STARTUP_MODULES_BUDGET,
+                        msg='%s modules imported by submitfilter: %s' % (len(modules), modules))
+
+        # the process filtering a script takes at most twice the time of a python process that does nothing
+        baseline = min([process_time(env + 'python -B -c pass') for _ in range(3)])
+        startup = min([process_time(cmd, STARTUP_MODULES) for _ in range(3)])
+        self.assertTrue(startup < 2 * baseline,
+                        msg='submitfilter process %.3f s vs python -c pass %.3f s' % (startup, baseline))
+
     def test_mem_regex(self):
         """
         See if the regex matches properly
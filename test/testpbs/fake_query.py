@@ -0,0 +1,97 @@
+#
+# Copyright 2017 Ghent University
+#
+# This file is part of vsc-jobs,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://www.vscentrum.be),
+# the Flemish Research Foundation (FWO) (http://www.fwo.be/en)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# https://github.com/hpcugent/vsc-jobs
+#
+# vsc-jobs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Library General Public License as
+# published by the Free Software Foundation, either version 2 of
+# the License, or (at your option) any later version.
+#
+# vsc-jobs is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public License
+# along with vsc-jobs. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Fake PBSQuery jobs, nodes and query for the pbs tests, with the data of the master3 dump
+"""
+import copy
+import os
+
+DUMP = os.path.join(os.path.dirname(__file__), 'master3_dump_20130316.py')
+
+
+class JobData(dict):
+    """Mocked job class to mimick PBSQuery job"""
+
+    def get_nodes(self):
+        return [x for y in self.get('exec_host', []) for x in y.split('+')]
+
+
+class NodeData(dict):
+    """Mocked node class to mimick PBSQuery node"""
+
+    def get_jobs(self):
+        return self.get('jobs', [])
+
+
+class FakeQuery(object):
+    """
+    Mocked query class with the data of the master3 dump
+
+    Keeps the order of the calls, the attrib_list of the last call per part and the number of fetched jobs.
+    The jobs have an mtime, and can be modified with touch.
+    """
+
+    def __init__(self):
+        self.data = {}
+        execfile(DUMP, self.data)
+        for idx, jobid in enumerate(sorted(self.jobs.keys())):
+            self.jobs[jobid]['mtime'] = [str(1363400000 + idx)]
+
+        self.calls = []
+        self.attribs = {}
+        self.fetched = 0
+
+    @property
+    def jobs(self):
+        """The job data (can be modified)"""
+        return self.data['jobs']
+
+    def touch(self, jobid):
+        """Modify the job"""
+        self.jobs[jobid]['mtime'] = [str(int(self.jobs[jobid]['mtime'][0]) + 1)]
+        self.jobs[jobid]['job_state'] = ['C']
+
+    def getjobs(self, attrib_list=None):
+        self.calls.append('jobs')
+        self.attribs['jobs'] = attrib_list
+        if attrib_list == ['mtime']:
+            return dict([(jobid, JobData(mtime=jobdata['mtime'])) for jobid, jobdata in self.jobs.items()])
+        self.fetched += len(self.jobs)
+        return dict([(jobid, JobData(copy.deepcopy(jobdata))) for jobid, jobdata in self.jobs.items()])
+
+    def getjob(self, name, attrib_list=None):
+        self.fetched += 1
+        return JobData(copy.deepcopy(self.jobs.get(name, {})))
+
+    def getnodes(self, attrib_list=None):
+        self.calls.append('nodes')
+        self.attribs['nodes'] = attrib_list
+        return dict([(name, NodeData(copy.deepcopy(value))) for name, value in self.data['nodes'].items()])
+
+    def getqueues(self, attrib_list=None):
+        self.calls.append('queues')
+        self.attribs['queues'] = attrib_list
+        return self.data['queues']